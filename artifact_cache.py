@@ -0,0 +1,299 @@
+"""
+Cache of installed library files keyed by everything that affects the build
+"""
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import tempfile
+from plumbum import local
+from file_utils import file_lock
+
+
+def artifact_key(library_obj, library_fingerprint: str) -> str:
+    """
+    Hash of the library fingerprint and the configuration left by its
+    pre_configure hook, regardless of where the source was extracted
+
+    Parameters
+    ----------
+    library_obj: Library
+        Library after its pre_configure hook
+    library_fingerprint: str
+        Fingerprint of the library inputs
+
+    Returns
+    -------
+    str
+    """
+    data = {
+        "fingerprint": library_fingerprint,
+        "configure_params": [
+            param.replace(library_obj.source_dir, "<source_dir>")
+            for param in library_obj.configure_params
+        ],
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def snapshot(root: str) -> Dict[str, tuple]:
+    """
+    Return state of every file under root
+
+    Parameters
+    ----------
+    root: str
+        Directory
+
+    Returns
+    -------
+    Dict[str, tuple]
+        Relative path to (size, mtime, inode)
+    """
+    result = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_links = [_ for _ in dir_names if os.path.islink(os.path.join(dir_path, _))]
+        for name in file_names + dir_links:
+            path = os.path.join(dir_path, name)
+            stat = os.lstat(path)
+            result[os.path.relpath(path, root)] = (
+                stat.st_size,
+                stat.st_mtime_ns,
+                stat.st_ino,
+            )
+    return result
+
+
+def copy_files(src_root: str, dest_root: str, files: List[str]) -> None:
+    """
+    Copy files keeping symlinks and modes
+
+    Parameters
+    ----------
+    src_root: str
+        Source directory
+    dest_root: str
+        Destination directory
+    files: List[str]
+        Paths relative to both directories
+    """
+    for rel_path in files:
+        src = os.path.join(src_root, rel_path)
+        dest = os.path.join(dest_root, rel_path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        if os.path.islink(src):
+            os.symlink(os.readlink(src), dest)
+        else:
+            shutil.copy2(src, dest)
+
+
+class InstallRecorder:
+    """
+    Record the files a library installs into the release directory
+
+    The install runs staged through DESTDIR, so every installed file is
+    recorded, including the ones an install skips as up to date (cmake
+    keeps their timestamps). Changes made in place, by hooks or installs
+    ignoring DESTDIR, are found by comparing snapshots of the release
+    directory. It is locked while recording, so files installed by
+    libraries built in parallel are never attributed to the wrong one.
+    """
+
+    def __init__(self, release_dir: str, lock_path: str):
+        self.__release_dir = release_dir
+        self.__lock_path = lock_path
+        self.__staged: List[str] = []
+        self.files: List[str] = []
+
+    @contextmanager
+    def record(self) -> Iterator["InstallRecorder"]:
+        """
+        Record the files changed while the context is active
+
+        Yields
+        ------
+        InstallRecorder
+        """
+        self.__staged = []
+        with file_lock(self.__lock_path):
+            before = snapshot(self.__release_dir)
+            yield self
+            after = snapshot(self.__release_dir)
+        self.files = sorted(
+            {path for path, state in after.items() if before.get(path) != state}
+            | set(self.__staged)
+        )
+
+    @contextmanager
+    def staged(self) -> Iterator[None]:
+        """
+        Install with DESTDIR set to a staging directory while the context is
+        active, then move the staged files into the release directory
+
+        Only the install command may run in the context, DESTDIR would
+        leak into configure and compile.
+
+        Yields
+        ------
+        None
+        """
+        stage = tempfile.mkdtemp(
+            dir=os.path.dirname(self.__lock_path), prefix=".install-"
+        )
+        release_dir = os.path.abspath(self.__release_dir)
+        # DESTDIR is prepended to the prefix without its drive
+        staged_release = os.path.join(
+            stage, os.path.splitdrive(release_dir)[1].lstrip("\\/")
+        )
+        try:
+            with local.env(DESTDIR=stage):
+                yield
+            files = sorted(snapshot(staged_release))
+            outside = len(snapshot(stage)) - len(files)
+            if outside:
+                print(f"Skipping {outside} files installed outside {release_dir}")
+            copy_files(staged_release, release_dir, files)
+        finally:
+            shutil.rmtree(stage, ignore_errors=True)
+        self.__staged += files
+
+
+class ArtifactCache:
+    """
+    Installed files of built libraries, evicted least recently used first
+    once the cache grows over its size budget
+    """
+
+    def __init__(self, cache_dir: str, max_size: int):
+        # Created by the first store, looking up artifacts writes nothing
+        self.__root = os.path.join(cache_dir, "artifacts")
+        self.__max_size = max_size
+
+    def __entry(self, key: str) -> str:
+        return os.path.join(self.__root, key)
+
+    def contains(self, key: str) -> bool:
+        """
+        Parameters
+        ----------
+        key: str
+            Artifact key
+
+        Returns
+        -------
+        bool
+            Return True if the artifact is cached
+        """
+        return os.path.isfile(os.path.join(self.__entry(key), "manifest.json"))
+
+    def restore(self, key: str, release_dir: str) -> bool:
+        """
+        Copy cached files into the release directory
+
+        Parameters
+        ----------
+        key: str
+            Artifact key
+        release_dir: str
+            Release directory
+
+        Returns
+        -------
+        bool
+            Return True if the artifact was cached
+        """
+        entry = self.__entry(key)
+        if not self.contains(key):
+            return False
+        # Not evicted while it is copied
+        with file_lock(os.path.join(self.__root, ".lock")):
+            try:
+                with open(
+                    os.path.join(entry, "manifest.json"), encoding="utf-8"
+                ) as file:
+                    manifest = json.load(file)
+            except (FileNotFoundError, ValueError):
+                return False
+            copy_files(os.path.join(entry, "files"), release_dir, manifest["files"])
+            os.utime(entry)
+        return True
+
+    def store(self, key: str, release_dir: str, files: List[str]) -> None:
+        """
+        Copy installed files into the cache
+
+        Parameters
+        ----------
+        key: str
+            Artifact key
+        release_dir: str
+            Release directory
+        files: List[str]
+            Installed files relative to the release directory
+        """
+        if os.path.isdir(self.__entry(key)):
+            os.utime(self.__entry(key))
+            return
+        os.makedirs(self.__root, exist_ok=True)
+        tmp_entry = tempfile.mkdtemp(dir=self.__root, prefix=".tmp-")
+        copy_files(release_dir, os.path.join(tmp_entry, "files"), files)
+        size = sum(
+            os.lstat(os.path.join(release_dir, rel_path)).st_size for rel_path in files
+        )
+        with open(os.path.join(tmp_entry, "manifest.json"), "w", encoding="utf-8") as file:
+            json.dump({"files": files, "size": size}, file)
+        try:
+            os.rename(tmp_entry, self.__entry(key))
+        except OSError:
+            # Stored by a concurrent build in the meantime
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict()
+
+    def entries(self) -> List[tuple]:
+        """
+        Return cached artifacts, least recently used first
+
+        Returns
+        -------
+        List[tuple]
+            (last use timestamp, size, key)
+        """
+        result = []
+        if not os.path.isdir(self.__root):
+            return result
+        for key in os.listdir(self.__root):
+            if key.startswith("."):
+                continue
+            entry = self.__entry(key)
+            try:
+                with open(os.path.join(entry, "manifest.json"), encoding="utf-8") as file:
+                    size = json.load(file)["size"]
+                result.append((os.stat(entry).st_mtime, size, key))
+            except (OSError, ValueError, KeyError):
+                continue
+        return sorted(result)
+
+    def evict(self, max_size: Optional[int] = None) -> None:
+        """
+        Remove least recently used artifacts until the cache fits its budget
+
+        Parameters
+        ----------
+        max_size: Optional[int]
+            Size budget, default is the one of the cache
+        """
+        max_size = self.__max_size if max_size is None else max_size
+        os.makedirs(self.__root, exist_ok=True)
+        with file_lock(os.path.join(self.__root, ".lock")):
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= max_size:
+                    break
+                shutil.rmtree(self.__entry(key), ignore_errors=True)
+                total -= size
@@ -0,0 +1,281 @@
+"""
+Autoconf cache shared by the configure scripts of every library built with
+the same toolchain and flags
+"""
+from typing import Dict, List, Optional
+import hashlib
+import json
+import logging
+import os
+import os.path
+import re
+from file_utils import file_lock, write_atomic
+from fingerprint import tool_id
+
+logger = logging.getLogger(__name__)
+
+# Environment making a different cache
+KEY_ENV = ("CC", "CXX", "CPP", "CFLAGS", "CXXFLAGS", "CPPFLAGS", "LDFLAGS", "LIBS")
+CACHE_LINE = re.compile(r"^([A-Za-z0-9_]*_cv_[A-Za-z0-9_]*)=\$\{\1=(.*)\}$")
+# Precious variables, configure fails if they differ from the cached ones
+PRIVATE_PREFIXES = ("ac_cv_env_", "pkg_cv_")
+# Probes which may succeed once another library is installed
+PROBE_PREFIXES = (
+    "ac_cv_header_",
+    "ac_cv_lib_",
+    "ac_cv_search_",
+    "ac_cv_func_",
+    "ac_cv_have_",
+    "ac_cv_type_",
+    "ac_cv_member_",
+)
+
+_ACTIVE: Optional["ConfigCache"] = None
+
+
+def cache_name(path: str) -> str:
+    """
+    Return the part of a cache variable autoconf derives from a header or
+    library name
+
+    Parameters
+    ----------
+    path: str
+        e.g. freetype2/ft2build.h
+
+    Returns
+    -------
+    str
+        e.g. freetype2_ft2build_h
+    """
+    return re.sub(r"[^A-Za-z0-9]", "_", path)
+
+
+def is_autoconf_script(path: str) -> bool:
+    """
+    Check if a configure script was generated by autoconf, the hand written
+    ones (FFmpeg, x264, libvpx) don't know --cache-file
+
+    Parameters
+    ----------
+    path: str
+        configure script
+
+    Returns
+    -------
+    bool
+    """
+    try:
+        with open(path, encoding="utf-8", errors="replace") as file:
+            head = file.read(4096)
+    except OSError:
+        return False
+    return "Generated by GNU Autoconf" in head
+
+
+class ConfigCache:
+    """
+    config.cache shared between the libraries
+
+    Every configure gets a private copy, the new results are merged back
+    under a lock. Results that change once other libraries are installed
+    (probes of the release prefix and failed probes) are never shared.
+    Libraries whose configure failed with the cache are remembered and
+    configured without it.
+    """
+
+    def __init__(self, cache_dir: str, env: Dict[str, str], release_dir: str):
+        data = {
+            "env": {name: env.get(name, "") for name in KEY_ENV},
+            "toolchain": [
+                tool_id((env.get(name) or default).split()[0])
+                for name, default in (("CC", "cc"), ("CXX", "c++"))
+            ],
+            "release_dir": release_dir,
+        }
+        key = hashlib.sha256(
+            json.dumps(data, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        cache_dir = os.path.join(cache_dir, "autoconf")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__path = os.path.join(cache_dir, f"{key}.cache")
+        self.__skip_path = os.path.join(cache_dir, f"{key}.skip.json")
+        self.__lock = os.path.join(cache_dir, f"{key}.lock")
+        self.__release_dir = release_dir
+        self.__library = ""
+
+    @property
+    def path(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Shared cache file
+        """
+        return self.__path
+
+    def start(self, lib_name: str) -> None:
+        """
+        Use the cache for a library
+
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+        """
+        self.__library = lib_name
+
+    @staticmethod
+    def __read(path: str) -> Dict[str, str]:
+        """
+        Return cache lines per variable
+        """
+        entries = {}
+        try:
+            with open(path, encoding="utf-8", errors="surrogateescape") as file:
+                for line in file:
+                    match = CACHE_LINE.match(line.rstrip("\n"))
+                    if match is not None:
+                        entries[match.group(1)] = line.rstrip("\n")
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def __skipped(self) -> List[str]:
+        """
+        Return libraries configured without the cache
+        """
+        try:
+            with open(self.__skip_path, encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return []
+
+    def checkout(self, configure_script: str = "configure") -> Optional[str]:
+        """
+        Copy the shared cache next to the configure script
+
+        Parameters
+        ----------
+        configure_script: str (default "configure")
+            Script about to run
+
+        Returns
+        -------
+        Optional[str]
+            Cache file to pass to --cache-file, None if the script doesn't
+            take one or the library failed with the cache before
+        """
+        if not is_autoconf_script(configure_script):
+            return None
+        if self.__library in self.__skipped():
+            return None
+        with file_lock(self.__lock):
+            entries = self.__read(self.__path)
+        cache_file = os.path.join(
+            os.path.dirname(os.path.abspath(configure_script)), "config.cache"
+        )
+        write_atomic(cache_file, "".join(f"{_}\n" for _ in entries.values()))
+        logger.debug("%d cached autoconf results for %s", len(entries), self.__library)
+        return cache_file
+
+    def __release_names(self) -> Dict[str, List[str]]:
+        """
+        Return cache names of the headers and libraries of the release
+        prefix
+        """
+        headers = []
+        include_dir = os.path.join(self.__release_dir, "include")
+        for root, _, files in os.walk(include_dir):
+            for name in files:
+                path = os.path.relpath(os.path.join(root, name), include_dir)
+                # Checked by name alone too when the subdir is in CFLAGS
+                headers += [cache_name(path), cache_name(name)]
+        libraries = []
+        try:
+            for name in os.listdir(os.path.join(self.__release_dir, "lib")):
+                match = re.match(r"lib(.+?)\.(a|so|dylib|la)", name)
+                if match is not None:
+                    libraries.append(cache_name(match.group(1)))
+        except OSError:
+            pass
+        return {"headers": headers, "libraries": libraries}
+
+    def __shareable(self, name: str, line: str, release: Dict[str, List[str]]) -> bool:
+        """
+        Check if a result stays true for every library
+        """
+        value = line.split("=", 2)[-1][:-1].strip("'\"")
+        if name.startswith(PRIVATE_PREFIXES) or os.getcwd() in line:
+            return False
+        if name.startswith(PROBE_PREFIXES) and value in ("no", ""):
+            return False
+        if name.startswith("ac_cv_header_"):
+            return name[len("ac_cv_header_") :] not in release["headers"]
+        if name.startswith("ac_cv_lib_"):
+            return not any(
+                name.startswith(f"ac_cv_lib_{_}_") for _ in release["libraries"]
+            )
+        if name.startswith("ac_cv_search_"):
+            return not any(f"-l{_}" in value.split() for _ in release["libraries"])
+        return True
+
+    def merge(self, cache_file: str) -> None:
+        """
+        Add the new results of a successful configure to the shared cache
+
+        Parameters
+        ----------
+        cache_file: str
+            Cache written by configure
+        """
+        results = self.__read(cache_file)
+        release = self.__release_names()
+        with file_lock(self.__lock):
+            entries = self.__read(self.__path)
+            added = {
+                name: line
+                for name, line in results.items()
+                if name not in entries and self.__shareable(name, line, release)
+            }
+            if added:
+                entries.update(added)
+                write_atomic(
+                    self.__path,
+                    "".join(f"{entries[_]}\n" for _ in sorted(entries)),
+                )
+        logger.debug("%d autoconf results shared by %s", len(added), self.__library)
+
+    def failed(self) -> None:
+        """
+        Configure the current library without the cache from now on
+        """
+        with file_lock(self.__lock):
+            skipped = self.__skipped()
+            if self.__library not in skipped:
+                write_atomic(
+                    self.__skip_path, json.dumps(sorted([*skipped, self.__library]))
+                )
+
+
+def activate(cache: Optional[ConfigCache]) -> None:
+    """
+    Set autoconf cache used by build_utils
+
+    Parameters
+    ----------
+    cache: Optional[ConfigCache]
+        Autoconf cache or None to disable it
+    """
+    global _ACTIVE  # pylint: disable=global-statement
+    _ACTIVE = cache
+
+
+def active() -> Optional[ConfigCache]:
+    """
+    Returns
+    -------
+    Optional[ConfigCache]
+        Autoconf cache used by build_utils
+    """
+    return _ACTIVE
@@ -1,43 +1,10 @@
 # pylint: disable=invalid-name, line-too-long, missing-module-docstring
 from argparse import ArgumentParser
-from typing import Optional, Iterable
-from time import sleep
-from zipfile import ZipFile
 import os.path
-import platform
-import shlex
 import sys
-from file_utils import mkdir, remove
-from library_manager import LibraryManager
-from options import Options
-
-try:
-    from build_utils import (
-        add_path,
-        cmake,
-        command_exists,
-        run_fg,
-        make,
-        make_install,
-        ninja,
-        require_commands,
-        path_fixer,
-        configure,
-        meson,
-    )
-    from plumbum import local
-except ModuleNotFoundError:
-    print("Install required module with `pip install -r requirements.txt`")
-    sys.exit(1)
-
-
-# Set up constants
-DOWNLOAD_RETRY_DELAY = 3
-DOWNLOAD_RETRY_ATTEMPTS = 3
-
-# Pseudographics
-BOLD_SEPARATOR = "======================================="
-ITALIC_SEPARATOR = "---------------------------------------"
+from console import print_block, print_header
+from file_utils import parse_size, remove
+from options import COMPILER_LAUNCHERS, PROFILES, Options
 
 
 def clean_all(release_dir: str, target_dir: str) -> None:
@@ -61,350 +28,6 @@ def clean_all(release_dir: str, target_dir: str) -> None:
     print("Cleaning finished")
 
 
-def lookahead(iterable: Iterable) -> tuple:
-    """
-    Lookahead function
-
-    Parameters
-    ----------
-    iterable: Iterable
-        Iterable value
-
-    Returns
-    -------
-    tuple
-    """
-    it = iter(iterable)
-    for value in it:
-        try:
-            yield value, next(it)
-        except StopIteration:
-            yield value, False
-
-
-def print_lines(*strings) -> None:
-    """
-    Print strings line by line
-
-    Parameters
-    ----------
-    *strings
-        List of string
-
-    Returns
-    -------
-    None
-    """
-    to_print = ""
-    for line, has_more in lookahead(strings):
-        to_print = to_print + line + ("\n" if has_more else "")
-    print(to_print)
-
-
-def print_header(*strings) -> None:
-    """
-    Print strings with italic separator and line by line
-
-    Parameters
-    ----------
-    *strings
-        List of string
-
-    Returns
-    -------
-    None
-    """
-    to_print = strings + (ITALIC_SEPARATOR,)
-    print_lines(*to_print)
-
-
-def print_block(*strings) -> None:
-    """
-    Print strings with bold separator and line by line
-
-    Parameters
-    ----------
-    *strings
-        List of string
-
-    Returns
-    -------
-    None
-    """
-    to_print = strings + (BOLD_SEPARATOR,)
-    print_lines(*to_print)
-    print()
-
-
-class Builder:
-    """
-    Class to build ffmpeg
-    """
-
-    def __init__(self, options: Options):
-        self._options = options
-        self._old_ldflags = None
-        self.__dir_data = {
-            "target_dir": path_fixer(options.target_dir),
-            "release_dir": path_fixer(options.release_dir),
-            "bin_dir": path_fixer(os.path.join(options.release_dir, options.bin_dir)),
-            "pkg_config_path": path_fixer(
-                os.path.join(options.release_dir, "lib", "pkgconfig")
-            ),
-        }
-
-        self.__library_mgr = LibraryManager()
-        self.__library_mgr.init(options)
-
-        ffmpeg_obj = self.__library_mgr.get_library("ffmpeg")
-        if self.is_mac:
-            ffmpeg_obj.add_configuration_params("--enable-videotoolbox")
-        ffmpeg_obj.add_configuration_params(*shlex.split(options.extra_ffmpeg_args))
-        if options.extra_libs:
-            ffmpeg_obj.add_configuration_params(f"--extra-libs={options.extra_libs}")
-
-    @property
-    def target_dir(self) -> str:
-        """
-        Returns
-        -------
-        str
-            Return target dir
-        """
-        return self.__dir_data["target_dir"]
-
-    @property
-    def release_dir(self) -> str:
-        """
-        Returns
-        -------
-        str
-            Return release dir
-        """
-        return self.__dir_data["release_dir"]
-
-    @property
-    def bin_dir(self) -> str:
-        """
-        Returns
-        -------
-        str
-            Return binary dir
-        """
-        return self.__dir_data["bin_dir"]
-
-    @property
-    def pkg_config_path(self) -> str:
-        """
-        Returns
-        -------
-        str
-            Return pkg config path
-        """
-        return self.__dir_data["pkg_config_path"]
-
-    @property
-    def is_windows(self) -> bool:
-        """
-        Returns
-        -------
-        bool
-        """
-        return platform.system() == "Windows"
-
-    @property
-    def is_linux(self) -> bool:
-        """
-        Returns
-        -------
-        bool
-        """
-        return platform.system() == "Linux"
-
-    @property
-    def is_mac(self) -> bool:
-        """
-        Returns
-        -------
-        bool
-        """
-        return platform.system() == "Darwin"
-
-    def __configuration_wrapper(self, lib_name: str):
-        """
-        Handle the library configuration
-
-        Parameters
-        ----------
-        lib_name : str
-            Library name
-        """
-        library_obj = self.__library_mgr.get_library(lib_name)
-        if library_obj.has_own_configuration:
-            library_obj.custom_configure()
-            return
-        if library_obj.configuration == "meson":
-            meson(
-                self.release_dir,
-                *library_obj.configure_params,
-                silent=self._options.silent,
-            )
-            library_obj.post_configure()
-            ninja(self._options.threads, silent=self._options.silent)
-            return
-        if library_obj.configuration == "configure":
-            configure(
-                self.release_dir,
-                *library_obj.configure_params,
-                silent=self._options.silent,
-            )
-        elif library_obj.configuration == "cmake":
-            cmake(
-                self.release_dir,
-                *library_obj.configure_params,
-                silent=self._options.silent,
-            )
-        library_obj.post_configure()
-        make(self._options.threads, silent=self._options.silent)
-        make_install(silent=self._options.silent)
-
-    def __build_library(self, lib_name: str, is_dependency=False) -> None:
-        """
-        This function will handle the build process
-
-        Parameters
-        ----------
-        lib_name: str
-            Library name
-        is_dependency: bool (default False)
-            If the library is needed by other library
-        silent: bool (default False)
-            Verbose or not
-
-        Returns
-        -------
-        None
-        """
-        library_obj = self.__library_mgr.get_library(lib_name)
-        if not library_obj.is_needed() and not is_dependency:
-            return
-        library_obj.pre_dependency()
-        if library_obj.dependencies:
-            for dependency in library_obj.dependencies:
-                if not self.__library_mgr.get_library(dependency).is_already_build():
-                    self.__build_library(dependency, is_dependency=True)
-
-        self.download(*library_obj.download_params)  # pylint: disable = E1120
-        lib_build_dir = os.path.join(self.target_dir, library_obj.folder_name)
-        if not os.path.isdir(lib_build_dir):
-            mkdir(lib_build_dir)
-        with local.cwd(lib_build_dir):
-            library_obj.pre_configure()
-            self.__configuration_wrapper(lib_name)
-        library_obj.post_install()
-        library_obj.mark_as_built()
-
-    def build(self) -> None:
-        """
-        Function to start building
-
-        Parameters
-        ----------
-        slavery_mode: bool (default False)
-            Is slavery mode
-        build_static_ffmpeg: bool (default False)
-            Is build static ffmpeg
-
-        Returns
-        -------
-        None
-        """
-        extra_cflags = f"-I{self.release_dir}/include {self._options.extra_cflags}"
-        extra_ldflags = f"-L{self.release_dir}/lib {self._options.extra_ldflags}"
-
-        print_header("Building process started")
-        mkdir(self.target_dir)
-        mkdir(self.release_dir)
-        add_path(self.bin_dir)
-
-        with local.env(
-            CFLAGS=f"{local.env.get('CFLAGS', '')} {extra_cflags}",
-            LDFLAGS=f"{local.env.get('LDFLAGS', '')} {extra_ldflags}",
-            PKG_CONFIG_LIBDIR=f"{self.release_dir}/lib/pkgconfig",
-        ):
-            for library in self._options.targets:
-                self.__build_library(library)
-
-        print_block()
-        print_block(
-            f"Finished: {self.release_dir}/bin/ffmpeg",
-            "You can check correctness of this build by running: "
-            f"{self.release_dir}/bin/ffmpeg -version",
-            "Study the protocols list carefully (e.g, look for rtmps): "
-            f"{self.release_dir}/bin/ffmpeg -protocols",
-            "Enable it temporary in the command line by running: "
-            f"export PATH={self.release_dir}/bin:$PATH",
-        )
-
-    def download(self, url: str, dest_name: str, alternative_dir: Optional[str] = None):
-        """
-        Function to download file
-
-        Parameters
-        ----------
-        url: str
-            Download url
-        dest_name: str
-            File name
-        alternative_dir: Optional[str]
-            Custom dir name when extract
-        """
-        download_path = self.target_dir
-
-        if alternative_dir is not None:
-            download_path = os.path.join(download_path, alternative_dir)
-            mkdir(download_path)
-
-        base_path = os.path.join(download_path, dest_name)
-        if os.path.exists(base_path):
-            print(f"Source file already downloaded: {url}")
-            return
-
-        print(f"Downloading {url}")
-        successful_download = False
-        for _ in range(DOWNLOAD_RETRY_ATTEMPTS):
-            if run_fg("curl", "--insecure", "-L", "--silent", "-o", base_path, url):
-                successful_download = True
-                break
-            print(
-                f"Downloading failed: {url}. Retrying in {DOWNLOAD_RETRY_DELAY} seconds"
-            )
-            sleep(DOWNLOAD_RETRY_DELAY)
-
-        if not successful_download:
-            print(f"Failed to download multiple times: {url}")
-            sys.exit(1)
-        print(f"Successfuly downloaded: {url}")
-
-        if ".tar" in dest_name:
-            if run_fg(
-                "tar",
-                "-xvf",
-                path_fixer(base_path),
-                "-C",
-                path_fixer(download_path),
-                silent=True,
-            ):
-                return
-            print(f"Failed to extract {dest_name}")
-            sys.exit(1)
-        elif ".zip" in dest_name:
-            with ZipFile(base_path) as myzip:
-                myzip.extractall(download_path)
-            return
-        raise Exception
-
-
 def main() -> None:
     """
     Program Entry Point
@@ -420,9 +43,179 @@ def main() -> None:
         help="Number of parallel jobs",
         default=1,
     )
+    parser.add_argument(
+        "-l",
+        "--parallel-builds",
+        metavar="int",
+        action="store",
+        dest="parallel_builds",
+        type=int,
+        help="Number of libraries built at the same time",
+        default=1,
+    )
+    parser.add_argument(
+        "--memory-limit",
+        metavar="size",
+        dest="memory_limit",
+        type=parse_size,
+        help="Memory shared by parallel builds, K/M/G suffixes allowed (default: 90%% of the available memory)",
+        default=0,
+    )
+    parser.add_argument(
+        "--memory-pressure-limit",
+        metavar="percent",
+        dest="memory_pressure_limit",
+        type=float,
+        help="Don't start builds while tasks stall on memory this share of the time (Linux PSI, default 10)",
+        default=10.0,
+    )
+    parser.add_argument(
+        "--prefetch-workers",
+        metavar="int",
+        dest="prefetch_workers",
+        type=int,
+        help="Number of sources downloaded in the background at the same time (0 = disable)",
+        default=4,
+    )
+    parser.add_argument(
+        "--download-rate-limit",
+        metavar="size",
+        dest="download_rate_limit",
+        type=parse_size,
+        help="Total download bandwidth in bytes per second, K/M/G suffixes allowed (0 = unlimited)",
+        default=0,
+    )
+    parser.add_argument(
+        "--insecure-downloads",
+        dest="verify_downloads",
+        action="store_false",
+        help="Don't verify TLS certificates of the download servers",
+        default=True,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="dir",
+        dest="cache_dir",
+        help="Cache directory shared by every build (default: ~/.cache/ffmpeg-builder)",
+        default="",
+    )
+    parser.add_argument(
+        "--no-source-cache",
+        dest="source_cache",
+        action="store_false",
+        help="Don't keep downloaded sources in the shared cache",
+        default=True,
+    )
+    parser.add_argument(
+        "--no-artifact-cache",
+        dest="artifact_cache",
+        action="store_false",
+        help="Always build libraries instead of restoring them from the shared cache",
+        default=True,
+    )
+    parser.add_argument(
+        "--artifact-cache-size",
+        metavar="size",
+        dest="artifact_cache_size",
+        type=parse_size,
+        help="Size budget of the artifact cache, K/M/G suffixes allowed (default 10G)",
+        default="10G",
+    )
+    parser.add_argument(
+        "--compiler-launcher",
+        dest="compiler_launcher",
+        choices=COMPILER_LAUNCHERS,
+        help="Compile through ccache or sccache, cached in the cache dir",
+        default="",
+    )
+    parser.add_argument(
+        "--config-cache",
+        dest="config_cache",
+        action="store_true",
+        help="Share autoconf results between the configure scripts, in the cache dir",
+        default=False,
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        choices=PROFILES,
+        help="fast skips the tests, examples, programs and docs of the libraries and their dependency tracking",
+        default="default",
+    )
+    parser.add_argument(
+        "--pgo",
+        dest="pgo",
+        action="store_true",
+        help="Build ffmpeg instrumented, train it on lavfi test sources, then build it again with the profile, kept in the cache dir",
+        default=False,
+    )
+    parser.add_argument(
+        "--lto",
+        dest="lto",
+        action="store_true",
+        help="Link-time optimise the libraries and ffmpeg, then report the size and speed of ffmpeg against the last build without it",
+        default=False,
+    )
+    parser.add_argument(
+        "--march-variants",
+        metavar="march,...",
+        dest="march_variants",
+        help="Comma-separated -march values (e.g. x86-64-v2,x86-64-v3,x86-64-v4), ffmpeg and the codec libraries are built once per value with a launcher running the best one for the CPU",
+        default="",
+    )
+    parser.add_argument(
+        "--pgo-workload",
+        metavar="file",
+        dest="pgo_workload",
+        help="JSON list of ffmpeg argument lists to train on instead of encoding and decoding with every encoder, {dir} is a scratch dir",
+        default="",
+    )
+    parser.add_argument(
+        "--build-in-ram",
+        metavar="dir",
+        dest="ram_dir",
+        nargs="?",
+        const="/dev/shm",
+        help="Extract and build the libraries in a RAM-backed dir (default /dev/shm), falling back to the target dir when full",
+        default="",
+    )
+    parser.add_argument(
+        "--ram-budget",
+        metavar="size",
+        dest="ram_budget",
+        type=parse_size,
+        help="Space the libraries may take in the RAM dir, K/M/G suffixes allowed (default: 25%% of the available memory)",
+        default=0,
+    )
+    parser.add_argument(
+        "--no-jobserver",
+        dest="jobserver",
+        action="store_false",
+        help="Don't share the --jobs limit between concurrent make/ninja builds",
+        default=True,
+    )
     parser.add_argument(
         "-b", "--build", action="store_true", dest="build_mode", help="Run build"
     )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        dest="plan_mode",
+        help="Print the predicted build schedule and critical path instead of building",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        dest="dry_run_mode",
+        help="Print the build graph, the commands and what needs downloading or building, without running anything",
+    )
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=("text", "json"),
+        help="Output format of --dry-run",
+        default="text",
+    )
     parser.add_argument(
         "-c",
         "--clean",
@@ -437,6 +230,21 @@ def main() -> None:
         dest="silent_mode",
         help="Disable build debug",
     )
+    parser.add_argument(
+        "--compress-logs",
+        dest="compress_logs",
+        action="store_true",
+        help="Gzip the build logs in <target dir>/logs",
+        default=False,
+    )
+    parser.add_argument(
+        "--log-tail-lines",
+        metavar="int",
+        dest="log_tail_lines",
+        type=int,
+        help="Lines of the log shown when a quiet command fails (default 50)",
+        default=50,
+    )
     parser.add_argument(
         "--targets",
         action="store",
@@ -586,30 +394,42 @@ def main() -> None:
     if args.disable_ffplay and "libsdl" in targets:
         targets.remove("libsdl")
 
-    if any(_ in targets for _ in ("libopenh264", "libdav1d")):
-        if not (bool(command_exists("meson") and command_exists("ninja"))):
-            print(
-                "In order to build libopenh264 or libdav1d, you must install meson and ninja in your system"
-            )
-            sys.exit(1)
+    if args.ram_dir and not os.path.isdir(args.ram_dir):
+        print(f"RAM build directory {args.ram_dir} doesn't exist")
+        sys.exit(1)
 
-    print_header("Processing targets:")
-    print_block(str(targets))
+    # JSON reports are the only output
+    if not (args.dry_run_mode and args.output_format == "json"):
+        print_header("Processing targets:")
+        print_block(str(targets))
 
-    if args.build_mode:
-        require_commands(
-            "autoconf",
-            "curl",
-            "gperf",
-            "libtoolize",
-            "make",
-            "tar",
-            *["cmake", "nasm", "yasm", "pkg-config"] if args.default_tools else [],
-        )
+    if args.build_mode or args.plan_mode or args.dry_run_mode:
         opts = Options(
             targets=targets,
             threads=args.jobs,
+            parallel_builds=args.parallel_builds,
+            memory_limit=args.memory_limit,
+            memory_pressure_limit=args.memory_pressure_limit,
+            jobserver=args.jobserver,
+            prefetch_workers=args.prefetch_workers,
+            download_rate_limit=args.download_rate_limit,
+            verify_downloads=args.verify_downloads,
+            cache_dir=args.cache_dir,
+            source_cache=args.source_cache,
+            artifact_cache=args.artifact_cache,
+            artifact_cache_size=args.artifact_cache_size,
+            compiler_launcher=args.compiler_launcher,
+            config_cache=args.config_cache,
+            profile=args.profile,
+            pgo=args.pgo,
+            lto=args.lto,
+            march_variants=tuple(_ for _ in args.march_variants.split(",") if _),
+            pgo_workload=args.pgo_workload,
+            ram_dir=args.ram_dir,
+            ram_budget=args.ram_budget,
             silent=args.silent_mode,
+            compress_logs=args.compress_logs,
+            log_tail_lines=args.log_tail_lines,
             target_dir=args.target_dir,
             release_dir=args.release_dir,
             extra_cflags=args.extra_cflags,
@@ -619,6 +439,39 @@ def main() -> None:
             static_ffmpeg=args.static_ffmpeg,
             nonfree_build=args.nonfree,
         )
+        # The build machinery is only imported by the commands using it
+        from builder import Builder  # pylint: disable=import-outside-toplevel
+
+        if args.dry_run_mode:
+            Builder(opts).dry_run(args.output_format)
+            return
+        if args.plan_mode:
+            Builder(opts).plan()
+            return
+        from build_utils import (  # pylint: disable=import-outside-toplevel
+            command_exists,
+            require_commands,
+        )
+
+        if any(_ in targets for _ in ("libopenh264", "libdav1d")):
+            if not (bool(command_exists("meson") and command_exists("ninja"))):
+                print(
+                    "In order to build libopenh264 or libdav1d, you must install meson and ninja in your system"
+                )
+                sys.exit(1)
+
+        if args.compiler_launcher and not command_exists(args.compiler_launcher):
+            print(f"Compiler launcher {args.compiler_launcher} is not installed")
+            sys.exit(1)
+
+        require_commands(
+            "autoconf",
+            "gperf",
+            "libtoolize",
+            "make",
+            "tar",
+            *["cmake", "nasm", "yasm", "pkg-config"] if args.default_tools else [],
+        )
         Builder(opts).build()
 
     if args.clean_mode:
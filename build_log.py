@@ -0,0 +1,158 @@
+"""
+Output of the build commands, streamed to a log file per library and phase
+"""
+from collections import deque
+from shutil import rmtree
+from typing import Optional
+import gzip
+import os
+import os.path
+import shlex
+import subprocess
+import sys
+import tracing
+
+# Longest line read at once, longer lines are split
+MAX_LINE = 64 * 1024
+
+_ACTIVE: Optional["BuildLogs"] = None
+
+
+class BuildLogs:
+    """
+    Stream the output of every command into <log dir>/<library>/<phase>.log
+
+    Only the last lines are kept in memory, to be shown if the command
+    fails. Echoed lines are prefixed with the library when builds run in
+    parallel, each line is written at once so lines of concurrent builds
+    don't mix.
+    """
+
+    def __init__(
+        self,
+        log_dir: str,
+        compress: bool = False,
+        tail_lines: int = 50,
+        prefix_lines: bool = False,
+    ):
+        self.__log_dir = log_dir
+        self.__compress = compress
+        self.__tail_lines = max(1, tail_lines)
+        self.__prefix_lines = prefix_lines
+        self.__library = "builder"
+        os.makedirs(log_dir, exist_ok=True)
+
+    def start(self, lib_name: str) -> None:
+        """
+        Log the following commands for a library, replacing its old logs
+
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+        """
+        self.__library = lib_name
+        rmtree(os.path.join(self.__log_dir, lib_name), ignore_errors=True)
+
+    def path(self) -> str:
+        """
+        Return log file of the current library and phase
+
+        Returns
+        -------
+        str
+        """
+        name = f"{tracing.current_phase() or 'build'}.log"
+        if self.__compress:
+            name += ".gz"
+        return os.path.join(self.__log_dir, self.__library, name)
+
+    def __echo(self, line: bytes) -> None:
+        """
+        Write a whole line to stdout at once
+        """
+        if self.__prefix_lines:
+            line = f"[{self.__library}] ".encode("utf-8") + line
+        if not line.endswith(b"\n"):
+            line += b"\n"
+        sys.stdout.flush()
+        os.write(sys.stdout.fileno(), line)
+
+    def run(self, cmd, silent: bool = False, pass_fds: tuple = ()) -> bool:
+        """
+        Run command, streaming its output to the log
+
+        Parameters
+        ----------
+        cmd: plumbum.commands.BaseCommand
+            Command
+        silent: bool (default False)
+            Don't echo the output
+        pass_fds: tuple (default ())
+            File descriptors kept open in the child process
+
+        Returns
+        -------
+        bool
+            Return True if the command succeeded
+        """
+        path = self.path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tail: deque = deque(maxlen=self.__tail_lines)
+        opener = gzip.open if self.__compress else open
+        with opener(path, "ab") as log_file:
+            log_file.write(f"$ {cmd}\n".encode("utf-8"))
+            try:
+                process = cmd.popen(
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    pass_fds=pass_fds,
+                )
+            except OSError as err:
+                log_file.write(f"{err}\n".encode("utf-8"))
+                self.__echo(f"Can't run {cmd}: {err}".encode("utf-8"))
+                return False
+            with process.stdout:
+                for line in iter(lambda: process.stdout.readline(MAX_LINE), b""):
+                    log_file.write(line)
+                    tail.append(line)
+                    if not silent:
+                        self.__echo(line)
+            returncode = process.wait()
+        if returncode == 0:
+            return True
+        self.__echo(
+            f"Command failed with exit code {returncode}: "
+            f"{' '.join(shlex.quote(str(_)) for _ in cmd.formulate())}".encode("utf-8")
+        )
+        if silent:
+            self.__echo(f"Last {len(tail)} lines of {path}:".encode("utf-8"))
+            for line in tail:
+                self.__echo(line)
+        else:
+            self.__echo(f"Full output in {path}".encode("utf-8"))
+        return False
+
+
+def activate(logs: Optional[BuildLogs]) -> None:
+    """
+    Set logs used by build_utils
+
+    Parameters
+    ----------
+    logs: Optional[BuildLogs]
+        Build logs or None to disable them
+    """
+    global _ACTIVE  # pylint: disable=global-statement
+    _ACTIVE = logs
+
+
+def active() -> Optional[BuildLogs]:
+    """
+    Returns
+    -------
+    Optional[BuildLogs]
+        Build logs used by build_utils
+    """
+    return _ACTIVE
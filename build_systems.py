@@ -0,0 +1,424 @@
+"""
+Adapters running the configure, compile and install steps of every build
+system the same way
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Type
+import os.path
+import re
+import sys
+from build_utils import (
+    cmake,
+    command_exists,
+    configure,
+    make,
+    make_install,
+    meson,
+    ninja,
+    ninja_install,
+    run_fg,
+)
+from file_utils import remove
+import tracing
+
+# Switches of the fast profile, passed when the configure script knows them
+FAST_CONFIGURE_SWITCHES = (
+    "--disable-dependency-tracking",
+    "--disable-doc",
+    "--disable-docs",
+    "--disable-documentation",
+    "--disable-examples",
+    "--disable-tests",
+    "--disable-unit-tests",
+)
+# cmake only warns about the variables a project doesn't use
+FAST_CMAKE_SWITCHES = (
+    "-DBUILD_TESTING=OFF",
+    "-DBUILD_EXAMPLES=OFF",
+    "-DBUILD_DOC=OFF",
+    "-DBUILD_DOCS=OFF",
+)
+# meson fails on unknown options, they are looked up in the project
+FAST_MESON_OPTIONS = (
+    "tests",
+    "enable_tests",
+    "docs",
+    "enable_docs",
+    "documentation",
+    "examples",
+    "enable_examples",
+)
+MESON_OPTION = re.compile(r"option\s*\(\s*'(\w+)'\s*,\s*type\s*:\s*'(\w+)'")
+
+
+class BuildSystem(ABC):
+    """
+    Configure, compile and install steps, run in the build directory of the
+    library, each one timed as its own phase
+    """
+
+    # Clean removes the compiled files, the adapters rebuilding with other
+    # flags need it
+    cleanable = True
+
+    def __init__(
+        self,
+        library_obj,
+        prefix: str,
+        threads: int,
+        silent: bool = False,
+        profile: str = "default",
+    ):
+        """
+        Parameters
+        ----------
+        library_obj: Library
+            Library to build
+        prefix: str
+            Install prefix
+        threads: int
+            Parallel jobs of the compile step
+        silent: bool (default False)
+            Don't echo the output of the commands
+        profile: str (default "default")
+            Build profile
+        """
+        self._library = library_obj
+        self._prefix = prefix
+        self._threads = threads
+        self._silent = silent
+        self._profile = profile
+        self.__profile_applied = False
+        # Added to the configure parameters by the wrapping adapters
+        self.extra_params: List[str] = []
+
+    @property
+    def params(self) -> List[str]:
+        """
+        Returns
+        -------
+        List[str]
+            Configure parameters
+        """
+        return [*self._library.configure_params, *self.extra_params]
+
+    def profile_params(self) -> List[str]:
+        """
+        Return configure parameters of the build profile, the switches the
+        build system supports and the library doesn't skip, then the ones
+        of the library
+
+        Returns
+        -------
+        List[str]
+        """
+        if self._profile != "fast":
+            return []
+        overrides = self._library.fast_profile
+        return [
+            _
+            for _ in self._fast_switches()
+            if _ not in overrides.get("skip", [])
+        ] + overrides.get("params", [])
+
+    def _fast_switches(self) -> List[str]:
+        return []
+
+    def _apply_profile(self) -> None:
+        """
+        Add the parameters of the build profile to the library, once
+        """
+        if self.__profile_applied:
+            return
+        self.__profile_applied = True
+        params = self.profile_params()
+        if params:
+            self._library.add_configuration_params(*params)
+
+    def configure(self) -> None:
+        """
+        Configure the library
+        """
+        self._apply_profile()
+        with tracing.phase("configure"):
+            self._configure()
+
+    def compile(self) -> None:
+        """
+        Compile the configured library
+        """
+        with tracing.phase("compile"):
+            self._compile()
+
+    def install(self) -> None:
+        """
+        Install the compiled library into the prefix
+        """
+        with tracing.phase("install"):
+            self._install()
+
+    def clean(self) -> None:
+        """
+        Remove the compiled files, keeping the configuration
+        """
+        with tracing.phase("clean"):
+            self._clean()
+
+    @abstractmethod
+    def _configure(self) -> None:
+        pass
+
+    @abstractmethod
+    def _compile(self) -> None:
+        pass
+
+    @abstractmethod
+    def _install(self) -> None:
+        pass
+
+    @abstractmethod
+    def _clean(self) -> None:
+        pass
+
+
+class Autotools(BuildSystem):
+    """
+    ./configure && make && make install
+    """
+
+    def _fast_switches(self) -> List[str]:
+        try:
+            with open("configure", encoding="utf-8", errors="replace") as file:
+                script = file.read()
+        except OSError:
+            return []
+        result = []
+        for switch in FAST_CONFIGURE_SWITCHES:
+            feature = switch[len("--disable-") :]
+            if not re.search(rf"--(en|dis)able-{feature}(?![-\w])", script):
+                continue
+            if not any(
+                re.match(rf"--(en|dis)able-{feature}(=|$)", _)
+                for _ in self._library.configure_params
+            ):
+                result.append(switch)
+        return result
+
+    def _configure(self) -> None:
+        configure(self._prefix, *self.params, silent=self._silent)
+
+    def _compile(self) -> None:
+        make(self._threads, silent=self._silent)
+
+    def _install(self) -> None:
+        make_install(silent=self._silent)
+
+    def _clean(self) -> None:
+        make(1, "clean", silent=self._silent)
+
+
+class CMake(BuildSystem):
+    """
+    cmake with the Ninja generator, or Makefiles if ninja isn't installed or
+    the library asks for them
+    """
+
+    def __init__(
+        self,
+        library_obj,
+        prefix: str,
+        threads: int,
+        silent: bool = False,
+        profile: str = "default",
+    ):
+        super().__init__(library_obj, prefix, threads, silent, profile)
+        generator = library_obj.cmake_generator or "Ninja"
+        self.__ninja = generator == "Ninja" and command_exists("ninja")
+
+    @property
+    def generator(self) -> Optional[str]:
+        """
+        Returns
+        -------
+        Optional[str]
+            Generator passed to cmake, None for the platform default
+        """
+        return "Ninja" if self.__ninja else None
+
+    def _fast_switches(self) -> List[str]:
+        return [
+            switch
+            for switch in FAST_CMAKE_SWITCHES
+            if not any(
+                re.match(rf"{switch.split('=')[0]}[:=]", _)
+                for _ in self._library.configure_params
+            )
+        ]
+
+    def __drop_other_generator(self) -> None:
+        """
+        Remove the cmake cache of a build dir configured with another
+        generator, cmake refuses to switch
+        """
+        try:
+            with open("CMakeCache.txt", encoding="utf-8", errors="replace") as file:
+                match = re.search(r"^CMAKE_GENERATOR:INTERNAL=(.*)$", file.read(), re.M)
+        except OSError:
+            return
+        if match is not None and (match.group(1) == "Ninja") != self.__ninja:
+            remove("CMakeCache.txt")
+            remove("CMakeFiles")
+
+    def _configure(self) -> None:
+        self.__drop_other_generator()
+        cmake(
+            self._prefix,
+            *self.params,
+            generator=self.generator,
+            silent=self._silent,
+        )
+
+    def _compile(self) -> None:
+        if self.__ninja:
+            ninja(self._threads, silent=self._silent)
+            return
+        make(self._threads, silent=self._silent)
+
+    def _install(self) -> None:
+        if self.__ninja:
+            ninja_install(silent=self._silent)
+            return
+        make_install(silent=self._silent)
+
+    def _clean(self) -> None:
+        if self.__ninja:
+            if not run_fg("ninja", "clean", silent=self._silent):
+                sys.exit(1)
+            return
+        make(1, "clean", silent=self._silent)
+
+
+class Meson(BuildSystem):
+    """
+    meson setup && ninja && ninja install
+    """
+
+    def _fast_switches(self) -> List[str]:
+        source_dir = next(
+            (_ for _ in reversed(self._library.configure_params) if not _.startswith("-")),
+            ".",
+        )
+        options = {}
+        for name in ("meson.options", "meson_options.txt"):
+            try:
+                with open(os.path.join(source_dir, name), encoding="utf-8") as file:
+                    options.update(MESON_OPTION.findall(file.read()))
+            except OSError:
+                pass
+        values = {"boolean": "false", "feature": "disabled"}
+        return [
+            f"-D{name}={values[options[name]]}"
+            for name in FAST_MESON_OPTIONS
+            if options.get(name) in values
+            and not any(
+                _.startswith(f"-D{name}=") for _ in self._library.configure_params
+            )
+        ]
+
+    def _configure(self) -> None:
+        meson(self._prefix, *self.params, silent=self._silent)
+
+    def _compile(self) -> None:
+        ninja(self._threads, silent=self._silent)
+
+    def _install(self) -> None:
+        ninja_install(silent=self._silent)
+
+    def _clean(self) -> None:
+        if not run_fg("ninja", "clean", silent=self._silent):
+            sys.exit(1)
+
+
+class Custom(BuildSystem):
+    """
+    Library module building by itself in custom_configure and installing in
+    custom_install. Scripts without custom_install only install, they run
+    in the install step.
+    """
+
+    # The scripts leave no build to clean, they start over every time
+    cleanable = False
+
+    # Timed as custom_configure and install by the library
+    def configure(self) -> None:
+        # Only the parameters of the library, custom scripts know no switch
+        self._apply_profile()
+        self._configure()
+
+    def compile(self) -> None:
+        self._compile()
+
+    def install(self) -> None:
+        self._install()
+
+    def _configure(self) -> None:
+        pass
+
+    def _compile(self) -> None:
+        if self._library.has_custom_install:
+            self._library.custom_configure()
+
+    def _install(self) -> None:
+        if self._library.has_custom_install:
+            self._library.custom_install()
+        else:
+            self._library.custom_configure()
+
+    def _clean(self) -> None:
+        print(f"{self._library.name} builds in its own script, nothing to clean")
+
+
+BUILD_SYSTEMS: Dict[str, Type[BuildSystem]] = {
+    "configure": Autotools,
+    "cmake": CMake,
+    "meson": Meson,
+}
+
+
+def build_system(
+    library_obj,
+    prefix: str,
+    threads: int,
+    silent: bool = False,
+    profile: str = "default",
+) -> BuildSystem:
+    """
+    Return adapter of the library build system
+
+    Parameters
+    ----------
+    library_obj: Library
+        Library to build
+    prefix: str
+        Install prefix
+    threads: int
+        Parallel jobs of the compile step
+    silent: bool (default False)
+        Don't echo the output of the commands
+    profile: str (default "default")
+        Build profile
+
+    Returns
+    -------
+    BuildSystem
+    """
+    if library_obj.has_own_configuration:
+        return Custom(library_obj, prefix, threads, silent, profile)
+    if library_obj.configuration not in BUILD_SYSTEMS:
+        print(
+            f"Unknown configuration {library_obj.configuration} of {library_obj.name}"
+        )
+        sys.exit(1)
+    return BUILD_SYSTEMS[library_obj.configuration](
+        library_obj, prefix, threads, silent, profile
+    )
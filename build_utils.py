@@ -2,11 +2,19 @@
 Contains utiltt for building ffmpeg
 """
 # pylint: disable=line-too-long
+from functools import lru_cache
+from typing import Optional, Tuple
 import logging
 import platform
+import os
 import re
 import sys
 import plumbum
+import autoconf_cache
+import build_log
+import compiler_cache
+import dry_run
+import jobserver
 
 logger = logging.getLogger(__name__)
 
@@ -52,7 +60,32 @@ def command_exists(cmd: str) -> bool:
         return False
 
 
-def run_fg(command: str, *args, silent: bool = False) -> bool:
+@lru_cache(maxsize=None)
+def command_version(cmd: str) -> Tuple[int, ...]:
+    """
+    Return version of the command parsed from `cmd --version`
+
+    Parameters
+    ----------
+    cmd: str
+        Command name
+
+    Returns
+    -------
+    Tuple[int, ...]
+        Version numbers, empty if command not found
+    """
+    try:
+        output = plumbum.local[cmd]("--version")
+    except (plumbum.commands.CommandNotFound, plumbum.commands.ProcessExecutionError):
+        return ()
+    version_search = re.search(r"(\d+)\.(\d+)(?:\.(\d+))?", output)
+    if not version_search:
+        return ()
+    return tuple(int(_) for _ in version_search.groups() if _ is not None)
+
+
+def run_fg(command: str, *args, silent: bool = False, pass_fds: tuple = ()) -> bool:
     """
     Run command at foreground
 
@@ -64,14 +97,30 @@ def run_fg(command: str, *args, silent: bool = False) -> bool:
         Command additional argument
     silent: bool
         Print foreground result or not
+    pass_fds: tuple (default ())
+        File descriptors kept open in the child process
 
     Returns
     -------
     bool
     """
+    log = dry_run.active()
+    if log is not None:
+        log.command([command, *args], plumbum.local.env.getdict())
+        return True
     try:
         cmd = plumbum.local[command][args]
-        result = cmd.run() if silent else cmd & plumbum.TEE
+        logs = build_log.active()
+        if logs is not None:
+            return logs.run(cmd, silent=silent, pass_fds=pass_fds)
+        if pass_fds:
+            result = (
+                cmd.run(pass_fds=pass_fds)
+                if silent
+                else cmd.run(pass_fds=pass_fds, stdout=None, stderr=None)
+            )
+        else:
+            result = cmd.run() if silent else cmd & plumbum.TEE
         return result
     except plumbum.commands.CommandNotFound:
         logger.exception("Command %s not found!", command)
@@ -176,13 +225,23 @@ def configure(prefix: str, *args, **kwargs) -> bool:
     if platform.system() == "Windows":
         configure_flags = ("bash",) + configure_flags
     run_fg("chmod", "+x", "./configure")
+    cache = autoconf_cache.active()
+    cache_file = cache.checkout() if cache is not None else None
+    if cache_file is not None:
+        if run_fg(*configure_flags, f"--cache-file={cache_file}", **kwargs):
+            cache.merge(cache_file)
+            logger.debug("Configure with configure done!")
+            return True
+        print("Configure failed with the shared autoconf cache, retrying without it")
+        cache.failed()
+        os.remove(cache_file)
     if not run_fg(*configure_flags, **kwargs):
         sys.exit(1)
     logger.debug("Configure with configure done!")
     return True
 
 
-def cmake(prefix: str, *args, **kwargs) -> bool:
+def cmake(prefix: str, *args, generator: Optional[str] = None, **kwargs) -> bool:
     """
     Run cmake
 
@@ -190,6 +249,8 @@ def cmake(prefix: str, *args, **kwargs) -> bool:
     ----------
     prefix : str
         Build prefix
+    generator : Optional[str] (default None)
+        Generator, None for Makefiles
 
     Returns
     -------
@@ -203,10 +264,25 @@ def cmake(prefix: str, *args, **kwargs) -> bool:
         f"-DCMAKE_PREFIX_PATH={prefix}",
     ) + args
     logger.debug("Configuring with cmake. Command: %s", "".join(cmake_flags))
-    if platform.system() == "Windows":
+    # cmake ignores the archiver tools from the environment
+    for tool in ("AR", "RANLIB", "NM"):
+        if plumbum.local.env.get(tool):
+            cmake_flags += (f"-DCMAKE_{tool}={plumbum.local.env[tool]}",)
+    if generator is not None:
+        cmake_flags += ("-G", generator)
+    elif platform.system() == "Windows":
         cmake_flags += ("-G", "MSYS Makefiles")
-    if not run_fg(*cmake_flags, **kwargs):
-        sys.exit(1)
+    cache = compiler_cache.active()
+    if cache is None:
+        if not run_fg(*cmake_flags, **kwargs):
+            sys.exit(1)
+        logger.debug("Configure with cmake done!")
+        return True
+    # cmake takes CC as the compiler path, the launcher has its own variable
+    c_compiler, cxx_compiler = cache.compilers
+    with plumbum.local.env(CC=c_compiler, CXX=cxx_compiler):
+        if not run_fg(*cmake_flags, *cache.cmake_args(), **kwargs):
+            sys.exit(1)
     logger.debug("Configure with cmake done!")
     return True
 
@@ -228,8 +304,26 @@ def make(threads: int, *args, **kwargs) -> None:
     -------
     None
     """
-    if not run_fg("make", f"-j{threads}", *args, **kwargs):
-        sys.exit(1)
+    server = jobserver.active()
+    if server is None:
+        if not run_fg("make", f"-j{threads}", *args, **kwargs):
+            sys.exit(1)
+        return
+    version = command_version("make")
+    # The jobserver came with GNU make 3.78, other makes get their share
+    if threads < server.slots or version < (3, 78):
+        # Limited library, reserve its share instead of joining
+        with server.slot(threads) as tokens:
+            if not run_fg("make", f"-j{tokens}", *args, **kwargs):
+                sys.exit(1)
+        return
+    # GNU make older than 4.4 only understands inherited file descriptors
+    use_fifo = version >= jobserver.FIFO_MAKE
+    with server.slot(), plumbum.local.env(MAKEFLAGS=server.makeflags(version)):
+        if not run_fg(
+            "make", *args, pass_fds=() if use_fifo else server.fds, **kwargs
+        ):
+            sys.exit(1)
 
 
 def make_install(*args, **kwargs) -> None:
@@ -291,8 +385,32 @@ def ninja(threads: int, **kwargs) -> bool:
     bool
         Return True if success
     """
-    if not run_fg("ninja", "-j", threads, **kwargs):
-        sys.exit(1)
+    server = jobserver.active()
+    if server is None:
+        if not run_fg("ninja", "-j", threads, **kwargs):
+            sys.exit(1)
+    elif threads < server.slots or command_version("ninja") < (1, 13):
+        # Limited library or ninja that can't join, reserve the free tokens
+        with server.slot(threads) as tokens:
+            if not run_fg("ninja", "-j", tokens, **kwargs):
+                sys.exit(1)
+    else:
+        # Ninja is a jobserver client since 1.13, an explicit -j disables it
+        with server.slot(), plumbum.local.env(MAKEFLAGS=server.makeflags()):
+            if not run_fg("ninja", **kwargs):
+                sys.exit(1)
+    return True
+
+
+def ninja_install(**kwargs) -> bool:
+    """
+    Run ninja install
+
+    Returns
+    -------
+    bool
+        Return True if success
+    """
     if not run_fg("ninja", "install", **kwargs):
         sys.exit(1)
     return True
@@ -0,0 +1,1094 @@
+"""
+Build FFmpeg and the libraries it's configured with
+"""
+# pylint: disable=line-too-long
+from contextlib import nullcontext, redirect_stdout
+from dataclasses import replace
+from shutil import rmtree
+from typing import Dict, List, Optional
+import json
+import math
+import os.path
+import platform
+import shlex
+import sys
+import tempfile
+from console import print_block, print_header
+from file_utils import activate_patch_records, file_lock, mkdir, take_patched_files
+from library_manager import LibraryManager
+from options import PGO_LIBRARIES, Options
+from pkg_config import install_shim
+import build_log
+import compiler_cache
+import dry_run
+import jobserver
+import tracing
+
+try:
+    from build_utils import add_path, path_fixer
+    from build_systems import BuildSystem, build_system
+    from pgo import ProfileGuided, ProfileStore
+    import lto
+    import variants
+    from artifact_cache import ArtifactCache, InstallRecorder, artifact_key
+    import autoconf_cache
+    from downloader import Prefetcher, archive_path, prepare_source, share_rate_limit
+    from history import BuildHistory
+    from source_cache import SourceCache
+    from ram_disk import RamDisk
+    from resources import MemoryGovernor
+    from scheduler import BuildGraph, DependencyError, Scheduler
+    from plumbum import local
+except ModuleNotFoundError:
+    print("Install required module with `pip install -r requirements.txt`")
+    sys.exit(1)
+
+
+class Builder:
+    """
+    Class to build ffmpeg
+    """
+
+    def __init__(self, options: Options, shared_release_dir: Optional[str] = None):
+        """
+        Parameters
+        ----------
+        options : Options
+            Build options
+        shared_release_dir : Optional[str] (default None)
+            Release directory of the libraries shared by the -march
+            variants, set on the build of one variant
+        """
+        self._options = options
+        self._old_ldflags = None
+        self.__shared_release_dir = shared_release_dir
+        self.__dir_data = {
+            "target_dir": path_fixer(options.target_dir),
+            "release_dir": path_fixer(options.release_dir),
+            "bin_dir": path_fixer(os.path.join(options.release_dir, options.bin_dir)),
+            "pkg_config_path": path_fixer(
+                os.path.join(options.release_dir, "lib", "pkgconfig")
+            ),
+        }
+
+        self.__library_mgr = LibraryManager()
+        self.__library_mgr.init(options)
+        self.__march_libraries = (
+            variants.march_libraries(self.__library_mgr, options.targets)
+            if options.march_variants or shared_release_dir
+            else set()
+        )
+        # The shared build leaves the variant libraries out, a variant
+        # build everything else
+        self.__graph = BuildGraph(
+            self.__library_mgr,
+            options,
+            (
+                set(self.__library_mgr.data) - self.__march_libraries
+                if shared_release_dir
+                else self.__march_libraries
+            ),
+        )
+        self.__job_limits: Dict[str, int] = {}
+        self.__ram_disk: Optional[RamDisk] = None
+        self.__work_sizes: Dict[str, Optional[float]] = {}
+        self.__artifact_cache = (
+            ArtifactCache(options.cache_dir, options.artifact_cache_size)
+            if options.artifact_cache
+            else None
+        )
+
+        ffmpeg_obj = self.__library_mgr.get_library("ffmpeg")
+        if self.is_mac:
+            ffmpeg_obj.add_configuration_params("--enable-videotoolbox")
+        ffmpeg_obj.add_configuration_params(*shlex.split(options.extra_ffmpeg_args))
+        if options.extra_libs:
+            ffmpeg_obj.add_configuration_params(f"--extra-libs={options.extra_libs}")
+
+    @property
+    def target_dir(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Return target dir
+        """
+        return self.__dir_data["target_dir"]
+
+    @property
+    def release_dir(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Return release dir
+        """
+        return self.__dir_data["release_dir"]
+
+    @property
+    def bin_dir(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Return binary dir
+        """
+        return self.__dir_data["bin_dir"]
+
+    @property
+    def pkg_config_path(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Return pkg config path
+        """
+        return self.__dir_data["pkg_config_path"]
+
+    @property
+    def install_lock(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Return lock file serializing the installs into release dir
+        """
+        return os.path.join(self.target_dir, ".install.lock")
+
+    @property
+    def source_cache_dir(self) -> Optional[str]:
+        """
+        Returns
+        -------
+        Optional[str]
+            Return shared cache dir of the sources, None if disabled
+        """
+        return self._options.cache_dir if self._options.source_cache else None
+
+    @property
+    def is_windows(self) -> bool:
+        """
+        Returns
+        -------
+        bool
+        """
+        return platform.system() == "Windows"
+
+    @property
+    def is_linux(self) -> bool:
+        """
+        Returns
+        -------
+        bool
+        """
+        return platform.system() == "Linux"
+
+    @property
+    def is_mac(self) -> bool:
+        """
+        Returns
+        -------
+        bool
+        """
+        return platform.system() == "Darwin"
+
+    def __threads(self, lib_name: str) -> int:
+        """
+        Return number of parallel jobs the library gets
+
+        Parameters
+        ----------
+        lib_name : str
+            Library name
+
+        Returns
+        -------
+        int
+        """
+        return min(
+            self._options.threads,
+            self.__job_limits.get(lib_name, self._options.threads),
+        )
+
+    def __update_job_limits(self, graph: BuildGraph, history: BuildHistory) -> None:
+        """
+        Limit the jobs of the libraries that don't compile in parallel well,
+        from libraries.json or from the cores they kept busy before
+
+        A library that used its whole limit gets one more job next time, so
+        the limit follows libraries that scale better than measured.
+
+        Parameters
+        ----------
+        graph : BuildGraph
+            Libraries to build
+        history : BuildHistory
+            Previous builds
+        """
+        for lib_name in graph.nodes:
+            max_jobs = self.__library_mgr.get_library(lib_name).max_jobs
+            if max_jobs is None:
+                parallelism = history.parallelism(lib_name)
+                if parallelism is None:
+                    continue
+                max_jobs = math.ceil(parallelism) + 1
+            if max_jobs < self._options.threads:
+                self.__job_limits[lib_name] = max(1, max_jobs)
+
+    def __memory_estimates(
+        self, graph: BuildGraph, history: BuildHistory
+    ) -> Dict[str, float]:
+        """
+        Return expected peak memory of every library build, measured in the
+        previous builds or declared in libraries.json
+
+        Parameters
+        ----------
+        graph : BuildGraph
+            Libraries to build
+        history : BuildHistory
+            Previous builds
+
+        Returns
+        -------
+        Dict[str, float]
+            MiB per library, libraries without an estimate are left out
+        """
+        result = {}
+        for lib_name in graph.nodes:
+            memory_mb = history.memory(lib_name)
+            if memory_mb is None:
+                memory_mb = self.__library_mgr.get_library(lib_name).memory_mb
+            if memory_mb is not None:
+                result[lib_name] = memory_mb
+        return result
+
+    def __build_system(self, lib_name: str) -> BuildSystem:
+        """
+        Return adapter of the library build system
+
+        Parameters
+        ----------
+        lib_name : str
+            Library name
+
+        Returns
+        -------
+        BuildSystem
+        """
+        library_obj = self.__library_mgr.get_library(lib_name)
+        system = build_system(
+            library_obj,
+            self.release_dir,
+            self.__threads(lib_name),
+            self._options.silent,
+            self._options.profile,
+        )
+        if self._options.pgo and lib_name in PGO_LIBRARIES:
+            return ProfileGuided(
+                system,
+                library_obj,
+                ProfileStore(self._options.cache_dir),
+                self._options.pgo_workload,
+                self._options.silent,
+            )
+        return system
+
+    def __installing(self, recorder: InstallRecorder):
+        """
+        Return context recording the installed files if artifacts are cached
+
+        Parameters
+        ----------
+        recorder : InstallRecorder
+            Recorder of the library
+        """
+        if self.__artifact_cache is None:
+            return nullcontext()
+        return recorder.record()
+
+    def __configure_and_install(self, lib_name: str, installing) -> None:
+        """
+        Configure, compile and install the library with its hooks
+
+        Parameters
+        ----------
+        lib_name : str
+            Library name
+        installing
+            Context wrapping the install
+        """
+        library_obj = self.__library_mgr.get_library(lib_name)
+        system = self.__build_system(lib_name)
+        system.configure()
+        library_obj.post_configure()
+        system.compile()
+        with installing as recorder:
+            with recorder.staged() if recorder is not None else nullcontext():
+                system.install()
+            library_obj.post_install()
+
+    def __prepare_source(self, library_obj, **kwargs) -> None:
+        """
+        Download and extract the library source, exit if it fails
+
+        Parameters
+        ----------
+        library_obj : Library
+            Library
+        **kwargs
+            Extra arguments of prepare_source
+        """
+        if not prepare_source(  # pylint: disable = E1120
+            self.target_dir,
+            *library_obj.download_params,
+            rate_limit=self._options.download_rate_limit,
+            sha256=library_obj.sha256,
+            cache_dir=self.source_cache_dir,
+            verify=self._options.verify_downloads,
+            **kwargs,
+        ):
+            sys.exit(1)
+
+    def __source_dir(self, lib_name: str) -> str:
+        """
+        Return directory to extract and build the library in, in RAM if its
+        expected tree fits the budget left, else the target dir
+
+        Parameters
+        ----------
+        lib_name : str
+            Library name
+
+        Returns
+        -------
+        str
+        """
+        if self.__ram_disk is None:
+            return self.target_dir
+        library_obj = self.__library_mgr.get_library(lib_name)
+        measured_mb = self.__work_sizes.get(lib_name)
+        archive_size = 0
+        if measured_mb is None:
+            # Sized from the archive, it stays in the target dir
+            self.__prepare_source(library_obj, extract_source=False)
+            archive_size = os.path.getsize(
+                archive_path(self.target_dir, *library_obj.download_params[1:])
+            )
+        size = RamDisk.estimate(archive_size, measured_mb)
+        work_dir = self.__ram_disk.reserve(lib_name, size)
+        if work_dir is None:
+            print(
+                f"{lib_name} needs about {size / 1024**2:.0f}M, "
+                "more than left in RAM, building on disk"
+            )
+            return self.target_dir
+        print(f"Building {lib_name} in {work_dir}")
+        return work_dir
+
+    def __build_library(self, lib_name: str) -> None:
+        """
+        Build library, timed as one trace track
+
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+
+        Returns
+        -------
+        None
+        """
+        tracer = tracing.active()
+        if tracer is not None:
+            tracer.track = lib_name
+        logs = build_log.active()
+        if logs is not None:
+            logs.start(lib_name)
+        config_cache = autoconf_cache.active()
+        if config_cache is not None:
+            config_cache.start(lib_name)
+        with tracing.phase(
+            "build", fingerprint=self.__graph.fingerprints[lib_name]
+        ) as args:
+            print_header(f"Building {lib_name}")
+            source_dir = self.__source_dir(lib_name)
+            in_ram = source_dir != self.target_dir
+            try:
+                built = self.__build(lib_name, source_dir)
+            except BaseException:
+                if in_ram:
+                    print(f"Build tree of {lib_name} kept in {source_dir}")
+                raise
+            args["status"] = "built" if built else "restored"
+            if in_ram:
+                args["work_mb"] = round(
+                    self.__ram_disk.release(lib_name) / 1024**2, 1
+                )
+
+    def __build(self, lib_name: str, source_dir: str) -> bool:
+        """
+        This function will handle the build process of a single library,
+        its dependencies must already be built
+
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+        source_dir: str
+            Directory to extract and build the library in, only the installed
+            files go to the release dir
+
+        Returns
+        -------
+        bool
+            Return False if the library was restored from the artifact cache
+        """
+        library_obj = self.__library_mgr.get_library(lib_name)
+        library_obj.use_source_dir(source_dir)
+        take_patched_files()
+        self.__prepare_source(library_obj, work_dir=source_dir)
+        lib_build_dir = os.path.join(source_dir, library_obj.folder_name)
+        if not os.path.isdir(lib_build_dir):
+            mkdir(lib_build_dir)
+        with local.cwd(lib_build_dir):
+            library_obj.pre_configure()
+            fingerprint = self.__graph.fingerprints[lib_name]
+            key = artifact_key(library_obj, fingerprint)
+            if self.__artifact_cache is not None:
+                with file_lock(self.install_lock), tracing.phase("restore"):
+                    restored = self.__artifact_cache.restore(key, self.release_dir)
+                if restored:
+                    library_obj.mark_as_built(fingerprint)
+                    print_block(f"Restored {lib_name} from artifact cache")
+                    return False
+            recorder = InstallRecorder(self.release_dir, self.install_lock)
+            cache = compiler_cache.active()
+            stats_log = os.path.join(self.target_dir, f"{lib_name}.ccache.log")
+            link_time = lto.active() if library_obj.lto else None
+            with local.env(
+                **(cache.stats_env(stats_log) if cache else {}),
+                **(link_time.env(local.env) if link_time else {}),
+            ):
+                self.__configure_and_install(lib_name, self.__installing(recorder))
+        if self.__artifact_cache is not None:
+            self.__artifact_cache.store(key, self.release_dir, recorder.files)
+        # Patches of the build tree are covered by the fingerprint, the ones
+        # of installed files are checked before trusting the stamp
+        release_dir = os.path.join(self.release_dir, "")
+        library_obj.mark_as_built(
+            fingerprint,
+            {
+                path: digest
+                for path, digest in take_patched_files().items()
+                if path.startswith(release_dir)
+            },
+        )
+        stats = cache.library_stats(stats_log) if cache else None
+        print_block(f"Finished building {lib_name}", *([stats] if stats else []))
+        return True
+
+    def __build_env(self):
+        """
+        Return environment pointing the builds at the release directory
+        """
+        include_flags = " ".join(f"-I{_}/include" for _ in self.__prefixes)
+        lib_flags = " ".join(f"-L{_}/lib" for _ in self.__prefixes)
+        extra_cflags = f"{include_flags} {self._options.extra_cflags}"
+        extra_ldflags = f"{lib_flags} {self._options.extra_ldflags}"
+        env = {}
+        if self._options.march:
+            extra_cflags += f" -march={self._options.march}"
+            env["CXXFLAGS"] = f"{local.env.get('CXXFLAGS', '')} -march={self._options.march}"
+        return local.env(
+            CFLAGS=f"{local.env.get('CFLAGS', '')} {extra_cflags}",
+            LDFLAGS=f"{local.env.get('LDFLAGS', '')} {extra_ldflags}",
+            PKG_CONFIG=os.path.join(self.__pkg_config_shim_dir, "bin", "pkg-config"),
+            PKG_CONFIG_LIBDIR=self.__pkg_config_libdir,
+            **env,
+        )
+
+    @property
+    def __prefixes(self) -> List[str]:
+        """
+        Return prefixes the builds look for libraries in, a variant build
+        looks in its own one first
+        """
+        if self.__shared_release_dir is None:
+            return [self.release_dir]
+        return [self.release_dir, self.__shared_release_dir]
+
+    @property
+    def __pkg_config_libdir(self) -> str:
+        """
+        Return PKG_CONFIG_LIBDIR of the builds
+        """
+        return os.pathsep.join(f"{_}/lib/pkgconfig" for _ in self.__prefixes)
+
+    @property
+    def __pkg_config_shim_dir(self) -> str:
+        """
+        Return directory of the pkg-config shim, its index and fixups
+        """
+        return os.path.join(self.target_dir, "pkg-config-shim")
+
+    def __install_pkg_config_shim(self) -> None:
+        """
+        Put the pkg-config shim first in PATH, with the fixups of every
+        library
+        """
+        fixups: Dict[str, dict] = {}
+        for library_obj in self.__library_mgr.data.values():
+            fixups.update(library_obj.pkg_config_fixups)
+        shim = install_shim(
+            self.__pkg_config_shim_dir, fixups, self.__pkg_config_libdir
+        )
+        add_path(os.path.dirname(shim))
+
+    def __link_time_optimisation(self) -> Optional["lto.LinkTimeOptimisation"]:
+        """
+        Return LTO of the builds if enabled, exit if its archiver tools are
+        missing
+        """
+        if not self._options.lto:
+            return None
+        link_time = lto.LinkTimeOptimisation(dict(local.env))
+        missing = link_time.missing_tools()
+        if missing:
+            print(f"LTO needs {', '.join(missing)}, install them or build without --lto")
+            sys.exit(1)
+        return link_time
+
+    def __measure_baseline(self, graph: BuildGraph, report) -> None:
+        """
+        Measure the ffmpeg binary about to be replaced by an LTO build, if
+        it was built without LTO
+
+        Parameters
+        ----------
+        graph : BuildGraph
+            Libraries to build
+        report : BinaryReport
+            Measurements
+        """
+        binary = os.path.join(self.bin_dir, "ffmpeg")
+        fingerprint = self.__library_mgr.get_library("ffmpeg").built_fingerprint()
+        if (
+            "ffmpeg" not in graph.nodes
+            or not os.path.isfile(binary)
+            or fingerprint is None
+            or fingerprint in (report.fingerprint("lto"), report.fingerprint("baseline"))
+        ):
+            return
+        print_block(f"Measuring {binary} built without LTO")
+        report.record("baseline", fingerprint, binary)
+
+    def __report_lto(self, graph: BuildGraph, report) -> None:
+        """
+        Measure the ffmpeg binary built with LTO and print it against the
+        baseline
+
+        Parameters
+        ----------
+        graph : BuildGraph
+            Built libraries
+        report : BinaryReport
+            Measurements
+        """
+        binary = os.path.join(self.bin_dir, "ffmpeg")
+        if "ffmpeg" not in graph.nodes or not os.path.isfile(binary):
+            return
+        fingerprint = self.__graph.fingerprints["ffmpeg"]
+        if fingerprint != report.fingerprint("lto"):
+            report.record("lto", fingerprint, binary)
+        print_header("LTO ffmpeg against the last build without LTO:")
+        print_block(*report.lines())
+
+    def __build_march_variants(self, cpu_flags: Dict[str, List[str]]) -> None:
+        """
+        Build the variant libraries once per -march on top of the shared
+        ones, then put launchers of their programs in the bin dir
+
+        Parameters
+        ----------
+        cpu_flags : Dict[str, List[str]]
+            CPU flags every -march needs
+        """
+        for march in cpu_flags:
+            print_header(f"Building -march={march} variant")
+            Builder(
+                replace(
+                    self._options,
+                    target_dir=variants.variant_dir(self.target_dir, march),
+                    release_dir=variants.variant_dir(self.release_dir, march),
+                    march_variants=(),
+                    march=march,
+                ),
+                shared_release_dir=self.release_dir,
+            ).build()
+        programs = None
+        for march in cpu_flags:
+            bin_dir = os.path.join(
+                variants.variant_dir(self.release_dir, march), self._options.bin_dir
+            )
+            found = {
+                name
+                for name in (os.listdir(bin_dir) if os.path.isdir(bin_dir) else [])
+                if os.access(os.path.join(bin_dir, name), os.X_OK)
+            }
+            programs = found if programs is None else programs & found
+        for name in sorted(programs):
+            variants.write_launcher(
+                self.release_dir,
+                os.path.join(self._options.bin_dir, name),
+                list(cpu_flags.items()),
+            )
+        print_header("-march variants:")
+        print_block(
+            *[f"{march}: {' '.join(flags) or '-'}" for march, flags in cpu_flags.items()],
+            f"Launchers picking one for the CPU: {', '.join(sorted(programs)) or '-'}",
+        )
+
+    def __resolve(self) -> BuildGraph:
+        """
+        Resolve the graph of the libraries to build, exit if it's invalid
+        """
+        try:
+            return self.__graph.resolve()
+        except DependencyError as err:
+            print(err)
+            sys.exit(1)
+
+    def __compiler_cache(self) -> Optional[compiler_cache.CompilerCache]:
+        """
+        Return compiler cache of the build, None if disabled
+        """
+        if not self._options.compiler_launcher:
+            return None
+        return compiler_cache.CompilerCache(
+            self._options.compiler_launcher,
+            self._options.cache_dir,
+            os.path.commonpath([self.target_dir, self.release_dir]),
+        )
+
+    def __source_state(self, library_obj) -> str:
+        """
+        Return where the library source would come from
+
+        Parameters
+        ----------
+        library_obj : Library
+            Library
+
+        Returns
+        -------
+        str
+            "downloaded", "source cache" or "download"
+        """
+        url = library_obj.download_params[0]
+        if os.path.exists(
+            archive_path(self.target_dir, *library_obj.download_params[1:])
+        ):
+            return "downloaded"
+        if self.source_cache_dir is not None and SourceCache(
+            self.source_cache_dir, read_only=True
+        ).lookup(url, library_obj.sha256):
+            return "source cache"
+        return "download"
+
+    def __dry_run_library(
+        self, lib_name: str, graph: BuildGraph, log: dry_run.CommandLog
+    ) -> dict:
+        """
+        Run the hooks and build steps of a library with the commands and
+        file edits recorded instead of executed
+
+        Parameters
+        ----------
+        lib_name : str
+            Library name
+        graph : BuildGraph
+            Libraries to build
+        log : CommandLog
+            Active command log
+
+        Returns
+        -------
+        dict
+            Library report
+        """
+        library_obj = self.__library_mgr.get_library(lib_name)
+        lib_build_dir = os.path.join(self.target_dir, library_obj.folder_name)
+        log.start(lib_name, lib_build_dir)
+        fingerprint = self.__graph.fingerprints[lib_name]
+        result = {
+            "name": lib_name,
+            "build_dir": lib_build_dir,
+            "dependencies": graph.nodes[lib_name],
+            "state": "stale" if library_obj.built_fingerprint() is not None else "new",
+            "fingerprint": fingerprint,
+            "url": library_obj.download_params[0],
+            "source": self.__source_state(library_obj),
+            "artifact_cached": False,
+            "error": None,
+        }
+        try:
+            library_obj.pre_configure()
+            result["artifact_cached"] = (
+                self.__artifact_cache is not None
+                and self.__artifact_cache.contains(
+                    artifact_key(library_obj, fingerprint)
+                )
+            )
+            link_time = lto.active() if library_obj.lto else None
+            if not result["artifact_cached"]:
+                with local.env(**(link_time.env(local.env) if link_time else {})):
+                    self.__configure_and_install(lib_name, nullcontext())
+        except Exception as err:  # pylint: disable=broad-except
+            # Hooks reading the source tree stop here
+            result["error"] = f"{type(err).__name__}: {err}"
+        result["steps"] = log.entries(lib_name)
+        return result
+
+    @staticmethod
+    def __print_dry_run(report: dict, base_env: Dict[str, str]) -> None:
+        """
+        Print dry run report as text
+
+        Parameters
+        ----------
+        report : dict
+            Dry run report
+        base_env : Dict[str, str]
+            Environment of the build, only differences are shown per command
+        """
+        print_header("Build order:")
+        print_block(str(report["order"]))
+        print_header("Build environment:")
+        print_block(*[f"{name}={value}" for name, value in base_env.items() if value])
+        for library in report["libraries"]:
+            state = library["state"]
+            if library["artifact_cached"]:
+                state += ", restored from artifact cache"
+            lines = [
+                f"Build dir: {library['build_dir']}",
+                f"Dependencies: {', '.join(library['dependencies']) or '-'}",
+                f"Source: {library['source']} {library['url']}",
+            ]
+            for step in library["steps"]:
+                if "edit" in step:
+                    lines.append(f"  {step['edit']} {step['path']}")
+                    continue
+                env = [
+                    f"{name}={shlex.quote(value)}"
+                    for name, value in step["env"].items()
+                    if base_env.get(name) != value
+                ]
+                lines.append(
+                    "  $ " + " ".join(env + [shlex.quote(_) for _ in step["command"]])
+                )
+            if library["error"]:
+                lines.append(f"  Stopped, a hook needs the source tree: {library['error']}")
+            print_header(f"{library['name']} ({state})")
+            print_block(*lines)
+        print_block(
+            f"Libraries to build: {len(report['libraries'])}",
+            f"Up to date: {', '.join(report['up_to_date']) or '-'}",
+            f"Archives to download: {len(report['downloads'])}",
+        )
+        if report["march_variants"]["variants"]:
+            print_block(
+                "Built afterwards once per -march "
+                f"({', '.join(report['march_variants']['variants'])}): "
+                f"{', '.join(report['march_variants']['libraries'])}"
+            )
+
+    def __dry_run_libraries(self, graph: BuildGraph, order: List[str]) -> List[dict]:
+        """
+        Dry run every library of the graph in build order
+
+        Parameters
+        ----------
+        graph : BuildGraph
+            Libraries to build
+        order : List[str]
+            Build order
+
+        Returns
+        -------
+        List[dict]
+            Library reports
+        """
+        self.__update_job_limits(
+            graph, BuildHistory(self._options.cache_dir, read_only=True)
+        )
+        cache = self.__compiler_cache()
+        log = dry_run.CommandLog()
+        compiler_cache.activate(cache)
+        lto.activate(self.__link_time_optimisation())
+        dry_run.activate(log)
+        # Hooks run in an empty dir instead of the source tree
+        scratch_dir = tempfile.mkdtemp(prefix="ffmpeg-builder-dry-run-")
+        try:
+            with local.env(**(cache.env() if cache else {})), local.cwd(scratch_dir):
+                return [
+                    self.__dry_run_library(lib_name, graph, log) for lib_name in order
+                ]
+        finally:
+            dry_run.activate(None)
+            lto.activate(None)
+            compiler_cache.activate(None)
+            rmtree(scratch_dir, ignore_errors=True)
+
+    def dry_run(self, output_format: str = "text") -> None:
+        """
+        Resolve the build graph and print what the build would run, without
+        running or downloading anything
+
+        Parameters
+        ----------
+        output_format : str (default "text")
+            "text" or "json"
+
+        Returns
+        -------
+        None
+        """
+        add_path(self.bin_dir)
+        # Only the report goes to stdout
+        with self.__build_env(), redirect_stdout(sys.stderr):
+            try:
+                graph = self.__graph.resolve()
+                order = graph.topological_order()
+            except DependencyError as err:
+                error = str(err)
+            else:
+                error = None
+                base_env = {name: local.env.get(name, "") for name in dry_run.RECORDED_ENV}
+                libraries = self.__dry_run_libraries(graph, order)
+        if error is not None:
+            print(json.dumps({"error": error}) if output_format == "json" else error)
+            sys.exit(1)
+        report = {
+            "targets": self._options.targets,
+            "order": order,
+            "libraries": libraries,
+            "up_to_date": [_ for _ in self._options.targets if _ not in graph.nodes],
+            "downloads": [
+                library["url"]
+                for library in libraries
+                if library["source"] == "download"
+            ],
+            "march_variants": {
+                "variants": list(self._options.march_variants),
+                "libraries": sorted(self.__march_libraries),
+            },
+        }
+        if output_format == "json":
+            print(json.dumps(report, indent=2))
+            return
+        self.__print_dry_run(report, base_env)
+
+    def plan(self) -> None:
+        """
+        Print the predicted schedule, the critical path and the makespan
+        from the durations of the previous builds
+
+        Returns
+        -------
+        None
+        """
+        add_path(self.bin_dir)
+        with self.__build_env():
+            graph = self.__resolve()
+        history = BuildHistory(self._options.cache_dir, read_only=True)
+        durations = history.estimates(graph.nodes)
+        scheduler = Scheduler(
+            graph,
+            self.__build_library,
+            self._options.parallel_builds,
+            graph.priorities(durations),
+        )
+        schedule = scheduler.simulate(durations)
+        print_header(f"Plan with {self._options.parallel_builds} parallel builds:")
+        print_block(
+            *[
+                f"{start:8.1f}s - {finish:8.1f}s  {lib_name}"
+                + ("" if history.duration(lib_name) is not None else " (no history)")
+                for lib_name, (start, finish) in sorted(
+                    schedule.items(), key=lambda item: item[1]
+                )
+            ]
+        )
+        critical_path = graph.critical_path(durations)
+        print_block(
+            "Critical path: " + " -> ".join(critical_path),
+            f"Critical path length: {sum(durations[_] for _ in critical_path):.1f}s",
+            f"Predicted makespan: {max((_ for _, _ in schedule.values()), default=0):.1f}s",
+        )
+
+    def build(self) -> None:
+        """
+        Function to start building
+
+        Parameters
+        ----------
+        slavery_mode: bool (default False)
+            Is slavery mode
+        build_static_ffmpeg: bool (default False)
+            Is build static ffmpeg
+
+        Returns
+        -------
+        None
+        """
+        print_header("Building process started")
+        mkdir(self.target_dir)
+        mkdir(self.release_dir)
+        add_path(self.bin_dir)
+        # Source trees and the release dir outlive a build, so do their patches
+        activate_patch_records(os.path.join(self.target_dir, "patches.json"))
+        share_rate_limit(os.path.join(self.target_dir, "download-rate.json"))
+        self.__install_pkg_config_shim()
+        # Checked before building anything
+        compiler = (local.env.get("CC") or "cc").split()[-1]
+        cpu_flags = {
+            march: variants.cpu_flags(compiler, march)
+            for march in self._options.march_variants
+        }
+
+        with self.__build_env():
+            graph = self.__resolve()
+            history = BuildHistory(self._options.cache_dir)
+            priorities = graph.priorities(history.estimates(graph.nodes))
+            if self._options.ram_dir:
+                self.__ram_disk = RamDisk(
+                    self._options.ram_dir, self.target_dir, self._options.ram_budget
+                )
+                self.__work_sizes = {_: history.work_size(_) for _ in graph.nodes}
+                print_block(
+                    f"Building in {self.__ram_disk.root}, "
+                    f"up to {self.__ram_disk.budget / 1024**2:.0f}M"
+                )
+            governor = MemoryGovernor(
+                self.__memory_estimates(graph, history),
+                self._options.memory_limit / 1024**2 if self._options.memory_limit else None,
+                self._options.memory_pressure_limit,
+                self.__ram_disk.budget / 1024**2 if self.__ram_disk else 0,
+            )
+            scheduler = Scheduler(
+                graph,
+                self.__build_library,
+                self._options.parallel_builds,
+                priorities,
+                governor,
+            )
+            self.__update_job_limits(graph, history)
+            print_header("Build order:")
+            print_block(str(sorted(graph.nodes, key=lambda _: -priorities[_])))
+            if self.__job_limits:
+                print_header("Limited parallel jobs:")
+                print_block(
+                    *[f"{name}: {jobs}" for name, jobs in sorted(self.__job_limits.items())]
+                )
+            tracer = tracing.Tracer(
+                os.path.join(self.target_dir, ".build-events.jsonl")
+            )
+            tracing.activate(tracer)
+            build_log.activate(
+                build_log.BuildLogs(
+                    os.path.join(self.target_dir, "logs"),
+                    self._options.compress_logs,
+                    self._options.log_tail_lines,
+                    self._options.parallel_builds > 1,
+                )
+            )
+            prefetcher = None
+            if self._options.prefetch_workers:
+                prefetcher = Prefetcher(
+                    self.target_dir,
+                    [
+                        (library_obj.download_params, library_obj.sha256)
+                        for library_obj in map(
+                            self.__library_mgr.get_library, graph.topological_order()
+                        )
+                    ],
+                    self._options.prefetch_workers,
+                    self._options.download_rate_limit,
+                    self.source_cache_dir,
+                    self._options.verify_downloads,
+                    # Extracting into RAM waits for the budget
+                    self.__ram_disk is None,
+                )
+                prefetcher.start()
+            server = (
+                jobserver.Jobserver(self._options.threads)
+                if self._options.jobserver and jobserver.Jobserver.is_supported()
+                else None
+            )
+            jobserver.activate(server)
+            link_time = self.__link_time_optimisation()
+            lto.activate(link_time)
+            report = lto.BinaryReport(self._options.cache_dir)
+            if link_time is not None:
+                self.__measure_baseline(graph, report)
+            # Keyed on the flags before adding the compiler launcher
+            autoconf_cache.activate(
+                autoconf_cache.ConfigCache(
+                    self._options.cache_dir,
+                    {
+                        **dict(local.env),
+                        **(link_time.env(local.env) if link_time else {}),
+                    },
+                    self.release_dir,
+                )
+                if self._options.config_cache
+                else None
+            )
+            cache = self.__compiler_cache()
+            compiler_cache.activate(cache)
+            try:
+                # Set after resolving, the launcher doesn't change fingerprints
+                with local.env(**(cache.env() if cache else {})):
+                    scheduler.run()
+                if cache is not None and cache.launcher == "sccache":
+                    print_header("sccache statistics:")
+                    print_block(cache.report() or "unavailable")
+                if link_time is not None:
+                    self.__report_lto(graph, report)
+            finally:
+                tracing.activate(None)
+                build_log.activate(None)
+                compiler_cache.activate(None)
+                autoconf_cache.activate(None)
+                lto.activate(None)
+                jobserver.activate(None)
+                if server is not None:
+                    server.close()
+                if prefetcher is not None:
+                    prefetcher.stop()
+                if self.__ram_disk is not None:
+                    self.__ram_disk.close()
+                history.record(tracer.events(), self._options.threads, governor.peaks)
+                trace_path = os.path.join(self.target_dir, "build-trace.json")
+                tracer.export(trace_path)
+                print_header("Build time summary:")
+                print_block(
+                    *tracer.summary(),
+                    f"Timeline for chrome://tracing or Perfetto: {trace_path}",
+                )
+
+        if self.__shared_release_dir is not None:
+            return
+        if cpu_flags:
+            self.__build_march_variants(cpu_flags)
+        print_block()
+        print_block(
+            f"Finished: {self.release_dir}/bin/ffmpeg",
+            "You can check correctness of this build by running: "
+            f"{self.release_dir}/bin/ffmpeg -version",
+            "Study the protocols list carefully (e.g, look for rtmps): "
+            f"{self.release_dir}/bin/ffmpeg -protocols",
+            "Enable it temporary in the command line by running: "
+            f"export PATH={self.release_dir}/bin:$PATH",
+        )
@@ -0,0 +1,188 @@
+"""
+Compiler launcher (ccache or sccache) shared by every build started by the
+builder
+"""
+from typing import Dict, Optional, Tuple
+import logging
+import os
+import os.path
+import plumbum
+
+logger = logging.getLogger(__name__)
+
+HIT_COUNTERS = ("direct_cache_hit", "preprocessed_cache_hit")
+MISS_COUNTERS = ("cache_miss",)
+
+_ACTIVE: Optional["CompilerCache"] = None
+
+
+class CompilerCache:
+    """
+    Compile through ccache or sccache
+
+    Autotools, meson and the custom configurations get the launcher through
+    CC/CXX, cmake through CMAKE_<LANG>_COMPILER_LAUNCHER as it expects CC to
+    be the compiler alone.
+    """
+
+    def __init__(self, launcher: str, cache_dir: str, base_dir: Optional[str] = None):
+        self.__launcher = launcher
+        self.__cache_dir = os.path.join(cache_dir, launcher)
+        self.__base_dir = base_dir
+        env = plumbum.local.env
+        # ccache and sccache create their directory when first compiling
+        self.__compilers = (env.get("CC", "cc"), env.get("CXX", "c++"))
+
+    @property
+    def launcher(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Launcher command
+        """
+        return self.__launcher
+
+    @property
+    def compilers(self) -> Tuple[str, str]:
+        """
+        Returns
+        -------
+        Tuple[str, str]
+            C and C++ compilers without the launcher
+        """
+        return self.__compilers
+
+    def env(self) -> Dict[str, str]:
+        """
+        Return environment routing the compilers through the launcher
+
+        Returns
+        -------
+        Dict[str, str]
+        """
+        c_compiler, cxx_compiler = self.__compilers
+        env = {
+            "CC": f"{self.__launcher} {c_compiler}",
+            "CXX": f"{self.__launcher} {cxx_compiler}",
+        }
+        if self.__launcher == "sccache":
+            env["SCCACHE_DIR"] = self.__cache_dir
+            return env
+        env["CCACHE_DIR"] = self.__cache_dir
+        if self.__base_dir is not None:
+            # Paths below base dir are hashed relative, so moved checkouts hit
+            env["CCACHE_BASEDIR"] = self.__base_dir
+        return env
+
+    def cmake_args(self) -> Tuple[str, ...]:
+        """
+        Return cmake arguments setting the launcher
+
+        Returns
+        -------
+        Tuple[str, ...]
+        """
+        return (
+            f"-DCMAKE_C_COMPILER_LAUNCHER={self.__launcher}",
+            f"-DCMAKE_CXX_COMPILER_LAUNCHER={self.__launcher}",
+        )
+
+    def stats_env(self, log_path: str) -> Dict[str, str]:
+        """
+        Return environment recording the result of every compilation
+
+        Parameters
+        ----------
+        log_path: str
+            Log file, recreated for every library
+
+        Returns
+        -------
+        Dict[str, str]
+            Empty for sccache, its statistics only exist per server
+        """
+        if self.__launcher != "ccache":
+            return {}
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        return {"CCACHE_STATSLOG": log_path}
+
+    @staticmethod
+    def library_stats(log_path: str) -> Optional[str]:
+        """
+        Summarize a ccache stats log
+
+        Parameters
+        ----------
+        log_path: str
+            Log file written while building the library
+
+        Returns
+        -------
+        Optional[str]
+            None if nothing was compiled through ccache
+        """
+        compilations = hits = misses = 0
+        try:
+            with open(log_path, encoding="utf-8", errors="replace") as file:
+                for line in file:
+                    line = line.strip()
+                    if line.startswith("#"):
+                        compilations += 1
+                    elif line in HIT_COUNTERS:
+                        hits += 1
+                    elif line in MISS_COUNTERS:
+                        misses += 1
+        except FileNotFoundError:
+            return None
+        if not compilations:
+            return None
+        cacheable = hits + misses
+        rate = f" ({hits * 100 // cacheable}% hit rate)" if cacheable else ""
+        return (
+            f"ccache: {hits} hits, {misses} misses, "
+            f"{compilations - cacheable} uncacheable{rate}"
+        )
+
+    def report(self) -> Optional[str]:
+        """
+        Return statistics of the whole cache
+
+        Returns
+        -------
+        Optional[str]
+        """
+        try:
+            return plumbum.local[self.__launcher]["--show-stats"].with_env(
+                **self.env()
+            )().strip()
+        except (
+            plumbum.commands.CommandNotFound,
+            plumbum.commands.ProcessExecutionError,
+        ):
+            logger.debug("Can't read %s statistics", self.__launcher)
+            return None
+
+
+def activate(cache: Optional[CompilerCache]) -> None:
+    """
+    Set compiler cache used by build_utils
+
+    Parameters
+    ----------
+    cache: Optional[CompilerCache]
+        Compiler cache or None to disable it
+    """
+    global _ACTIVE  # pylint: disable=global-statement
+    _ACTIVE = cache
+
+
+def active() -> Optional[CompilerCache]:
+    """
+    Returns
+    -------
+    Optional[CompilerCache]
+        Compiler cache used by build_utils
+    """
+    return _ACTIVE
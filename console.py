@@ -0,0 +1,87 @@
+"""
+Formatted output of the builder
+"""
+from typing import Iterable
+
+
+# Pseudographics
+BOLD_SEPARATOR = "======================================="
+ITALIC_SEPARATOR = "---------------------------------------"
+
+
+def lookahead(iterable: Iterable) -> tuple:
+    """
+    Lookahead function
+
+    Parameters
+    ----------
+    iterable: Iterable
+        Iterable value
+
+    Returns
+    -------
+    tuple
+    """
+    it = iter(iterable)
+    try:
+        last = next(it)
+    except StopIteration:
+        return
+    for value in it:
+        yield last, True
+        last = value
+    yield last, False
+
+
+def print_lines(*strings) -> None:
+    """
+    Print strings line by line
+
+    Parameters
+    ----------
+    *strings
+        List of string
+
+    Returns
+    -------
+    None
+    """
+    to_print = ""
+    for line, has_more in lookahead(strings):
+        to_print = to_print + line + ("\n" if has_more else "")
+    print(to_print)
+
+
+def print_header(*strings) -> None:
+    """
+    Print strings with italic separator and line by line
+
+    Parameters
+    ----------
+    *strings
+        List of string
+
+    Returns
+    -------
+    None
+    """
+    to_print = strings + (ITALIC_SEPARATOR,)
+    print_lines(*to_print)
+
+
+def print_block(*strings) -> None:
+    """
+    Print strings with bold separator and line by line
+
+    Parameters
+    ----------
+    *strings
+        List of string
+
+    Returns
+    -------
+    None
+    """
+    to_print = strings + (BOLD_SEPARATOR,)
+    print_lines(*to_print)
+    print()
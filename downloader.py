@@ -0,0 +1,362 @@
+"""
+Download and extract library sources
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import logging
+import multiprocessing
+import os
+import os.path
+import signal
+import threading
+from extractor import StreamingExtractor, extract, remove_partial_extractions
+from file_utils import file_lock, mkdir
+from http_client import DownloadError, HttpClient
+from source_cache import (
+    ChecksumError,
+    HashingWriter,
+    SourceCache,
+    file_sha256,
+    link_file,
+    remove_partial_downloads,
+)
+import tracing
+
+logger = logging.getLogger(__name__)
+
+_CLIENTS: Dict[tuple, HttpClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+# Bucket of the bandwidth cap shared by the processes, see share_rate_limit
+_RATE_STATE: Optional[str] = None
+
+
+def share_rate_limit(state_path: Optional[str]) -> None:
+    """
+    Share the bandwidth cap with the processes forked from now on, the
+    prefetcher and the builds download under one cap
+
+    Parameters
+    ----------
+    state_path: Optional[str]
+        File holding the bucket, None for a cap per process
+    """
+    global _RATE_STATE  # pylint: disable=global-statement
+    _RATE_STATE = state_path
+    if state_path is not None and os.path.exists(state_path):
+        # Left by an earlier run
+        os.remove(state_path)
+
+
+def get_client(rate_limit: int = 0, verify: bool = True) -> HttpClient:
+    """
+    Return HTTP client shared by every download of this process, so the
+    connections and the circuit breakers are shared too. The bandwidth cap
+    is shared by the processes once share_rate_limit was called.
+
+    Parameters
+    ----------
+    rate_limit: int (default 0)
+        Maximum bytes per second, 0 means unlimited
+    verify: bool (default True)
+        Verify TLS certificates
+
+    Returns
+    -------
+    HttpClient
+    """
+    with _CLIENTS_LOCK:
+        key = (os.getpid(), rate_limit, verify)
+        if key not in _CLIENTS:
+            _CLIENTS[key] = HttpClient(
+                rate_limit=rate_limit, verify=verify, rate_state=_RATE_STATE
+            )
+        return _CLIENTS[key]
+
+
+def fetch(
+    url: str,
+    path: str,
+    rate_limit: int = 0,
+    sha256: Optional[str] = None,
+    cache: Optional[SourceCache] = None,
+    extract_dir: Optional[str] = None,
+    verify: bool = True,
+) -> bool:
+    """
+    Download file, the file only appears at its path once complete and
+    verified. The archive is extracted while it downloads if extract_dir is
+    set.
+
+    Parameters
+    ----------
+    url: str
+        Download url
+    path: str
+        Destination path
+    rate_limit: int (default 0)
+        Maximum bytes per second, 0 means unlimited
+    sha256: Optional[str]
+        Expected checksum
+    cache: Optional[SourceCache]
+        Shared source cache
+    extract_dir: Optional[str]
+        Directory to extract the archive into
+    verify: bool (default True)
+        Verify TLS certificates
+
+    Returns
+    -------
+    bool
+        Return True if success
+    """
+    if cache is not None:
+        cached_path = cache.lookup(url, sha256)
+        if cached_path is not None:
+            link_file(cached_path, path)
+            print(f"Source file found in cache: {url}")
+            return extract_dir is None or extract(path, extract_dir)
+
+    tmp_dir = cache.tmp_dir if cache is not None else os.path.dirname(path)
+
+    def open_sinks() -> list:
+        sinks = [HashingWriter(tmp_dir, sha256)]
+        if extract_dir is not None:
+            sinks.append(StreamingExtractor(extract_dir, os.path.basename(path)))
+        return sinks
+
+    def write(chunk: bytes) -> None:
+        for sink in sinks:
+            sink.write(chunk)
+
+    def restart() -> None:
+        for sink in sinks:
+            sink.abort()
+        sinks[:] = open_sinks()
+
+    sinks = open_sinks()
+    print(f"Downloading {url}")
+    try:
+        get_client(rate_limit, verify).download(url, write, restart)
+        tmp_path, content_sha256 = sinks[0].finish()
+    except (DownloadError, ChecksumError) as err:
+        for sink in sinks:
+            sink.abort()
+        print(f"Downloading failed: {url}: {err}")
+        return False
+    if cache is not None:
+        link_file(cache.store(url, tmp_path, content_sha256), path)
+    else:
+        os.replace(tmp_path, path)
+    print(f"Successfuly downloaded: {url}")
+    return all(sink.close(path) for sink in sinks[1:])
+
+
+def archive_path(
+    target_dir: str, dest_name: str, alternative_dir: Optional[str] = None
+) -> str:
+    """
+    Return path the library archive is downloaded to
+
+    Parameters
+    ----------
+    target_dir: str
+        Target directory
+    dest_name: str
+        File name
+    alternative_dir: Optional[str]
+        Custom dir name when extract
+
+    Returns
+    -------
+    str
+    """
+    if alternative_dir is not None:
+        return os.path.join(target_dir, alternative_dir, dest_name)
+    return os.path.join(target_dir, dest_name)
+
+
+def prepare_source(
+    target_dir: str,
+    url: str,
+    dest_name: str,
+    alternative_dir: Optional[str] = None,
+    rate_limit: int = 0,
+    sha256: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    verify: bool = True,
+    work_dir: Optional[str] = None,
+    extract_source: bool = True,
+) -> bool:
+    """
+    Download and extract library source if it's not done yet
+
+    Parameters
+    ----------
+    target_dir: str
+        Target directory
+    url: str
+        Download url
+    dest_name: str
+        File name
+    alternative_dir: Optional[str]
+        Custom dir name when extract
+    rate_limit: int (default 0)
+        Maximum bytes per second, 0 means unlimited
+    sha256: Optional[str]
+        Expected checksum of the archive
+    cache_dir: Optional[str]
+        Directory of the shared source cache, None disables the cache
+    verify: bool (default True)
+        Verify TLS certificates
+    work_dir: Optional[str]
+        Directory to extract the source into, the target directory if None
+    extract_source: bool (default True)
+        Extract the archive, or only download it
+
+    Returns
+    -------
+    bool
+        Return True if success
+    """
+    cache = SourceCache(cache_dir) if cache_dir else None
+    base_path = archive_path(target_dir, dest_name, alternative_dir)
+    download_path = os.path.dirname(base_path)
+    extract_path = os.path.dirname(
+        archive_path(work_dir or target_dir, dest_name, alternative_dir)
+    )
+    for path in (download_path, extract_path):
+        if not os.path.isdir(path):
+            mkdir(path)
+
+    extracted_marker = os.path.join(extract_path, f".{dest_name}.extracted")
+    # The prefetcher and a build never download the same archive twice
+    with file_lock(f"{base_path}.lock"):
+        if extract_source and os.path.exists(extracted_marker):
+            print(f"Source file already downloaded: {url}")
+            return True
+        if os.path.exists(base_path) and sha256 is not None:
+            cached_path = cache.lookup(url, sha256) if cache is not None else None
+            if not (cached_path and cache.is_same(cached_path, base_path)) and (
+                file_sha256(base_path) != sha256.lower()
+            ):
+                print(f"Checksum mismatch, downloading again: {base_path}")
+                os.remove(base_path)
+        if os.path.exists(base_path):
+            if not extract_source:
+                return True
+            with tracing.phase("extract", archive=dest_name):
+                if not extract(base_path, extract_path):
+                    return False
+        else:
+            # Extraction overlaps with the download
+            with tracing.phase("download", url=url):
+                if not fetch(
+                    url,
+                    base_path,
+                    rate_limit,
+                    sha256,
+                    cache,
+                    extract_path if extract_source else None,
+                    verify,
+                ):
+                    return False
+            if not extract_source:
+                return True
+        with open(extracted_marker, "w", encoding="utf-8") as file:
+            file.close()
+    return True
+
+
+class Prefetcher:
+    """
+    Prepare the sources of every planned library in the background, only
+    downloaded if the builds extract them somewhere else
+    """
+
+    def __init__(
+        self,
+        target_dir: str,
+        sources: List[tuple],
+        workers: int,
+        rate_limit: int = 0,
+        cache_dir: Optional[str] = None,
+        verify: bool = True,
+        extract_sources: bool = True,
+    ):
+        self.__target_dir = target_dir
+        self.__sources = sources
+        self.__workers = max(1, workers)
+        self.__rate_limit = rate_limit
+        self.__cache_dir = cache_dir
+        self.__verify = verify
+        self.__extract_sources = extract_sources
+        self.__process = None
+
+    def __prepare(self, download_params: list, sha256: Optional[str]) -> None:
+        """
+        Prepare one source, errors are left for the build to report
+        """
+        try:
+            prepare_source(
+                self.__target_dir,
+                *download_params,
+                rate_limit=self.__rate_limit,
+                sha256=sha256,
+                cache_dir=self.__cache_dir,
+                verify=self.__verify,
+                extract_source=self.__extract_sources,
+            )
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Prefetching %s failed", download_params[0])
+
+    def __run(self, own_process: bool = False) -> None:
+        """
+        Prepare every source on the thread pool
+        """
+        tracer = tracing.active()
+        if tracer is not None and own_process:
+            tracer.track = "prefetch"
+        if own_process:
+            signal.signal(signal.SIGTERM, self.__terminated)
+        with ThreadPoolExecutor(max_workers=self.__workers) as executor:
+            for download_params, sha256 in self.__sources:
+                executor.submit(self.__prepare, download_params, sha256)
+
+    @staticmethod
+    def __terminated(*_) -> None:
+        """
+        Leave no partial download in the cache, nor partial source tree,
+        when stopped
+        """
+        remove_partial_downloads()
+        remove_partial_extractions()
+        os._exit(1)  # pylint: disable=protected-access
+
+    def start(self) -> None:
+        """
+        Start prefetching
+
+        The thread pool runs in its own process, so the builds forked by the
+        scheduler never inherit a thread that is in the middle of a download.
+        """
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            self.__process = context.Process(
+                target=self.__run, kwargs={"own_process": True}, name="prefetch"
+            )
+        else:
+            self.__process = threading.Thread(
+                target=self.__run, name="prefetch", daemon=True
+            )
+        self.__process.start()
+
+    def stop(self) -> None:
+        """
+        Stop prefetching, unfinished downloads are picked up by the builds
+        and their partial files removed
+        """
+        if isinstance(self.__process, multiprocessing.process.BaseProcess):
+            if self.__process.is_alive():
+                self.__process.terminate()
+            self.__process.join()
+        self.__process = None
@@ -0,0 +1,118 @@
+"""
+Record the commands and file edits of a build instead of running them
+"""
+from typing import Dict, List, Optional
+
+# Environment shown with every recorded command
+RECORDED_ENV = (
+    "CC",
+    "CXX",
+    "CFLAGS",
+    "CXXFLAGS",
+    "LDFLAGS",
+    "AR",
+    "RANLIB",
+    "NM",
+    "PKG_CONFIG",
+    "PKG_CONFIG_LIBDIR",
+)
+
+_ACTIVE: Optional["CommandLog"] = None
+
+
+class CommandLog:
+    """
+    Commands and file edits per library, in the order the build would run
+    them
+    """
+
+    def __init__(self):
+        self.__entries: Dict[str, List[dict]] = {}
+        self.__library = ""
+        self.__cwd = ""
+
+    def start(self, lib_name: str, cwd: str) -> None:
+        """
+        Record the following entries for a library
+
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+        cwd: str
+            Directory the library is built in
+        """
+        self.__library = lib_name
+        self.__cwd = cwd
+        self.__entries.setdefault(lib_name, [])
+
+    def command(self, argv: List[str], env: Dict[str, str]) -> None:
+        """
+        Record a command
+
+        Parameters
+        ----------
+        argv: List[str]
+            Command and arguments
+        env: Dict[str, str]
+            Environment of the command, only RECORDED_ENV is kept
+        """
+        self.__entries.setdefault(self.__library, []).append(
+            {
+                "command": [str(_) for _ in argv],
+                "cwd": self.__cwd,
+                "env": {name: env[name] for name in RECORDED_ENV if env.get(name)},
+            }
+        )
+
+    def edit(self, action: str, path: str) -> None:
+        """
+        Record a file edit
+
+        Parameters
+        ----------
+        action: str
+            Function of file_utils editing the file
+        path: str
+            Edited file, relative to the build dir unless absolute
+        """
+        self.__entries.setdefault(self.__library, []).append(
+            {"edit": action, "path": path, "cwd": self.__cwd}
+        )
+
+    def entries(self, lib_name: str) -> List[dict]:
+        """
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+
+        Returns
+        -------
+        List[dict]
+            Recorded commands and edits of the library
+        """
+        return self.__entries.get(lib_name, [])
+
+
+def activate(log: Optional[CommandLog]) -> None:
+    """
+    Set log recording the commands instead of running them
+
+    Parameters
+    ----------
+    log: Optional[CommandLog]
+        Command log or None to run commands again
+    """
+    global _ACTIVE  # pylint: disable=global-statement
+    _ACTIVE = log
+
+
+def active() -> Optional[CommandLog]:
+    """
+    Returns
+    -------
+    Optional[CommandLog]
+        Command log recording the commands, None when they run
+    """
+    return _ACTIVE
@@ -0,0 +1,280 @@
+"""
+Extract source archives while their content is still downloading
+"""
+from typing import Optional, Set
+from zipfile import ZipFile
+import logging
+import os
+import os.path
+import queue
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import plumbum
+from build_utils import command_version
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 64
+XZ_MAGIC = b"\xfd7zXZ\x00"
+ZIP_MAGIC = b"PK\x03\x04"
+# Extraction directories of this process not moved into place yet
+_EXTRACTING: Set[str] = set()
+_EXTRACTING_LOCK = threading.Lock()
+
+
+def remove_partial_extractions() -> None:
+    """
+    Remove the directories of the extractions in progress in this process,
+    for a process being stopped
+    """
+    with _EXTRACTING_LOCK:
+        for path in _EXTRACTING:
+            shutil.rmtree(path, ignore_errors=True)
+        _EXTRACTING.clear()
+
+
+class ChunkReader:
+    """
+    File-like object reading the chunks pushed by StreamingExtractor
+    """
+
+    def __init__(self, chunks: queue.Queue):
+        self.__chunks = chunks
+        self.__current = b""
+        self.__pos = 0
+        self.__eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read up to size bytes, blocking until they arrive
+
+        Parameters
+        ----------
+        size: int (default -1)
+            Number of bytes, -1 reads until the end
+
+        Returns
+        -------
+        bytes
+        """
+        parts = []
+        wanted = size
+        while size < 0 or wanted > 0:
+            if self.__pos >= len(self.__current):
+                chunk = None if self.__eof else self.__chunks.get()
+                if chunk is None:
+                    self.__eof = True
+                    break
+                self.__current, self.__pos = chunk, 0
+                continue
+            end = len(self.__current)
+            if size >= 0:
+                end = min(end, self.__pos + wanted)
+                wanted -= end - self.__pos
+            parts.append(self.__current[self.__pos:end])
+            self.__pos = end
+        return b"".join(parts)
+
+
+class StreamingExtractor:
+    """
+    Unpack archive from chunks written while the archive downloads
+
+    Tarballs (plain, gz, bz2 and xz) are unpacked as the chunks arrive, zip
+    archives keep their index at the end so they are unpacked on close.
+    The archive is unpacked into a hidden directory and its entries moved
+    into the destination once complete, an interrupted extraction leaves
+    no partial tree behind.
+    """
+
+    def __init__(self, dest_dir: str, name: str):
+        self.__dest_dir = dest_dir
+        self.__tmp_dir = tempfile.mkdtemp(dir=dest_dir, prefix=".extract-")
+        with _EXTRACTING_LOCK:
+            _EXTRACTING.add(self.__tmp_dir)
+        self.__name = name
+        self.__chunks: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.__threads = []
+        self.__error: Optional[BaseException] = None
+        self.__is_zip = False
+        self.files = 0
+        self.size = 0
+
+    def __extract_tar(self, fileobj, mode: str) -> None:
+        """
+        Unpack tar stream member by member, only counters are kept
+        """
+        try:
+            with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+                extract_kwargs = (
+                    {"filter": "tar"} if hasattr(tarfile, "tar_filter") else {}
+                )
+                for member in tar:
+                    tar.extract(member, self.__tmp_dir, **extract_kwargs)
+                    if member.isfile():
+                        self.files += 1
+                        self.size += member.size
+        except Exception as err:  # pylint: disable=broad-except
+            self.__error = err
+
+    def __start_xz(self) -> None:
+        """
+        Decompress with multithreaded xz and unpack its output
+        """
+        proc = plumbum.local["xz"]["-d", "-T0", "-c"].popen(
+            stdin=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+
+        def feed() -> None:
+            reader = ChunkReader(self.__chunks)
+            try:
+                for chunk in iter(lambda: reader.read(1024 * 1024), b""):
+                    proc.stdin.write(chunk)
+            except BrokenPipeError as err:
+                self.__error = err
+            finally:
+                proc.stdin.close()
+
+        def extract() -> None:
+            self.__extract_tar(proc.stdout, "r|")
+            # Drain the padding after the tar end marker (or the rest of a
+            # broken archive), otherwise xz and the feeder would block
+            for _ in iter(lambda: proc.stdout.read(1024 * 1024), b""):
+                pass
+            if proc.wait() != 0 and self.__error is None:
+                self.__error = RuntimeError("xz failed")
+
+        self.__threads = [threading.Thread(target=feed), threading.Thread(target=extract)]
+
+    def __start(self, magic: bytes) -> None:
+        """
+        Pick the decoder from the first bytes of the archive
+        """
+        if magic.startswith(ZIP_MAGIC):
+            self.__is_zip = True
+            return
+        if magic.startswith(XZ_MAGIC) and command_version("xz") >= (5, 4):
+            # xz 5.4+ decompresses multithreaded, lzma module doesn't
+            self.__start_xz()
+        else:
+            self.__threads = [
+                threading.Thread(
+                    target=self.__extract_tar, args=(ChunkReader(self.__chunks), "r|*")
+                )
+            ]
+        for thread in self.__threads:
+            thread.daemon = True
+            thread.start()
+
+    def write(self, chunk: bytes) -> None:
+        """
+        Push downloaded chunk
+
+        Parameters
+        ----------
+        chunk: bytes
+            Archive content
+        """
+        if not self.__threads and not self.__is_zip:
+            self.__start(chunk[:8])
+        if self.__is_zip:
+            return
+        while any(thread.is_alive() for thread in self.__threads):
+            try:
+                self.__chunks.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def __finish(self) -> None:
+        """
+        Signal end of stream and wait for the unpacking to finish
+        """
+        while any(thread.is_alive() for thread in self.__threads):
+            try:
+                self.__chunks.put(None, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        for thread in self.__threads:
+            thread.join()
+
+    def close(self, archive_path: str) -> bool:
+        """
+        Finish unpacking
+
+        Parameters
+        ----------
+        archive_path: str
+            Complete archive, used by the formats that can't be streamed
+
+        Returns
+        -------
+        bool
+            Return True if success
+        """
+        self.__finish()
+        if self.__is_zip:
+            with ZipFile(archive_path) as myzip:
+                for info in myzip.infolist():
+                    myzip.extract(info, self.__tmp_dir)
+                    if not info.is_dir():
+                        self.files += 1
+                        self.size += info.file_size
+        if self.__error is not None:
+            logger.error("Extracting %s failed: %s", self.__name, self.__error)
+            print(f"Failed to extract {self.__name}")
+            self.__remove()
+            return False
+        for name in os.listdir(self.__tmp_dir):
+            dest = os.path.join(self.__dest_dir, name)
+            # Replaces the tree of an earlier extraction
+            if os.path.isdir(dest) and not os.path.islink(dest):
+                shutil.rmtree(dest)
+            elif os.path.lexists(dest):
+                os.remove(dest)
+            os.replace(os.path.join(self.__tmp_dir, name), dest)
+        self.__remove()
+        print(f"Extracted {self.__name}: {self.files} files, {self.size} bytes")
+        return True
+
+    def abort(self) -> None:
+        """
+        Stop unpacking and drop the partial tree
+        """
+        self.__error = self.__error or RuntimeError("aborted")
+        self.__finish()
+        self.__remove()
+
+    def __remove(self) -> None:
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+        with _EXTRACTING_LOCK:
+            _EXTRACTING.discard(self.__tmp_dir)
+
+
+def extract(path: str, dest_dir: str, chunk_size: int = 1024 * 1024) -> bool:
+    """
+    Extract archive file
+
+    Parameters
+    ----------
+    path: str
+        Archive path
+    dest_dir: str
+        Directory to extract into
+    chunk_size: int (default 1 MiB)
+        Read size
+
+    Returns
+    -------
+    bool
+        Return True if success
+    """
+    extractor = StreamingExtractor(dest_dir, os.path.basename(path))
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            extractor.write(chunk)
+    return extractor.close(path)
@@ -1,67 +1,45 @@
 """Utilities for modifying file"""
+from contextlib import contextmanager
 from pathlib import Path
-from shutil import rmtree
-from typing import Union
+from shutil import copymode, rmtree
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import hashlib
+import json
 import os
 import os.path
+import dry_run
 
+try:
+    import fcntl
+except ImportError:  # Windows without MSYS2 python
+    fcntl = None
 
-def delete_lines(file_path: str, start: int, end: int) -> bool:
-    """
-    Function to delete lines in the file from specific
-    start and specific end
+# sha256 of the files patched since the last take_patched_files call
+_PATCHED: Dict[str, str] = {}
+# JSON file of the patches applied to every file, see activate_patch_records
+_PATCH_RECORDS: Optional[str] = None
 
-    Parameters
-    ----------
-    file_path: str
-        File path in form of string
-    start: int
-        Start line
-    end: int
-        End line
 
-    Returns
-    -------
-    bool
-        Return True if success
-    """
-    with open(file_path, encoding="utf-8") as file:
-        file_read = file.readlines()
-        file.close()
-    with open(file_path, "w", encoding="utf-8") as file:
-        for index, value in enumerate(file_read):
-            if index < start or index > end:
-                file.write(value)
-        file.close()
-    return True
-
-
-def find_string(file_path: str, text: str) -> Union[None, int]:
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
     """
-    Find string in file and return the index
+    Hold an exclusive lock on path while the context is active, locking is
+    skipped on platforms without fcntl
 
     Parameters
     ----------
-    file_path: str
-        File path in form of string
-    text: str
-        Text that you wanna find
-
-    Returns
-    -------
-    None
-        If text not found in file
-    int
-        If text founded in the file
+    path: str
+        Lock file path
     """
-    with open(file_path, encoding="utf-8") as file:
-        index = 0
-        for value in file:
-            if text in value:
-                file.close()
-                return index
-            index += 1
-    return None
+    if fcntl is None:
+        yield
+        return
+    with open(path, "w", encoding="utf-8") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 def mkdir(dir_path: str) -> Union[None, bool]:
@@ -93,31 +71,30 @@ def mkdir(dir_path: str) -> Union[None, bool]:
     return False
 
 
-def replace(file_path: str, old: str, new: str) -> bool:
+def parse_size(size: str) -> int:
     """
-    Replace content inside file
+    Parse size with optional K, M, G or T suffix
 
     Parameters
     ----------
-    file_path: str
-        File path in form of string
-    old: str
-        Old content
-    new: str
-        New content
+    size: str
+        Size, e.g. 512K or 8G
 
     Returns
     -------
-    bool
-        Return True if success
-    """
-    with open(file_path, encoding="utf-8") as file:
-        old_file = file.read()
-        file.close()
-    with open(file_path, "w", encoding="utf-8") as file:
-        file.write(old_file.replace(old, new))
-        file.close()
-    return True
+    int
+        Size in bytes
+
+    Raises
+    ------
+    ValueError
+        Raised if size can't be parsed
+    """
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    size = size.strip().upper().rstrip("B")
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
 
 
 def remove(path: str) -> Union[None, bool]:
@@ -138,6 +115,10 @@ def remove(path: str) -> Union[None, bool]:
     False
         If file or directory failed to remove
     """
+    log = dry_run.active()
+    if log is not None:
+        log.edit("remove", path)
+        return True
     if not os.path.exists(path):
         print(f"{path} doesn't exist, no need to remove it")
         return None
@@ -154,3 +135,220 @@ def remove(path: str) -> Union[None, bool]:
         return False
     print(f"File {path} removed successfully")
     return True
+
+
+def write_atomic(file_path: str, content: str) -> None:
+    """
+    Replace file content at once, a failed write leaves the old file in
+    place
+
+    Parameters
+    ----------
+    file_path: str
+        File path in form of string
+    content: str
+        New content
+    """
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    try:
+        with open(
+            tmp_path, "w", encoding="utf-8", errors="surrogateescape", newline=""
+        ) as file:
+            file.write(content)
+        if os.path.exists(file_path):
+            copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def take_patched_files() -> Dict[str, str]:
+    """
+    Return files written by Patch.apply since the last call
+
+    Returns
+    -------
+    Dict[str, str]
+        sha256 of the patched content per absolute path
+    """
+    patched = dict(_PATCHED)
+    _PATCHED.clear()
+    return patched
+
+
+def activate_patch_records(path: Optional[str]) -> None:
+    """
+    Set file keeping the patches applied by Patch, so applying one again to
+    a file that holds its result is a no-op
+
+    Parameters
+    ----------
+    path: Optional[str]
+        JSON file, None to keep no records
+    """
+    global _PATCH_RECORDS  # pylint: disable=global-statement
+    _PATCH_RECORDS = path
+
+
+def _sha256(content: str) -> str:
+    """
+    Return sha256 of file content
+    """
+    return hashlib.sha256(content.encode("utf-8", errors="surrogateescape")).hexdigest()
+
+
+def _read_patch_records() -> Dict[str, dict]:
+    """
+    Return applied patch per absolute path
+    """
+    if _PATCH_RECORDS is None:
+        return {}
+    try:
+        with open(_PATCH_RECORDS, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+class PatchError(Exception):
+    """
+    Raised when an edit of a Patch doesn't match the file
+    """
+
+
+class Patch:
+    """
+    Edits of one file applied with one read and one atomic write
+
+    Every edit has to match the expected number of times. The applied
+    patch and the sha256 of its result are recorded (activate_patch_records),
+    applying the same patch again to a file that still holds the result
+    leaves it unchanged. Any other file missing an edit's text raises.
+
+    Examples
+    --------
+    >>> Patch("x265.pc").replace("-lx265", "-lx265 -lstdc++").apply()
+    """
+
+    def __init__(self, file_path: str):
+        self.__file_path = file_path
+        self.__edits: List[Tuple[str, tuple]] = []
+
+    def replace(self, old: str, new: str, count: Optional[int] = 1) -> "Patch":
+        """
+        Queue a replacement
+
+        Parameters
+        ----------
+        old: str
+            Old content
+        new: str
+            New content
+        count: Optional[int] (default 1)
+            Number of times old must appear, None for any non-zero number
+
+        Returns
+        -------
+        Patch
+            The patch itself, to chain edits
+        """
+        self.__edits.append(("replace", (old, new, count)))
+        return self
+
+    def delete_lines(self, start: str, end: str, trailing: int = 0) -> "Patch":
+        """
+        Queue removal of the lines from the one containing start to the one
+        containing end
+
+        Parameters
+        ----------
+        start: str
+            Text of the first removed line
+        end: str
+            Text of the last removed line
+        trailing: int (default 0)
+            Number of lines after the end line removed as well
+
+        Returns
+        -------
+        Patch
+            The patch itself, to chain edits
+        """
+        self.__edits.append(("delete_lines", (start, end, trailing)))
+        return self
+
+    def __replace(self, content: str, old: str, new: str, count: Optional[int]) -> str:
+        """
+        Apply a replacement to content
+        """
+        found = content.count(old)
+        if found == 0 or count not in (None, found):
+            expected = "at least once" if count is None else f"{count} time(s)"
+            raise PatchError(
+                f"{self.__file_path}: {old!r} found {found} time(s), "
+                f"expected {expected}"
+            )
+        return content.replace(old, new)
+
+    def __delete_lines(self, content: str, start: str, end: str, trailing: int) -> str:
+        """
+        Apply a line removal to content
+        """
+        lines = content.splitlines(keepends=True)
+        starts = [index for index, line in enumerate(lines) if start in line]
+        ends = [index for index, line in enumerate(lines) if end in line]
+        if len(starts) != 1 or len(ends) != 1 or ends[0] < starts[0]:
+            raise PatchError(
+                f"{self.__file_path}: lines {start!r} to {end!r} found "
+                f"{len(starts)} and {len(ends)} time(s), expected once in order"
+            )
+        del lines[starts[0] : ends[0] + 1 + trailing]
+        return "".join(lines)
+
+    def apply(self) -> str:
+        """
+        Apply the queued edits
+
+        Returns
+        -------
+        str
+            sha256 of the patched content, empty on dry runs
+
+        Raises
+        ------
+        PatchError
+            Raised if an edit doesn't match, the file is left untouched
+        """
+        log = dry_run.active()
+        if log is not None:
+            log.edit("patch", self.__file_path)
+            return ""
+        with open(
+            self.__file_path, encoding="utf-8", errors="surrogateescape", newline=""
+        ) as file:
+            original = file.read()
+        path = os.path.abspath(self.__file_path)
+        # As read back from JSON
+        edits = json.loads(json.dumps(self.__edits))
+        content = original
+        if _read_patch_records().get(path) != {
+            "edits": edits,
+            "sha256": _sha256(original),
+        }:
+            for action, params in self.__edits:
+                if action == "replace":
+                    content = self.__replace(content, *params)
+                else:
+                    content = self.__delete_lines(content, *params)
+            if content != original:
+                write_atomic(self.__file_path, content)
+        digest = _sha256(content)
+        if _PATCH_RECORDS is not None:
+            with file_lock(f"{_PATCH_RECORDS}.lock"):
+                records = _read_patch_records()
+                records[path] = {"edits": edits, "sha256": digest}
+                write_atomic(_PATCH_RECORDS, json.dumps(records, indent=2))
+        _PATCHED[path] = digest
+        return digest
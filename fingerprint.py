@@ -0,0 +1,130 @@
+"""
+Fingerprint of everything a library build depends on
+"""
+from functools import lru_cache
+from typing import Dict
+import hashlib
+import json
+import plumbum
+from options import PGO_LIBRARIES, Options
+
+# Options that change the installed files
+KEY_OPTIONS = (
+    "release_dir",
+    "extra_cflags",
+    "extra_ldflags",
+    "extra_libs",
+    "extra_ffmpeg_args",
+    "static_ffmpeg",
+    "nonfree_build",
+    "march",
+)
+KEY_ENV = ("CC", "CXX", "CFLAGS", "CXXFLAGS", "LDFLAGS", "PKG_CONFIG_LIBDIR")
+CONFIGURATION_TOOLS = {
+    "configure": ("make",),
+    "cmake": ("cmake", "ninja", "make"),
+    "meson": ("meson", "ninja"),
+}
+
+
+@lru_cache(maxsize=None)
+def tool_id(cmd: str) -> str:
+    """
+    Return first line of `cmd --version`
+
+    Parameters
+    ----------
+    cmd: str
+        Command
+
+    Returns
+    -------
+    str
+    """
+    try:
+        return plumbum.local[cmd]("--version").strip().splitlines()[0]
+    except (
+        plumbum.commands.CommandNotFound,
+        plumbum.commands.ProcessExecutionError,
+        IndexError,
+    ):
+        return ""
+
+
+@lru_cache(maxsize=None)
+def file_hash(path: str) -> str:
+    """
+    Return sha256 of the file
+
+    Parameters
+    ----------
+    path: str
+        File path
+
+    Returns
+    -------
+    str
+    """
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def fingerprint(
+    library_obj, options: Options, dependency_fingerprints: Dict[str, str]
+) -> str:
+    """
+    Hash of the library entry, its patch module, the flags, the toolchain
+    and the fingerprints of its dependencies, so a change anywhere below a
+    library changes its fingerprint too
+
+    Parameters
+    ----------
+    library_obj: Library
+        Library after its pre_dependency hook
+    options: Options
+        Build options
+    dependency_fingerprints: Dict[str, str]
+        Fingerprint of every dependency
+
+    Returns
+    -------
+    str
+    """
+    env = plumbum.local.env
+    data = {
+        "name": library_obj.name,
+        "download_params": library_obj.download_params,
+        "sha256": library_obj.sha256,
+        "folder_name": library_obj.folder_name,
+        "configuration": library_obj.configuration,
+        "configure_params": library_obj.configure_params,
+        "module": (
+            file_hash(library_obj.module_path)
+            if library_obj.module_path is not None
+            else ""
+        ),
+        "options": {name: getattr(options, name) for name in KEY_OPTIONS},
+        "env": {name: env.get(name, "") for name in KEY_ENV},
+        "toolchain": [
+            tool_id(env.get("CC", "cc")),
+            tool_id(env.get("CXX", "c++")),
+            *[
+                tool_id(tool)
+                for tool in CONFIGURATION_TOOLS.get(library_obj.configuration, ())
+            ],
+        ],
+        "dependencies": dependency_fingerprints,
+    }
+    # Left out of the default profile, its fingerprints stay the same
+    if options.profile != "default":
+        data["profile"] = [options.profile, library_obj.fast_profile]
+    if options.lto and library_obj.lto:
+        data["lto"] = True
+    if options.pgo and library_obj.name in PGO_LIBRARIES:
+        data["pgo"] = file_hash(options.pgo_workload) if options.pgo_workload else ""
+    if library_obj.cmake_generator:
+        data["cmake_generator"] = library_obj.cmake_generator
+    # Changes the link flags of the dependents
+    if library_obj.pkg_config_fixups:
+        data["pkg_config_fixups"] = library_obj.pkg_config_fixups
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
@@ -0,0 +1,250 @@
+"""
+Database of past library builds, used to predict how long builds take
+"""
+from statistics import median
+from typing import Dict, Iterable, List, Optional
+import os.path
+import sqlite3
+
+# Estimate from the most recent successful builds
+SAMPLES = 5
+# Estimate of a library that was never built, if nothing else was either
+DEFAULT_DURATION = 60.0
+# Phases running the compiler, custom configurations compile too
+COMPILE_PHASES = ("compile", "custom_configure")
+
+
+class BuildHistory:
+    """
+    Duration, CPU time, peak RSS and tree size of every library build,
+    stored in SQLite in the cache dir
+    """
+
+    def __init__(self, cache_dir: str, read_only: bool = False):
+        """
+        Parameters
+        ----------
+        cache_dir: str
+            Cache directory
+        read_only: bool (default False)
+            Only read the previous builds, nothing is created, for the dry
+            runs and plans
+        """
+        self.__path = os.path.join(cache_dir, "history.sqlite3")
+        self.__read_only = read_only
+        if read_only:
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        with self.__connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS builds ("
+                " library TEXT NOT NULL,"
+                " fingerprint TEXT,"
+                " started REAL NOT NULL,"
+                " duration REAL NOT NULL,"
+                " cpu REAL,"
+                " peak_rss_mb REAL,"
+                " jobs INTEGER,"
+                " status TEXT NOT NULL)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(builds)")]
+            for column in (
+                "compile_duration",
+                "compile_cpu",
+                "memory_mb",
+                "work_mb",
+            ):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE builds ADD COLUMN {column} REAL")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS builds_library"
+                " ON builds (library, status, started)"
+            )
+
+    def __connect(self) -> sqlite3.Connection:
+        """
+        Open the database, waiting for concurrent builders
+        """
+        if self.__read_only:
+            return sqlite3.connect(f"file:{self.__path}?mode=ro", timeout=30, uri=True)
+        return sqlite3.connect(self.__path, timeout=30)
+
+    def record(
+        self,
+        events: Iterable[dict],
+        jobs: int,
+        memory_peaks: Optional[Dict[str, float]] = None,
+    ) -> None:
+        """
+        Store the builds of a run
+
+        Parameters
+        ----------
+        events: Iterable[dict]
+            Trace events of the run
+        jobs: int
+            Number of parallel jobs of the run
+        memory_peaks: Optional[Dict[str, float]]
+            Peak memory of the process tree of every build in MiB
+        """
+        memory_peaks = memory_peaks or {}
+        compile_phases: Dict[str, list] = {}
+        for event in events:
+            if event["name"] in COMPILE_PHASES:
+                totals = compile_phases.setdefault(event["cat"], [0, 0])
+                totals[0] += event["dur"] / 1e6
+                totals[1] += event["args"].get("cpu_user", 0)
+                totals[1] += event["args"].get("cpu_sys", 0)
+        rows = [
+            (
+                event["cat"],
+                event["args"].get("fingerprint"),
+                event["ts"] / 1e6,
+                event["dur"] / 1e6,
+                event["args"].get("cpu_user", 0) + event["args"].get("cpu_sys", 0),
+                event["args"].get("peak_rss_mb"),
+                jobs,
+                event["args"].get("status", "failed"),
+                *compile_phases.get(event["cat"], (None, None)),
+                memory_peaks.get(event["cat"]),
+                event["args"].get("work_mb"),
+            )
+            for event in events
+            if event["name"] == "build"
+        ]
+        with self.__connect() as conn:
+            conn.executemany(
+                "INSERT INTO builds (library, fingerprint, started, duration, cpu,"
+                " peak_rss_mb, jobs, status, compile_duration, compile_cpu, memory_mb,"
+                " work_mb) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def __recent(self, library: str, column: str) -> List[float]:
+        """
+        Return column of the most recent successful builds of the library
+        """
+        assert column in (
+            "duration",
+            "peak_rss_mb",
+            "memory_mb",
+            "work_mb",
+            "compile_cpu / compile_duration",
+        )
+        try:
+            with self.__connect() as conn:
+                return [
+                    row[0]
+                    for row in conn.execute(
+                        f"SELECT {column} FROM builds"
+                        f" WHERE library = ? AND status = 'built' AND {column} IS NOT NULL"
+                        " ORDER BY started DESC LIMIT ?",
+                        (library, SAMPLES),
+                    )
+                ]
+        except sqlite3.OperationalError:
+            if not self.__read_only:
+                raise
+            # No database yet, or one without the column
+            return []
+
+    def duration(self, library: str) -> Optional[float]:
+        """
+        Parameters
+        ----------
+        library: str
+            Library name
+
+        Returns
+        -------
+        Optional[float]
+            Median duration of the recent builds, None if never built
+        """
+        durations = self.__recent(library, "duration")
+        return median(durations) if durations else None
+
+    def peak_rss(self, library: str) -> Optional[float]:
+        """
+        Parameters
+        ----------
+        library: str
+            Library name
+
+        Returns
+        -------
+        Optional[float]
+            Highest peak RSS of the recent builds in MiB, None if unknown
+        """
+        peaks = self.__recent(library, "peak_rss_mb")
+        return max(peaks) if peaks else None
+
+    def memory(self, library: str) -> Optional[float]:
+        """
+        Parameters
+        ----------
+        library: str
+            Library name
+
+        Returns
+        -------
+        Optional[float]
+            Highest memory use of the whole build in the recent builds in
+            MiB, None if unknown
+        """
+        peaks = self.__recent(library, "memory_mb")
+        return max(peaks) if peaks else None
+
+    def work_size(self, library: str) -> Optional[float]:
+        """
+        Parameters
+        ----------
+        library: str
+            Library name
+
+        Returns
+        -------
+        Optional[float]
+            Largest source and build tree of the recent builds in MiB, None
+            if unknown
+        """
+        sizes = self.__recent(library, "work_mb")
+        return max(sizes) if sizes else None
+
+    def parallelism(self, library: str) -> Optional[float]:
+        """
+        Parameters
+        ----------
+        library: str
+            Library name
+
+        Returns
+        -------
+        Optional[float]
+            Highest average number of busy cores while compiling in the
+            recent builds, None if unknown
+        """
+        ratios = self.__recent(library, "compile_cpu / compile_duration")
+        return max(ratios) if ratios else None
+
+    def estimates(self, libraries: Iterable[str]) -> Dict[str, float]:
+        """
+        Predict build durations, libraries never built get the median of
+        the known ones
+
+        Parameters
+        ----------
+        libraries: Iterable[str]
+            Library names
+
+        Returns
+        -------
+        Dict[str, float]
+            Seconds per library
+        """
+        known = {library: self.duration(library) for library in libraries}
+        durations = [_ for _ in known.values() if _ is not None]
+        fallback = median(durations) if durations else DEFAULT_DURATION
+        return {
+            library: fallback if duration is None else duration
+            for library, duration in known.items()
+        }
@@ -0,0 +1,409 @@
+"""
+HTTP downloader with connection reuse, resume and backoff
+"""
+from time import monotonic, sleep
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass
+import http.client
+import logging
+import json
+import random
+import ssl
+import threading
+from file_utils import file_lock, write_atomic
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+MAX_REDIRECTS = 10
+USER_AGENT = "ffmpeg-builder"
+
+
+class DownloadError(Exception):
+    """
+    Raised when a download can't be completed
+    """
+
+
+class HostUnavailable(DownloadError):
+    """
+    Raised when a host failed too often and is not contacted anymore
+    """
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every download of the process, and of every
+    process given the same state file
+    """
+
+    def __init__(self, rate: int, state_path: Optional[str] = None):
+        """
+        Parameters
+        ----------
+        rate: int
+            Maximum bytes per second
+        state_path: Optional[str]
+            File holding the bucket, locked while it's updated
+        """
+        self.__rate = rate
+        self.__state_path = state_path
+        self.__tokens = float(rate)
+        self.__last = monotonic()
+        self.__lock = threading.Lock()
+
+    def __load(self) -> None:
+        """
+        Read the bucket left by the other processes
+        """
+        try:
+            with open(self.__state_path, encoding="utf-8") as file:
+                self.__tokens, self.__last = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    def __take(self, amount: int) -> float:
+        """
+        Take amount from the bucket
+
+        Returns
+        -------
+        float
+            Seconds to wait before the transfer
+        """
+        # The monotonic clock is system wide, shared by the processes
+        now = monotonic()
+        self.__tokens = min(
+            self.__rate, self.__tokens + max(0.0, now - self.__last) * self.__rate
+        )
+        self.__last = now
+        self.__tokens -= amount
+        return -self.__tokens / self.__rate if self.__tokens < 0 else 0
+
+    def consume(self, amount: int) -> None:
+        """
+        Wait until amount bytes may be transferred
+
+        Parameters
+        ----------
+        amount: int
+            Number of bytes
+        """
+        with self.__lock:
+            if self.__state_path is None:
+                delay = self.__take(amount)
+            else:
+                with file_lock(f"{self.__state_path}.lock"):
+                    self.__load()
+                    delay = self.__take(amount)
+                    write_atomic(
+                        self.__state_path, json.dumps([self.__tokens, self.__last])
+                    )
+        if delay:
+            sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Stop contacting a host after consecutive failures, until a cool down
+    period has passed
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 120):
+        self.__threshold = threshold
+        self.__cooldown = cooldown
+        self.__failures: Dict[str, int] = {}
+        self.__opened: Dict[str, float] = {}
+        self.__lock = threading.Lock()
+
+    def allow(self, host: str) -> bool:
+        """
+        Check if the host may be contacted
+
+        Parameters
+        ----------
+        host: str
+            Host name
+
+        Returns
+        -------
+        bool
+        """
+        with self.__lock:
+            opened = self.__opened.get(host)
+            if opened is None:
+                return True
+            if monotonic() - opened >= self.__cooldown:
+                # Half open, one more failure opens it again
+                del self.__opened[host]
+                self.__failures[host] = self.__threshold - 1
+                return True
+            return False
+
+    def success(self, host: str) -> None:
+        """
+        Parameters
+        ----------
+        host: str
+            Host name
+        """
+        with self.__lock:
+            self.__failures.pop(host, None)
+
+    def failure(self, host: str) -> None:
+        """
+        Parameters
+        ----------
+        host: str
+            Host name
+        """
+        with self.__lock:
+            self.__failures[host] = self.__failures.get(host, 0) + 1
+            if self.__failures[host] >= self.__threshold:
+                self.__opened[host] = monotonic()
+                logger.warning("Too many failures, not contacting %s for a while", host)
+
+
+class HttpClient:
+    """
+    Download files over HTTP(S)
+
+    Connections are kept alive and reused per host, interrupted downloads
+    continue with a Range request and failures are retried with
+    exponential backoff with jitter.
+    """
+
+    def __init__(
+        self,
+        retries: int = 6,
+        backoff: float = 1,
+        max_backoff: float = 60,
+        timeout: float = 60,
+        verify: bool = True,
+        rate_limit: int = 0,
+        breaker: Optional[CircuitBreaker] = None,
+        rate_state: Optional[str] = None,
+    ):
+        self.__retries = retries
+        self.__backoff = backoff
+        self.__max_backoff = max_backoff
+        self.__timeout = timeout
+        self.__ssl_context = ssl.create_default_context()
+        if not verify:
+            self.__ssl_context.check_hostname = False
+            self.__ssl_context.verify_mode = ssl.CERT_NONE
+        self.__limiter = RateLimiter(rate_limit, rate_state) if rate_limit else None
+        self.__breaker = breaker or CircuitBreaker()
+        self.__pool: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self.__lock = threading.Lock()
+
+    def __connect(
+        self, scheme: str, netloc: str, reuse: bool = True
+    ) -> http.client.HTTPConnection:
+        """
+        Return idle connection to the host or open a new one
+        """
+        with self.__lock:
+            idle = self.__pool.get((scheme, netloc))
+            if idle and reuse:
+                conn = idle.pop()
+                conn.reused = True
+                return conn
+        proxy = getproxies().get(scheme)
+        host = netloc.rsplit("@", 1)[-1]
+        if proxy and not proxy_bypass(host.split(":")[0]):
+            proxy_netloc = urlsplit(proxy).netloc
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(
+                    proxy_netloc, timeout=self.__timeout, context=self.__ssl_context
+                )
+                conn.set_tunnel(host)
+            else:
+                conn = http.client.HTTPConnection(proxy_netloc, timeout=self.__timeout)
+            conn.via_proxy = scheme == "http"
+            return conn
+        if scheme == "https":
+            return http.client.HTTPSConnection(
+                host, timeout=self.__timeout, context=self.__ssl_context
+            )
+        return http.client.HTTPConnection(host, timeout=self.__timeout)
+
+    def __release(self, scheme: str, netloc: str, conn: http.client.HTTPConnection):
+        """
+        Put connection back into the pool
+        """
+        with self.__lock:
+            self.__pool.setdefault((scheme, netloc), []).append(conn)
+
+    def __open(self, url: str, headers: dict) -> tuple:
+        """
+        Send GET request, following redirects
+
+        Returns
+        -------
+        tuple
+            Connection, response and final url
+        """
+        for _ in range(MAX_REDIRECTS):
+            parts = urlsplit(url)
+            if parts.scheme not in ("http", "https"):
+                raise DownloadError(f"Unsupported url: {url}")
+            conn, response = self.__request(parts, url, headers)
+            if response.status in (301, 302, 303, 307, 308):
+                location = response.getheader("Location")
+                response.read()
+                self.__finish(parts, conn, response)
+                if not location:
+                    raise DownloadError(f"Redirect without location: {url}")
+                url = urljoin(url, location)
+                continue
+            return conn, response, url
+        raise DownloadError(f"Too many redirects: {url}")
+
+    def __request(self, parts, url: str, headers: dict) -> tuple:
+        """
+        Send GET request on a pooled connection, a connection the server
+        closed while idle is replaced once without counting as a failure
+        """
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        reuse = True
+        while True:
+            conn = self.__connect(parts.scheme, parts.netloc, reuse)
+            try:
+                conn.request(
+                    "GET",
+                    url if getattr(conn, "via_proxy", False) else path,
+                    headers={
+                        "Host": parts.netloc,
+                        "User-Agent": USER_AGENT,
+                        "Accept-Encoding": "identity",
+                        **headers,
+                    },
+                )
+                return conn, conn.getresponse()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                if not getattr(conn, "reused", False):
+                    raise
+                reuse = False
+
+    def __finish(self, parts, conn: http.client.HTTPConnection, response) -> None:
+        """
+        Reuse connection if the server keeps it open
+        """
+        if response.will_close:
+            conn.close()
+            return
+        self.__release(parts.scheme, parts.netloc, conn)
+
+    def __delay(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter
+        """
+        return random.uniform(0, min(self.__max_backoff, self.__backoff * 2**attempt))
+
+    @staticmethod
+    def __sink(url: str, conn, call: Callable, *args) -> None:
+        """
+        Hand downloaded content to the caller, its failures (a full disk)
+        are local and neither retried nor counted against the host
+        """
+        try:
+            call(*args)
+        except OSError as err:
+            conn.close()
+            raise DownloadError(f"{url}: can't write the download: {err}") from err
+
+    def download(
+        self,
+        url: str,
+        write: Callable[[bytes], None],
+        restart: Callable[[], None],
+    ) -> int:
+        """
+        Download url
+
+        Parameters
+        ----------
+        url: str
+            Download url
+        write: Callable[[bytes], None]
+            Called with every chunk in order
+        restart: Callable[[], None]
+            Called when the server can't resume, the chunks written so far
+            must be dropped
+
+        Returns
+        -------
+        int
+            Number of bytes downloaded
+
+        Raises
+        ------
+        DownloadError
+            Raised if the download failed after every retry, or right away
+            if write or restart failed
+        HostUnavailable
+            Raised if the host failed too many times
+        """
+        host = urlsplit(url).netloc
+        resume_url = url
+        offset = 0
+        validator = None
+        attempt = 0
+        while True:
+            if not self.__breaker.allow(host):
+                raise HostUnavailable(f"{host} failed too many times")
+            headers = {}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+                if validator:
+                    headers["If-Range"] = validator
+            conn = response = None
+            try:
+                conn, response, final_url = self.__open(resume_url, headers)
+                if response.status == 206 and offset:
+                    content_range = response.getheader("Content-Range", "")
+                    if not content_range.startswith(f"bytes {offset}-"):
+                        raise DownloadError(f"Unexpected Content-Range: {content_range}")
+                elif response.status == 200:
+                    if offset:
+                        logger.info("Server can't resume %s, starting over", url)
+                        self.__sink(url, conn, restart)
+                        offset = 0
+                    etag = response.getheader("ETag")
+                    strong_etag = etag if etag and not etag.startswith("W/") else None
+                    validator = strong_etag or response.getheader("Last-Modified")
+                else:
+                    response.read()
+                    if response.status in (408, 429) or response.status >= 500:
+                        raise http.client.HTTPException(f"HTTP {response.status}")
+                    conn.close()
+                    raise DownloadError(f"HTTP {response.status}: {url}")
+                resume_url = final_url
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                    if self.__limiter is not None:
+                        self.__limiter.consume(len(chunk))
+                    self.__sink(url, conn, write, chunk)
+                    offset += len(chunk)
+                if response.length:
+                    raise http.client.IncompleteRead(b"", response.length)
+                self.__finish(urlsplit(final_url), conn, response)
+                self.__breaker.success(host)
+                return offset
+            except (OSError, http.client.HTTPException) as err:
+                if conn is not None:
+                    conn.close()
+                self.__breaker.failure(host)
+                attempt += 1
+                if attempt > self.__retries:
+                    raise DownloadError(f"{url}: {err}") from err
+                delay = self.__delay(attempt)
+                print(
+                    f"Downloading interrupted: {url} at {offset} bytes ({err!r}). "
+                    f"Retrying in {delay:.1f} seconds"
+                )
+                sleep(delay)
@@ -0,0 +1,193 @@
+"""
+GNU make compatible jobserver shared by every build started by the builder
+"""
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+import logging
+import os
+import os.path
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+TOKEN = b"+"
+# GNU make versions changing how the jobserver is passed in MAKEFLAGS
+FIFO_MAKE = (4, 4)
+AUTH_MAKE = (4, 2)
+
+_ACTIVE: Optional["Jobserver"] = None
+
+
+class Jobserver:
+    """
+    Pool of job tokens stored in a named pipe
+
+    Every make/ninja started by the builder holds one token for its implicit
+    job slot and the tool itself takes the remaining tokens from the pipe, so
+    the total number of compile jobs never exceeds the number of slots.
+    """
+
+    def __init__(self, slots: int):
+        self.__slots = max(1, slots)
+        self.__dir = tempfile.mkdtemp(prefix="ffmpeg-builder-jobserver-")
+        self.__path = os.path.join(self.__dir, "fifo")
+        os.mkfifo(self.__path, 0o600)
+        # Opening read-write never blocks and keeps the pipe alive
+        self.__fd = os.open(self.__path, os.O_RDWR)
+        os.write(self.__fd, TOKEN * self.__slots)
+        logger.debug("Jobserver started with %s slots: %s", self.__slots, self.__path)
+
+    @staticmethod
+    def is_supported() -> bool:
+        """
+        Check if the platform supports named pipes
+
+        Returns
+        -------
+        bool
+        """
+        return hasattr(os, "mkfifo")
+
+    @property
+    def slots(self) -> int:
+        """
+        Returns
+        -------
+        int
+            Total number of job slots
+        """
+        return self.__slots
+
+    @property
+    def fds(self) -> tuple:
+        """
+        Returns
+        -------
+        tuple
+            File descriptors that must be passed to pre 4.4 GNU make
+        """
+        return (self.__fd,)
+
+    def makeflags(self, make_version: Tuple[int, ...] = FIFO_MAKE) -> str:
+        """
+        Return MAKEFLAGS value that makes the tool join the jobserver
+
+        Parameters
+        ----------
+        make_version: Tuple[int, ...] (default FIFO_MAKE)
+            Version of GNU make, the named pipe style of 4.4+ is understood by
+            ninja too. Older ones take the file descriptors of fds, as
+            --jobserver-auth from 4.2 and as --jobserver-fds before, with a
+            bare -j or they leave jobserver mode.
+
+        Returns
+        -------
+        str
+        """
+        if make_version >= FIFO_MAKE:
+            return f" -j{self.__slots} --jobserver-auth=fifo:{self.__path}"
+        if make_version >= AUTH_MAKE:
+            return f" -j{self.__slots} --jobserver-auth={self.__fd},{self.__fd}"
+        return f" -j --jobserver-fds={self.__fd},{self.__fd}"
+
+    def acquire(self, blocking: bool = True) -> Optional[bytes]:
+        """
+        Take one token from the pool
+
+        Parameters
+        ----------
+        blocking: bool (default True)
+            Wait until a token is available
+
+        Returns
+        -------
+        Optional[bytes]
+            The token or None if none is available and blocking is False
+        """
+        if blocking:
+            while True:
+                try:
+                    return os.read(self.__fd, 1)
+                except InterruptedError:
+                    continue
+        # Separate descriptor, toggling O_NONBLOCK on the shared one would
+        # affect every forked build
+        fd = os.open(self.__path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            return os.read(fd, 1) or None
+        except BlockingIOError:
+            return None
+        finally:
+            os.close(fd)
+
+    def release(self, token: bytes) -> None:
+        """
+        Put token back into the pool
+
+        Parameters
+        ----------
+        token: bytes
+            Token returned by acquire
+        """
+        os.write(self.__fd, token)
+
+    @contextmanager
+    def slot(self, count: int = 1) -> Iterator[int]:
+        """
+        Hold tokens while the context is active
+
+        The first token is waited for, the others are only taken if they are
+        free right now.
+
+        Parameters
+        ----------
+        count: int (default 1)
+            Maximum number of tokens to hold
+
+        Yields
+        ------
+        int
+            Number of tokens held
+        """
+        tokens = [self.acquire()]
+        while len(tokens) < count:
+            token = self.acquire(blocking=False)
+            if token is None:
+                break
+            tokens.append(token)
+        try:
+            yield len(tokens)
+        finally:
+            for token in tokens:
+                self.release(token)
+
+    def close(self) -> None:
+        """
+        Remove the named pipe
+        """
+        os.close(self.__fd)
+        shutil.rmtree(self.__dir, ignore_errors=True)
+
+
+def activate(jobserver: Optional[Jobserver]) -> None:
+    """
+    Set jobserver used by build_utils
+
+    Parameters
+    ----------
+    jobserver: Optional[Jobserver]
+        Jobserver or None to disable it
+    """
+    global _ACTIVE  # pylint: disable=global-statement
+    _ACTIVE = jobserver
+
+
+def active() -> Optional[Jobserver]:
+    """
+    Returns
+    -------
+    Optional[Jobserver]
+        Jobserver used by build_utils
+    """
+    return _ACTIVE
@@ -1,14 +1,18 @@
 import os.path
-from file_utils import remove, replace
+from file_utils import Patch, remove
+from options import Options
 
 
-def pre_configure():
+def pre_configure(options: Options):
     """
     Pre configuration build patch
     """
     remove(os.path.join("Modules", "FindJava.cmake"))
-    replace(
-        "Tests/CMakeLists.txt",
-        "get_filename_component.JNIPATH",
+    if options.profile == "fast":
+        # The test suite isn't configured at all
+        return
+    Patch("Tests/CMakeLists.txt").replace(
+        "get_filename_component(JNIPATH",
         "#get_filename_component(JNIPATH",
-    )
+        count=None,
+    ).apply()
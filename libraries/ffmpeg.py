@@ -1,5 +1,7 @@
 import platform
 from options import Options
+import compiler_cache
+import lto
 
 
 def add_library(ctx, lib_name: str) -> None:
@@ -33,6 +35,26 @@ def add_library(ctx, lib_name: str) -> None:
     ctx.add_configuration_params(f"--enable-{lib_name}")
 
 
+def pre_dependency(ctx, options: Options):
+    """
+    Pre dependency patch, ffmpeg links every other target
+
+    Parameters
+    ----------
+    ctx: Library
+        Library class
+    options: Options
+        Build data
+    """
+    ctx.add_dependencies(
+        *[
+            library
+            for library in options.targets
+            if library != ctx.name and library not in ctx.dependencies
+        ]
+    )
+
+
 def pre_configure(ctx, options: Options):
     """
     Pre configure patch
@@ -65,3 +87,18 @@ def pre_configure(ctx, options: Options):
         ctx.add_configuration_params("--extra-libs=-lpthread", "--enable-pthreads")
     if "libsoxr" in options.targets:
         ctx.add_configuration_params("--extra-libs=-lgomp")
+    cache = compiler_cache.active()
+    if cache is not None:
+        # FFmpeg configure ignores CC/CXX from the environment
+        cache_env = cache.env()
+        ctx.add_configuration_params(f"--cc={cache_env['CC']}", f"--cxx={cache_env['CXX']}")
+    link_time = lto.active()
+    if link_time is not None and ctx.lto:
+        # FFmpeg configure takes the archiver tools as options too
+        tools = link_time.tools
+        ctx.add_configuration_params(
+            "--enable-lto",
+            f"--ar={tools['AR']}",
+            f"--ranlib={tools['RANLIB']}",
+            f"--nm={tools['NM']}",
+        )
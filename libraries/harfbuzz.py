@@ -12,8 +12,8 @@ def pre_dependency(ctx, options: Options):
         return
     ctx.add_configuration_params("-DHB_HAVE_FREETYPE=off")
 
-def pre_configure(ctx, options: Options):
+def pre_configure(ctx):
     """
     Pre configuration build patch
     """
-    ctx.add_configuration_params(f"{options.target_dir}/harfbuzz-10.1.0")
+    ctx.add_configuration_params(f"{ctx.source_dir}/harfbuzz-10.1.0")
@@ -1,8 +1,5 @@
-from options import Options
-
-
-def pre_configure(ctx, options: Options):
+def pre_configure(ctx):
     """
     Pre configuration build patch
     """
-    ctx.add_configuration_params(f"{options.target_dir}/aom")
+    ctx.add_configuration_params(f"{ctx.source_dir}/aom")
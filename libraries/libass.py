@@ -18,4 +18,15 @@ def custom_configure(ctx, options: Options):
     ):
         configure(options.release_dir, *ctx.configure_params, silent=options.silent)
         make(options.threads, silent=options.silent)
-        make_install(silent=options.silent)
+
+
+def custom_install(options: Options):
+    """
+    Custom install
+
+    Parameters
+    ----------
+    options : Options
+        Build options
+    """
+    make_install(silent=options.silent)
@@ -8,5 +8,5 @@ def pre_configure(ctx, options: Options):
     """
     ctx.add_configuration_params(
         f"--libdir={options.release_dir}/lib",
-        f"{options.target_dir}/dav1d-{re.findall('dav1d-(.+).tar', ctx.download_params[1])[0]}",
+        f"{ctx.source_dir}/dav1d-{re.findall('dav1d-(.+).tar', ctx.download_params[1])[0]}",
     )
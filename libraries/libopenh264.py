@@ -9,5 +9,5 @@ def pre_configure(ctx, options: Options):
     """
     ctx.add_configuration_params(
         f"--libdir={options.release_dir}/lib",
-        f"{options.target_dir}/openh264-{re.findall('libopenh264-(.+).tar', ctx.download_params[1])[0]}",
+        f"{ctx.source_dir}/openh264-{re.findall('libopenh264-(.+).tar', ctx.download_params[1])[0]}",
     )
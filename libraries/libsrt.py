@@ -1,6 +1,5 @@
 # pylint: disable = C0114
 from options import Options
-import file_utils
 
 
 def pre_configure(ctx, options: Options):
@@ -27,15 +26,3 @@ def pre_dependency(ctx, options: Options):
         ctx.add_dependencies("openssl")
         return
 
-
-def post_install(options: Options):
-    """
-    Post configuration build patch
-
-    Parameters
-    ----------
-    options : Options
-        Build options
-    """
-    # Fix gcc_s not found
-    file_utils.replace(f"{options.release_dir}/lib/pkgconfig/srt.pc", "-lgcc_s", "")
@@ -8,7 +8,7 @@ def pre_configure(ctx, options: Options):
     """
     Pre configuration build patch
     """
-    file_utils.replace("configure", "-fforce-addr", "")
+    file_utils.Patch("configure").replace("-fforce-addr", "", count=None).apply()
     run_fg("chmod", "+x", "configure")
     ctx.add_configuration_params(
         f"--with-ogg-libraries={options.release_dir}/lib",
@@ -8,5 +8,5 @@ def pre_configure(ctx, options: Options):
     """
     ctx.add_configuration_params(
         f"--libdir={options.release_dir}/lib",
-        f"{options.target_dir}/vmaf-{re.findall('libvmaf-(.+).tar', ctx.download_params[1])[0]}/libvmaf",
+        f"{ctx.source_dir}/vmaf-{re.findall('libvmaf-(.+).tar', ctx.download_params[1])[0]}/libvmaf",
     )
@@ -8,9 +8,10 @@ def pre_configure():
     Pre configuration build patch
     """
     if system() == "Darwin":
-        file_utils.replace("build/make/Makefile", "--version-script", "")
-        file_utils.replace(
-            "build/make/Makefile",
+        file_utils.Patch("build/make/Makefile").replace(
+            "--version-script", "", count=1
+        ).replace(
             "-Wl,--no-undefined -Wl,-soname",
             "-Wl,-undefined,error -Wl,-install_name",
-        )
+            count=1,
+        ).apply()
@@ -2,7 +2,6 @@
 import sys
 from options import Options
 from build_utils import run_fg, make
-import file_utils
 
 
 def custom_configure(ctx, options: Options):
@@ -19,6 +18,17 @@ def custom_configure(ctx, options: Options):
     if not run_fg("bash", "./config", *ctx.configure_params):
         sys.exit(1)
     make(options.threads)
+
+
+def custom_install(options: Options):
+    """
+    Custom install
+
+    Parameters
+    ----------
+    options : Options
+        Build options
+    """
     run_fg("make", "install_sw", f"-j{options.threads}")
 
 
@@ -35,19 +45,3 @@ def pre_configure(ctx, options: Options):
         "zlib",
     )
 
-
-def post_install(options: Options):
-    """
-    Post configuration build patch
-
-    Parameters
-    ----------
-    options : Options
-        Build options
-    """
-    # Fix static linking issue
-    file_utils.replace(
-        f"{options.release_dir}/lib/pkgconfig/libcrypto.pc",
-        "Libs: -L${libdir} -lcrypto",
-        "Libs: -L${libdir} -lcrypto -lz -ldl",
-    )
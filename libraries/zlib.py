@@ -29,4 +29,20 @@ def custom_configure(options: Options):
         BINARY_PATH=f"{options.release_dir}/bin",
     ):
         make(options.threads, "-f", "./win32/Makefile.gcc", silent=options.silent)
+
+
+def custom_install(options: Options):
+    """
+    Custom install
+
+    Parameters
+    ----------
+    options : Options
+        Build options
+    """
+    with local.env(
+        INCLUDE_PATH=f"{options.release_dir}/include",
+        LIBRARY_PATH=f"{options.release_dir}/lib",
+        BINARY_PATH=f"{options.release_dir}/bin",
+    ):
         make_install("-f", "./win32/Makefile.gcc", silent=options.silent)
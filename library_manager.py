@@ -7,6 +7,8 @@ import importlib
 import json
 import os.path
 from options import Options
+from source_cache import file_sha256
+import tracing
 
 
 class Library:
@@ -14,11 +16,32 @@ class Library:
     Interface for library
     """
 
-    def __init__(self, name: str, lib_data: dict, options: Options, module_data=None):
+    def __init__(
+        self,
+        name: str,
+        lib_data: dict,
+        options: Options,
+        module_data=None,
+        module_name: Optional[str] = None,
+    ):
         self.__lib_data = lib_data
         self.__module_data = module_data
+        self.__module_name = module_name
         self.__options = options
         self.__name = name
+        self.__dependencies_resolved = False
+        self.__source_dir: Optional[str] = None
+
+    @property
+    def __module(self):
+        """
+        Return patch module, imported when first used so libraries outside
+        the build plan are never imported
+        """
+        if self.__module_data is None and self.__module_name is not None:
+            self.__module_data = importlib.import_module(self.__module_name)
+            self.__module_name = None
+        return self.__module_data
 
     @property
     def configuration(self) -> str:
@@ -31,6 +54,18 @@ class Library:
         """
         return self.__lib_data.get("configuration", "configure")
 
+    @property
+    def cmake_generator(self) -> Optional[str]:
+        """
+        Return cmake generator the library needs
+
+        Returns
+        -------
+        Optional[str]
+            None if not declared, Ninja is used when installed
+        """
+        return self.__lib_data.get("cmake_generator")
+
     @property
     def configure_params(self) -> List[Optional[str]]:
         """
@@ -64,6 +99,17 @@ class Library:
         """
         return self.__lib_data.get("download_params", [])
 
+    @property
+    def sha256(self) -> Optional[str]:
+        """
+        Return expected checksum of the source archive
+
+        Returns
+        -------
+        Optional[str]
+        """
+        return self.__lib_data.get("sha256")
+
     @property
     def folder_name(self) -> str:
         """
@@ -75,6 +121,28 @@ class Library:
         """
         return self.__lib_data.get("folder_name")
 
+    @property
+    def source_dir(self) -> str:
+        """
+        Return directory the library source is extracted into
+
+        Returns
+        -------
+        str
+        """
+        return self.__source_dir or self.__options.target_dir
+
+    def use_source_dir(self, source_dir: str) -> None:
+        """
+        Extract and build the library somewhere else than the target dir
+
+        Parameters
+        ----------
+        source_dir: str
+            Directory the source is extracted into
+        """
+        self.__source_dir = source_dir
+
     @property
     def has_own_configuration(self) -> bool:
         """
@@ -84,9 +152,106 @@ class Library:
         -------
         bool
         """
-        if hasattr(self.__module_data, "has_own_configuration"):
-            return getattr(self.__module_data, "has_own_configuration")()
-        return hasattr(self.__module_data, "custom_configure")
+        if hasattr(self.__module, "has_own_configuration"):
+            return getattr(self.__module, "has_own_configuration")()
+        return hasattr(self.__module, "custom_configure")
+
+    @property
+    def is_build_tool(self) -> bool:
+        """
+        Check if library is a build tool needed by the other libraries
+
+        Returns
+        -------
+        bool
+        """
+        return self.__lib_data.get("build_tool", False)
+
+    @property
+    def max_jobs(self) -> Optional[int]:
+        """
+        Return number of parallel jobs the library build can use
+
+        Returns
+        -------
+        Optional[int]
+            None if not declared
+        """
+        return self.__lib_data.get("max_jobs")
+
+    @property
+    def memory_mb(self) -> Optional[int]:
+        """
+        Return expected peak memory of the library build in MiB
+
+        Returns
+        -------
+        Optional[int]
+            None if not declared
+        """
+        return self.__lib_data.get("memory_mb")
+
+    @property
+    def pkg_config_fixups(self) -> Dict[str, dict]:
+        """
+        Return flags added to or dropped from the installed pkg-config
+        modules, applied by the pkg-config shim
+
+        Returns
+        -------
+        Dict[str, dict]
+            Fixups per module
+        """
+        return self.__lib_data.get("pkg_config_fixups", {})
+
+    @property
+    def lto(self) -> bool:
+        """
+        Check if the library is built with LTO when it is enabled
+
+        Returns
+        -------
+        bool
+            False for the build tools and the libraries with LTO problems
+        """
+        return not self.is_build_tool and self.__lib_data.get("lto", True)
+
+    @property
+    def march(self) -> bool:
+        """
+        Check if the library is built once per -march variant
+
+        Returns
+        -------
+        bool
+            True for the libraries with hot C code, the ones depending on
+            them are built per variant too
+        """
+        return self.__lib_data.get("march", False)
+
+    @property
+    def fast_profile(self) -> Dict[str, List[str]]:
+        """
+        Return exceptions of the library to the fast profile
+
+        Returns
+        -------
+        Dict[str, List[str]]
+            "params" added to the configure parameters, "skip" switches of
+            the build system not to pass
+        """
+        return self.__lib_data.get("fast_profile", {})
+
+    @property
+    def module_path(self) -> Optional[str]:
+        """
+        Return path of the library patch module
+
+        Returns
+        -------
+        Optional[str]
+        """
+        return getattr(self.__module, "__file__", None)
 
     @property
     def name(self) -> str:
@@ -135,49 +300,82 @@ class Library:
         """
         if not self.has_own_configuration:
             return
-        func = getattr(self.__module_data, "custom_configure")
+        func = getattr(self.__module, "custom_configure")
         kwargs = {}
         if "options" in func.__code__.co_varnames:
             kwargs["options"] = self.__options
         if "ctx" in func.__code__.co_varnames:
             kwargs["ctx"] = self
-        func(**kwargs)
+        with tracing.phase("custom_configure"):
+            func(**kwargs)
+
+    @property
+    def has_custom_install(self) -> bool:
+        """
+        Check if library installs in its own custom_install, after
+        custom_configure built it
+
+        Returns
+        -------
+        bool
+        """
+        return self.has_own_configuration and hasattr(self.__module, "custom_install")
+
+    def custom_install(self):
+        """
+        Library own install
+        """
+        if not self.has_custom_install:
+            return
+        func = getattr(self.__module, "custom_install")
+        kwargs = {}
+        if "options" in func.__code__.co_varnames:
+            kwargs["options"] = self.__options
+        if "ctx" in func.__code__.co_varnames:
+            kwargs["ctx"] = self
+        with tracing.phase("install"):
+            func(**kwargs)
 
     def pre_configure(self):
         """
         Pre configure patch
         """
-        if not hasattr(self.__module_data, "pre_configure"):
+        if not hasattr(self.__module, "pre_configure"):
             return
-        func = getattr(self.__module_data, "pre_configure")
+        func = getattr(self.__module, "pre_configure")
         kwargs = {}
         if "options" in func.__code__.co_varnames:
             kwargs["options"] = self.__options
         if "ctx" in func.__code__.co_varnames:
             kwargs["ctx"] = self
-        func(**kwargs)
+        with tracing.phase("pre_configure"):
+            func(**kwargs)
 
     def post_configure(self):
         """
         Post configure patch
         """
-        if not hasattr(self.__module_data, "post_configure"):
+        if not hasattr(self.__module, "post_configure"):
             return
-        func = getattr(self.__module_data, "post_configure")
+        func = getattr(self.__module, "post_configure")
         kwargs = {}
         if "options" in func.__code__.co_varnames:
             kwargs["options"] = self.__options
         if "ctx" in func.__code__.co_varnames:
             kwargs["ctx"] = self
-        func(**kwargs)
+        with tracing.phase("post_configure"):
+            func(**kwargs)
 
     def pre_dependency(self):
         """
-        Pre dependency patch
+        Pre dependency patch, applied only once
         """
-        if not hasattr(self.__module_data, "pre_dependency"):
+        if self.__dependencies_resolved:
             return
-        func = getattr(self.__module_data, "pre_dependency")
+        self.__dependencies_resolved = True
+        if not hasattr(self.__module, "pre_dependency"):
+            return
+        func = getattr(self.__module, "pre_dependency")
         kwargs = {}
         if "options" in func.__code__.co_varnames:
             kwargs["options"] = self.__options
@@ -189,54 +387,127 @@ class Library:
         """
         Post install patch
         """
-        if not hasattr(self.__module_data, "post_install"):
+        if not hasattr(self.__module, "post_install"):
             return
-        func = getattr(self.__module_data, "post_install")
+        func = getattr(self.__module, "post_install")
         kwargs = {}
         if "options" in func.__code__.co_varnames:
             kwargs["options"] = self.__options
         if "ctx" in func.__code__.co_varnames:
             kwargs["ctx"] = self
-        func(**kwargs)
+        with tracing.phase("post_install"):
+            func(**kwargs)
+
+    @property
+    def stamp_path(self) -> str:
+        """
+        Return path of the file marking the library as built
+
+        Returns
+        -------
+        str
+        """
+        return os.path.join(self.__options.target_dir, f"{self.name}.ok")
+
+    def built_fingerprint(self) -> Optional[str]:
+        """
+        Return fingerprint stored when the library was built
+
+        Returns
+        -------
+        Optional[str]
+            None if not built
+        """
+        try:
+            with open(self.stamp_path, encoding="utf-8") as file:
+                return file.readline().strip()
+        except FileNotFoundError:
+            return None
+
+    def patched_files_intact(self) -> bool:
+        """
+        Check that the files patched by the build still hold the patched
+        content
+
+        Returns
+        -------
+        bool
+            False if a patched file was removed or overwritten since
+        """
+        try:
+            with open(self.stamp_path, encoding="utf-8") as file:
+                records = file.readlines()[1:]
+        except FileNotFoundError:
+            return True
+        for record in records:
+            digest, _, path = record.rstrip("\n").partition("  ")
+            try:
+                if file_sha256(path) != digest:
+                    return False
+            except OSError:
+                return False
+        return True
 
-    def is_already_build(self) -> bool:
+    def is_already_build(self, fingerprint: Optional[str] = None) -> bool:
         """
         Check if library already build
 
         Parameters
         ----------
-        lib_name: str
-            The library name
+        fingerprint: Optional[str]
+            Current fingerprint of the library inputs, the library counts as
+            built only if it was built from the same inputs
 
         Returns
         -------
         bool
         """
-        return os.path.exists(
-            os.path.join(self.__options.target_dir, f"{self.name}.ok")
-        )
+        built_fingerprint = self.built_fingerprint()
+        if built_fingerprint is None:
+            return False
+        if fingerprint is not None and built_fingerprint != fingerprint:
+            return False
+        return self.patched_files_intact()
 
-    def is_needed(self) -> bool:
+    def is_needed(self, fingerprint: Optional[str] = None) -> bool:
         """
         Check if library need to build or not
 
+        Parameters
+        ----------
+        fingerprint: Optional[str]
+            Current fingerprint of the library inputs
+
         Returns
         -------
         bool
         """
-        return self.name in self.__options.targets and not self.is_already_build()
+        return self.name in self.__options.targets and not self.is_already_build(
+            fingerprint
+        )
 
-    def mark_as_built(self) -> None:
+    def mark_as_built(
+        self, fingerprint: str = "", patched_files: Optional[Dict[str, str]] = None
+    ) -> None:
         """
         Mark if the library has been build
 
+        Parameters
+        ----------
+        fingerprint: str (default "")
+            Fingerprint of the library inputs
+        patched_files: Optional[Dict[str, str]]
+            sha256 of the installed files patched by the hooks, the library
+            is built again if one of them changes
+
         Returns
         -------
         None
         """
-        filename = os.path.join(self.__options.target_dir, f"{self.name}.ok")
-        with open(filename, "w", encoding="utf-8") as file:
-            file.close()
+        with open(self.stamp_path, "w", encoding="utf-8") as file:
+            file.write(f"{fingerprint}\n")
+            for path, digest in sorted((patched_files or {}).items()):
+                file.write(f"{digest}  {path}\n")
 
 
 class LibraryManager:
@@ -262,11 +533,11 @@ class LibraryManager:
         for lib, data in lib_data.items():
             module_name = lib.replace("-", "_")
             patch = (
-                importlib.import_module(f"libraries.{module_name}")
+                f"libraries.{module_name}"
                 if os.path.isfile(f"libraries/{module_name}.py")
                 else None
             )
-            cls.data[lib] = Library(lib, data, options, patch)
+            cls.data[lib] = Library(lib, data, options, module_name=patch)
 
     @classmethod
     def get_library(cls, name: str) -> Optional[Library]:
@@ -0,0 +1,248 @@
+"""
+Link-time optimisation of the libraries and ffmpeg, and the size and speed
+of the ffmpeg binary it gives
+"""
+from typing import Dict, List, Optional
+import json
+import os
+import os.path
+import re
+import time
+import plumbum
+from file_utils import file_lock, write_atomic
+from fingerprint import tool_id
+
+# ffmpeg runs timed by the report, each the fastest of BENCHMARK_REPEATS
+BENCHMARKS = {
+    "scale": "-f lavfi -i testsrc2=size=1920x1080:rate=30:duration=10 "
+    "-vf scale=1280:720 -f null -",
+    "mpeg4": "-f lavfi -i testsrc2=size=1280x720:rate=30:duration=5 "
+    "-c:v mpeg4 -f null -",
+    "aac": "-f lavfi -i sine=frequency=440:sample_rate=48000:duration=120 "
+    "-c:a aac -f null -",
+}
+BENCHMARK_REPEATS = 3
+
+_ACTIVE: Optional["LinkTimeOptimisation"] = None
+
+
+class LinkTimeOptimisation:
+    """
+    Compiler flags and archiver wrappers of LTO
+
+    GCC objects keep their regular code too (-ffat-lto-objects), so the
+    libraries left out of LTO and the configure checks still link them.
+    """
+
+    def __init__(self, env: Dict[str, str]):
+        self.__compiler = (env.get("CC") or "cc").split()[-1]
+        self.__clang = "clang" in tool_id(self.__compiler)
+
+    @property
+    def flags(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Compile and link flags
+        """
+        if self.__clang:
+            return "-flto=thin"
+        return "-flto=auto -ffat-lto-objects"
+
+    @property
+    def tools(self) -> Dict[str, str]:
+        """
+        Return archiver tools understanding LTO objects, matching the
+        compiler version
+
+        Returns
+        -------
+        Dict[str, str]
+            Command per variable (AR, RANLIB, NM)
+        """
+        if self.__clang:
+            match = re.match(r"(.*?)clang(-[\d.]+)?$", self.__compiler)
+            prefix, suffix = match.groups("") if match else ("", "")
+            return {
+                name: f"{prefix}llvm-{tool}{suffix}"
+                for name, tool in (("AR", "ar"), ("RANLIB", "ranlib"), ("NM", "nm"))
+            }
+        match = re.match(r"(.*?)(gcc|cc)(-[\d.]+)?$", self.__compiler)
+        prefix, _, suffix = match.groups("") if match else ("", "", "")
+        return {
+            name: f"{prefix}gcc-{tool}{suffix}"
+            for name, tool in (("AR", "ar"), ("RANLIB", "ranlib"), ("NM", "nm"))
+        }
+
+    def missing_tools(self) -> List[str]:
+        """
+        Returns
+        -------
+        List[str]
+            Archiver tools that aren't installed
+        """
+        missing = []
+        for tool in self.tools.values():
+            try:
+                plumbum.local.which(tool)
+            except plumbum.commands.CommandNotFound:
+                missing.append(tool)
+        return missing
+
+    def env(self, env: Dict[str, str]) -> Dict[str, str]:
+        """
+        Return environment building a library with LTO
+
+        Parameters
+        ----------
+        env: Dict[str, str]
+            Current environment
+
+        Returns
+        -------
+        Dict[str, str]
+        """
+        return {
+            **{
+                name: f"{env.get(name, '')} {self.flags}"
+                for name in ("CFLAGS", "CXXFLAGS", "LDFLAGS")
+            },
+            **self.tools,
+        }
+
+
+def measure(binary: str) -> Dict[str, float]:
+    """
+    Return size of the ffmpeg binary and seconds of every benchmark
+
+    Parameters
+    ----------
+    binary: str
+        ffmpeg binary
+
+    Returns
+    -------
+    Dict[str, float]
+        Benchmarks that failed are left out
+    """
+    result = {"size": float(os.path.getsize(binary))}
+    for name, args in BENCHMARKS.items():
+        timings = []
+        for _ in range(BENCHMARK_REPEATS):
+            start = time.monotonic()
+            try:
+                plumbum.local[binary]("-hide_banner", "-nostdin", *args.split())
+            except (OSError, plumbum.commands.ProcessExecutionError):
+                break
+            timings.append(time.monotonic() - start)
+        else:
+            result[name] = min(timings)
+    return result
+
+
+class BinaryReport:
+    """
+    Last measurement of an ffmpeg binary built with and without LTO, kept in
+    <cache dir>/lto-report.json
+    """
+
+    def __init__(self, cache_dir: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__path = os.path.join(cache_dir, "lto-report.json")
+        self.__lock = f"{self.__path}.lock"
+
+    def __read(self) -> Dict[str, dict]:
+        try:
+            with open(self.__path, encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def fingerprint(self, mode: str) -> Optional[str]:
+        """
+        Return fingerprint of the last measured binary
+
+        Parameters
+        ----------
+        mode: str
+            "lto" or "baseline"
+
+        Returns
+        -------
+        Optional[str]
+        """
+        return self.__read().get(mode, {}).get("fingerprint")
+
+    def record(self, mode: str, fingerprint: str, binary: str) -> Dict[str, float]:
+        """
+        Measure binary and keep the result
+
+        Parameters
+        ----------
+        mode: str
+            "lto" or "baseline"
+        fingerprint: str
+            Fingerprint of the ffmpeg build
+        binary: str
+            ffmpeg binary
+
+        Returns
+        -------
+        Dict[str, float]
+            Measurement
+        """
+        result = measure(binary)
+        with file_lock(self.__lock):
+            data = self.__read()
+            data[mode] = {"fingerprint": fingerprint, "measurement": result}
+            write_atomic(self.__path, json.dumps(data, indent=2))
+        return result
+
+    def lines(self) -> List[str]:
+        """
+        Return LTO binary measurement against the baseline
+
+        Returns
+        -------
+        List[str]
+        """
+        data = self.__read()
+        lto = data.get("lto", {}).get("measurement")
+        if lto is None:
+            return []
+        baseline = data.get("baseline", {}).get("measurement", {})
+        result = []
+        for name, value in lto.items():
+            text = (
+                f"{value / 1024**2:.2f}M" if name == "size" else f"{value:.2f}s"
+            )
+            if baseline.get(name):
+                text += f" ({(value / baseline[name] - 1) * 100:+.1f}%)"
+            result.append(f"{name}: {text}")
+        if not baseline:
+            result.append("No measurement of a build without LTO to compare with")
+        return result
+
+
+def activate(lto: Optional[LinkTimeOptimisation]) -> None:
+    """
+    Set LTO used by the builds
+
+    Parameters
+    ----------
+    lto: Optional[LinkTimeOptimisation]
+        LTO or None to disable it
+    """
+    global _ACTIVE  # pylint: disable=global-statement
+    _ACTIVE = lto
+
+
+def active() -> Optional[LinkTimeOptimisation]:
+    """
+    Returns
+    -------
+    Optional[LinkTimeOptimisation]
+        LTO used by the builds
+    """
+    return _ACTIVE
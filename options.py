@@ -4,6 +4,11 @@ Contains build data
 from dataclasses import dataclass
 import os
 
+COMPILER_LAUNCHERS = ("ccache", "sccache")
+PROFILES = ("default", "fast")
+# Libraries trained by the PGO build
+PGO_LIBRARIES = ("ffmpeg",)
+
 
 @dataclass
 class Options:
@@ -13,7 +18,32 @@ class Options:
 
     targets: list
     threads: int = 1
+    parallel_builds: int = 1
+    memory_limit: int = 0
+    memory_pressure_limit: float = 10.0
+    jobserver: bool = True
+    prefetch_workers: int = 4
+    download_rate_limit: int = 0
+    verify_downloads: bool = True
+    cache_dir: str = ""
+    source_cache: bool = True
+    artifact_cache: bool = True
+    artifact_cache_size: int = 10 * 1024**3
+    compiler_launcher: str = ""
+    config_cache: bool = False
+    profile: str = "default"
+    pgo: bool = False
+    lto: bool = False
+    # -march of every build of the variant libraries and ffmpeg
+    march_variants: tuple = ()
+    # Set on the build of one variant
+    march: str = ""
+    pgo_workload: str = ""
+    ram_dir: str = ""
+    ram_budget: int = 0
     silent: bool = False
+    compress_logs: bool = False
+    log_tail_lines: int = 50
     target_dir: str = "target"
     release_dir: str = "release"
     bin_dir: str = "bin"
@@ -29,3 +59,12 @@ class Options:
             self.target_dir = os.path.join(os.getcwd(), self.target_dir)
         if not self.release_dir.startswith("/"):
             self.release_dir = os.path.join(os.getcwd(), self.release_dir)
+        if not self.cache_dir:
+            cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+                os.path.expanduser("~"), ".cache"
+            )
+            self.cache_dir = os.path.join(cache_home, "ffmpeg-builder")
+        elif not self.cache_dir.startswith("/"):
+            self.cache_dir = os.path.join(os.getcwd(), self.cache_dir)
+        if self.pgo_workload and not self.pgo_workload.startswith("/"):
+            self.pgo_workload = os.path.join(os.getcwd(), self.pgo_workload)
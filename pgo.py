@@ -0,0 +1,416 @@
+"""
+Profile-guided optimisation of the ffmpeg binary: an instrumented build,
+a training run on lavfi test sources, then the optimised build
+"""
+from shutil import copy2, copytree, rmtree
+from typing import Dict, List, Optional
+import glob
+import hashlib
+import json
+import os
+import os.path
+import sys
+import tempfile
+import plumbum
+from build_systems import BuildSystem
+from build_utils import run_fg
+from fingerprint import tool_id
+import dry_run
+import tracing
+
+# Length of every training encode
+TRAINING_SECONDS = 5
+VIDEO_SOURCE = f"testsrc2=size=1280x720:rate=30:duration={TRAINING_SECONDS}"
+AUDIO_SOURCE = f"sine=frequency=440:sample_rate=48000:duration={TRAINING_SECONDS}"
+# Encoder, stream type, container and arguments of the default workload,
+# only the encoders of the build are trained
+ENCODERS = (
+    ("libx264", "v", "mkv", ["-preset", "medium"]),
+    ("libx265", "v", "mkv", ["-preset", "fast"]),
+    ("libvpx-vp9", "v", "webm", ["-deadline", "good", "-cpu-used", "4", "-row-mt", "1"]),
+    ("libaom-av1", "v", "mkv", ["-cpu-used", "8"]),
+    ("libsvtav1", "v", "mkv", ["-preset", "10"]),
+    ("libkvazaar", "v", "mkv", []),
+    ("libopenh264", "v", "mkv", []),
+    ("libxvid", "v", "avi", []),
+    ("libtheora", "v", "ogg", []),
+    ("mpeg4", "v", "mkv", []),
+    ("aac", "a", "m4a", []),
+    ("libfdk_aac", "a", "m4a", []),
+    ("libmp3lame", "a", "mp3", []),
+    ("libopus", "a", "ogg", []),
+    ("libvorbis", "a", "ogg", []),
+    ("flac", "a", "flac", []),
+)
+# Replaced by the training output directory in the workload
+OUTPUT_DIR = "{dir}"
+
+
+def default_workload(encoders: Optional[List[str]] = None) -> List[List[str]]:
+    """
+    Return ffmpeg runs encoding the test sources with every encoder, then
+    decoding and scaling the results
+
+    Parameters
+    ----------
+    encoders: Optional[List[str]] (default None)
+        Encoders of the build, None for all of them
+
+    Returns
+    -------
+    List[List[str]]
+        Arguments of every ffmpeg run
+    """
+    runs = [
+        ["-f", "lavfi", "-i", VIDEO_SOURCE, "-vf", "scale=640:360", "-f", "null", "-"],
+    ]
+    for encoder, stream, container, args in ENCODERS:
+        if encoders is not None and encoder not in encoders:
+            continue
+        output = f"{OUTPUT_DIR}/{encoder}.{container}"
+        source = VIDEO_SOURCE if stream == "v" else AUDIO_SOURCE
+        runs.append(
+            ["-f", "lavfi", "-i", source, f"-c:{stream}", encoder, *args, output]
+        )
+        runs.append(["-i", output, "-f", "null", "-"])
+    return runs
+
+
+def load_workload(path: str) -> List[List[str]]:
+    """
+    Read training workload, a JSON list of ffmpeg argument lists where
+    {dir} is the training output directory
+
+    Parameters
+    ----------
+    path: str
+        Workload file
+
+    Returns
+    -------
+    List[List[str]]
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            workload = json.load(file)
+    except (OSError, ValueError) as err:
+        print(f"Can't read PGO workload {path}: {err}")
+        sys.exit(1)
+    if not isinstance(workload, list) or not all(
+        isinstance(_, list) and all(isinstance(arg, str) for arg in _)
+        for _ in workload
+    ):
+        print(f"PGO workload {path} must be a list of ffmpeg argument lists")
+        sys.exit(1)
+    return workload
+
+
+def build_encoders(binary: str) -> Optional[List[str]]:
+    """
+    Return encoders compiled into the ffmpeg binary
+
+    Parameters
+    ----------
+    binary: str
+        ffmpeg binary
+
+    Returns
+    -------
+    Optional[List[str]]
+        None if they can't be listed
+    """
+    if dry_run.active() is not None:
+        return None
+    try:
+        output = plumbum.local[binary]("-hide_banner", "-encoders")
+    except (
+        OSError,
+        plumbum.commands.CommandNotFound,
+        plumbum.commands.ProcessExecutionError,
+    ):
+        return None
+    # " V....D libx264  libx264 H.264 ..."
+    return [
+        line.split()[1]
+        for line in output.splitlines()
+        if line.startswith(" ") and len(line.split()) > 1
+    ]
+
+
+class ProfileStore:
+    """
+    Training profiles kept in <cache dir>/pgo/<key>, gcda files of GCC in the
+    tree of the build dir or the merged profile of clang
+    """
+
+    def __init__(self, cache_dir: str):
+        self.__root = os.path.join(cache_dir, "pgo")
+
+    def path(self, key: str) -> str:
+        """
+        Return directory of a profile
+
+        Parameters
+        ----------
+        key: str
+            Profile key
+
+        Returns
+        -------
+        str
+        """
+        return os.path.join(self.__root, key)
+
+    def has(self, key: str) -> bool:
+        """
+        Check if a profile is stored
+
+        Parameters
+        ----------
+        key: str
+            Profile key
+
+        Returns
+        -------
+        bool
+        """
+        return os.path.isdir(self.path(key))
+
+    def save(self, key: str, files: Dict[str, str]) -> None:
+        """
+        Store profile files
+
+        Parameters
+        ----------
+        key: str
+            Profile key
+        files: Dict[str, str]
+            Files per path relative to the profile directory
+        """
+        os.makedirs(self.__root, exist_ok=True)
+        tmp_entry = tempfile.mkdtemp(dir=self.__root, prefix=".tmp-")
+        for rel_path, path in files.items():
+            os.makedirs(os.path.dirname(os.path.join(tmp_entry, rel_path)), exist_ok=True)
+            copy2(path, os.path.join(tmp_entry, rel_path))
+        rmtree(self.path(key), ignore_errors=True)
+        try:
+            os.rename(tmp_entry, self.path(key))
+        except OSError:
+            # Stored by a concurrent build in the meantime
+            rmtree(tmp_entry, ignore_errors=True)
+
+
+class ProfileGuided(BuildSystem):
+    """
+    Build instrumented, train on the workload, clean and build again with
+    the profile. A stored profile of the same sources, parameters and
+    compiler skips straight to the optimised build.
+
+    Configure takes the compiler flags as ffmpeg's --extra-*flags.
+    """
+
+    def __init__(
+        self,
+        inner: BuildSystem,
+        library_obj,
+        store: ProfileStore,
+        workload_path: str = "",
+        silent: bool = False,
+    ):
+        if not inner.cleanable:
+            print(
+                f"PGO of {library_obj.name} needs a build system able to clean "
+                "between the instrumented and the optimised build"
+            )
+            sys.exit(1)
+        super().__init__(library_obj, "", 1, silent)
+        self.__inner = inner
+        self.__store = store
+        self.__workload_path = workload_path
+        self.__key = ""
+
+    @property
+    def __compiler(self) -> str:
+        """
+        Return compiler of the build, FFmpeg takes it from --cc only
+        """
+        compiler = "gcc"
+        for param in self.__inner.params:
+            if param.startswith("--cc="):
+                compiler = param[len("--cc=") :]
+        # Without the compiler launcher
+        return compiler.split()[-1]
+
+    @property
+    def __is_clang(self) -> bool:
+        return "clang" in tool_id(self.__compiler)
+
+    @property
+    def __raw_dir(self) -> str:
+        """
+        Return directory of the clang raw profiles
+        """
+        return os.path.join(os.getcwd(), "pgo-profraw")
+
+    def __profile_key(self) -> str:
+        """
+        Return key of the profile of the build
+        """
+        data = {
+            "download_params": self._library.download_params,
+            "sha256": self._library.sha256,
+            "params": [*self.__inner.params, *self.__inner.profile_params()],
+            "compiler": tool_id(self.__compiler),
+            # -march of the variant builds
+            "cflags": plumbum.local.env.get("CFLAGS", ""),
+            "workload": (
+                load_workload(self.__workload_path) if self.__workload_path else None
+            ),
+        }
+        return hashlib.sha256(
+            json.dumps(data, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def __use_flags(self, flags: List[str]) -> None:
+        """
+        Configure the wrapped build with extra compiler and linker flags
+        """
+        if not flags:
+            self.__inner.extra_params = []
+            return
+        joined = " ".join(flags)
+        self.__inner.extra_params = [
+            f"--extra-cflags={joined}",
+            f"--extra-cxxflags={joined}",
+            f"--extra-ldflags={joined}",
+        ]
+
+    def __generate_flags(self) -> List[str]:
+        if self.__is_clang:
+            return [f"-fprofile-generate={self.__raw_dir}"]
+        # FFmpeg decodes and encodes in threads
+        return ["-fprofile-generate", "-fprofile-update=prefer-atomic"]
+
+    def __optimise_flags(self) -> List[str]:
+        if self.__is_clang:
+            return [
+                f"-fprofile-use={self.__store.path(self.__key)}/default.profdata",
+                "-Wno-profile-instr-unprofiled",
+                "-Wno-profile-instr-out-of-date",
+            ]
+        # Code the workload doesn't reach stays optimised for speed
+        return [
+            "-fprofile-use",
+            "-fprofile-partial-training",
+            "-Wno-missing-profile",
+            "-Wno-error=coverage-mismatch",
+        ]
+
+    def __restore(self) -> None:
+        """
+        Put stored gcda files next to the objects
+        """
+        if (
+            not self.__is_clang
+            and dry_run.active() is None
+            and self.__store.has(self.__key)
+        ):
+            copytree(self.__store.path(self.__key), os.getcwd(), dirs_exist_ok=True)
+
+    def __train(self) -> None:
+        """
+        Run the workload with the instrumented binary
+        """
+        binary = os.path.join(os.getcwd(), "ffmpeg")
+        workload = (
+            load_workload(self.__workload_path)
+            if self.__workload_path
+            else default_workload(build_encoders(binary))
+        )
+        output_dir = os.path.join(os.getcwd(), "pgo-training")
+        os.makedirs(output_dir, exist_ok=True)
+        failed = 0
+        for args in workload:
+            args = [_.replace(OUTPUT_DIR, output_dir) for _ in args]
+            if not run_fg(
+                binary, "-hide_banner", "-nostdin", "-y", *args, silent=self._silent
+            ):
+                failed += 1
+        rmtree(output_dir, ignore_errors=True)
+        if failed:
+            print(f"{failed} of {len(workload)} PGO training runs failed")
+
+    def __save(self) -> None:
+        """
+        Store the profile of the training
+        """
+        if dry_run.active() is not None:
+            return
+        if self.__is_clang:
+            merged = os.path.join(os.getcwd(), "default.profdata")
+            raw_files = glob.glob(os.path.join(self.__raw_dir, "*.profraw"))
+            if not raw_files:
+                print("The PGO training wrote no profile, building without it")
+                return
+            if not run_fg(
+                "llvm-profdata",
+                "merge",
+                f"-output={merged}",
+                *raw_files,
+                silent=self._silent,
+            ):
+                sys.exit(1)
+            self.__store.save(self.__key, {"default.profdata": merged})
+            return
+        files = {
+            os.path.relpath(path): path
+            for path in glob.glob("**/*.gcda", recursive=True)
+        }
+        if not files:
+            print("The PGO training wrote no profile, building without it")
+            return
+        self.__store.save(self.__key, files)
+
+    # The wrapped adapter times the steps, they aren't timed twice
+    def configure(self) -> None:
+        self._configure()
+
+    def compile(self) -> None:
+        self._compile()
+
+    def install(self) -> None:
+        self._install()
+
+    def clean(self) -> None:
+        self._clean()
+
+    def _configure(self) -> None:
+        self.__key = self.__profile_key()
+        if self.__store.has(self.__key):
+            print(f"Using stored PGO profile {self.__store.path(self.__key)}")
+            self.__restore()
+            self.__use_flags(self.__optimise_flags())
+        else:
+            self.__use_flags(self.__generate_flags())
+        self.__inner.configure()
+
+    def _compile(self) -> None:
+        self.__inner.compile()
+        if self.__store.has(self.__key):
+            return
+        with tracing.phase("train"):
+            self.__train()
+            self.__save()
+        self.__inner.clean()
+        self.__restore()
+        self.__use_flags(
+            self.__optimise_flags() if self.__store.has(self.__key) else []
+        )
+        self.__inner.configure()
+        self.__inner.compile()
+
+    def _install(self) -> None:
+        self.__inner.install()
+
+    def _clean(self) -> None:
+        self.__inner.clean()
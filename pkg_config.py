@@ -0,0 +1,355 @@
+"""
+Memoized pkg-config for the release prefix
+
+FFmpeg configure runs pkg-config hundreds of times against the same .pc
+files. The builds run this module through a shell wrapper placed first in
+PATH: the answers of the system pkg-config (stdout, stderr and exit code)
+are memoized per command line in an index, dropped when a .pc file or the
+fixups change. Static link flag fixups declared in libraries.json are
+applied to copies of the .pc files searched first, instead of being
+patched into the installed files.
+
+Queries in another environment (other search paths, a sysroot) are handed
+to the system pkg-config.
+"""
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import os.path
+import re
+import shlex
+import subprocess
+import sys
+from file_utils import write_atomic
+
+INDEX_FORMAT = 2
+# Fixup keys and the .pc field they extend
+FIXUP_FIELDS = {"cflags": "Cflags", "libs": "Libs", "libs_private": "Libs.private"}
+# Environment changing the answers
+QUERY_ENV = (
+    "PKG_CONFIG_LIBDIR",
+    "PKG_CONFIG_PATH",
+    "PKG_CONFIG_SYSROOT_DIR",
+    "PKG_CONFIG_ALLOW_SYSTEM_CFLAGS",
+    "PKG_CONFIG_ALLOW_SYSTEM_LIBS",
+)
+
+
+def shim_env(libdir: str) -> Dict[str, str]:
+    """
+    Return environment of the builds, the only one memoized
+
+    Parameters
+    ----------
+    libdir: str
+        pkgconfig dirs of the release prefixes, separated by os.pathsep
+
+    Returns
+    -------
+    Dict[str, str]
+    """
+    return {name: libdir if name == "PKG_CONFIG_LIBDIR" else "" for name in QUERY_ENV}
+
+
+def fix_pc(text: str, fixup: dict, pc_dir: str) -> str:
+    """
+    Apply a fixup to the content of a .pc file
+
+    Parameters
+    ----------
+    text: str
+        Content of the .pc file
+    fixup: dict
+        Flags added per FIXUP_FIELDS key, flags removed from every field in
+        "drop"
+    pc_dir: str
+        Directory of the installed file, ${pcfiledir} keeps pointing there
+
+    Returns
+    -------
+    str
+    """
+    drop = set(fixup.get("drop", ()))
+    added = {field: fixup.get(key, []) for key, field in FIXUP_FIELDS.items()}
+    lines = []
+    for line in text.replace("\\\n", " ").replace("${pcfiledir}", pc_dir).splitlines():
+        match = re.match(r"\s*(Cflags|Libs|Libs\.private)\s*:(.*)$", line)
+        if match is None:
+            lines.append(line)
+            continue
+        field, value = match.groups()
+        flags = [_ for _ in value.split() if _ not in drop]
+        lines.append(f"{field}: {' '.join([*flags, *added.pop(field)])}")
+    lines += [f"{field}: {' '.join(flags)}" for field, flags in added.items() if flags]
+    return "\n".join(lines) + "\n"
+
+
+def system_pkg_config(shim: str) -> Optional[str]:
+    """
+    Return the pkg-config found in PATH after the shim
+
+    Parameters
+    ----------
+    shim: str
+        Path of the shim
+
+    Returns
+    -------
+    Optional[str]
+    """
+    shim = os.path.realpath(shim) if shim else ""
+    for path_dir in os.environ.get("PATH", "").split(os.pathsep):
+        candidate = os.path.join(path_dir, "pkg-config")
+        if os.access(candidate, os.X_OK) and os.path.realpath(candidate) != shim:
+            return candidate
+    return None
+
+
+class PkgConfig:
+    """
+    Answers of the system pkg-config for the .pc files of some directories,
+    memoized until one of them or the fixups change
+    """
+
+    def __init__(
+        self,
+        pkg_config: str,
+        search_dirs: List[str],
+        shim_dir: str,
+    ):
+        """
+        Parameters
+        ----------
+        pkg_config: str
+            System pkg-config
+        search_dirs: List[str]
+            pkgconfig dirs of the release prefixes
+        shim_dir: str
+            Directory of the index, the fixups and the fixed .pc files
+        """
+        self.__pkg_config = pkg_config
+        self.__search_dirs = search_dirs
+        self.__index_path = os.path.join(shim_dir, "index.json")
+        self.__fixups_path = os.path.join(shim_dir, "fixups.json")
+        self.__fixed_dir = os.path.join(shim_dir, "pkgconfig")
+        self.__inputs = self.__stat_inputs()
+        self.__index = self.__load()
+        self.__dirty = False
+
+    def __stat_inputs(self) -> Dict[str, Optional[List[int]]]:
+        """
+        Return mtime and size of the .pc files and the fixups
+        """
+        inputs = {}
+        for search_dir in self.__search_dirs:
+            try:
+                names = sorted(os.listdir(search_dir))
+            except OSError:
+                continue
+            for name in names:
+                if name.endswith(".pc"):
+                    path = os.path.join(search_dir, name)
+                    inputs[path] = self.__stat(path)
+        inputs[self.__fixups_path] = self.__stat(self.__fixups_path)
+        return inputs
+
+    @staticmethod
+    def __stat(path: str) -> Optional[List[int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def __load(self) -> dict:
+        """
+        Read the index if its answers are for the current inputs
+        """
+        try:
+            with open(self.__index_path, encoding="utf-8") as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            index = {}
+        if index.get("format") != INDEX_FORMAT or index.get("inputs") != self.__inputs:
+            return {"format": INDEX_FORMAT, "inputs": self.__inputs, "answers": {}}
+        return index
+
+    def __fix(self) -> None:
+        """
+        Write the fixed copies of the .pc files having fixups
+        """
+        try:
+            with open(self.__fixups_path, encoding="utf-8") as file:
+                fixups = json.load(file)
+        except (OSError, ValueError):
+            fixups = {}
+        os.makedirs(self.__fixed_dir, exist_ok=True)
+        fixed = set()
+        for path in self.__inputs:
+            name = os.path.basename(path)[: -len(".pc")]
+            if path.endswith(".pc") and name in fixups and name not in fixed:
+                # The first search dir holding the module wins
+                fixed.add(name)
+                with open(path, encoding="utf-8", errors="replace") as file:
+                    text = fix_pc(file.read(), fixups[name], os.path.dirname(path))
+                write_atomic(os.path.join(self.__fixed_dir, f"{name}.pc"), text)
+        for name in os.listdir(self.__fixed_dir):
+            if name.endswith(".pc") and name[: -len(".pc")] not in fixed:
+                try:
+                    os.remove(os.path.join(self.__fixed_dir, name))
+                except OSError:
+                    pass
+
+    def query(self, args: List[str], env: Dict[str, str]) -> Tuple[str, str, int]:
+        """
+        Answer a query, memoized until the inputs change
+
+        Parameters
+        ----------
+        args: List[str]
+            Command line arguments
+        env: Dict[str, str]
+            Environment variables changing the answer
+
+        Returns
+        -------
+        Tuple[str, str, int]
+            stdout, stderr and exit code
+        """
+        key = json.dumps([args, env])
+        answer = self.__index["answers"].get(key)
+        if answer is None:
+            self.__fix()
+            process = subprocess.run(
+                [self.__pkg_config, *args],
+                env={
+                    **os.environ,
+                    **env,
+                    "PKG_CONFIG_LIBDIR": os.pathsep.join(
+                        [self.__fixed_dir, env["PKG_CONFIG_LIBDIR"]]
+                    ),
+                },
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                check=False,
+            )
+            answer = [process.stdout, process.stderr, process.returncode]
+            self.__index["answers"][key] = answer
+            self.__dirty = True
+        return answer[0], answer[1], answer[2]
+
+    def save(self) -> None:
+        """
+        Write the index back if it changed, with the answers other processes
+        saved for the same inputs since it was read
+        """
+        if not self.__dirty:
+            return
+        saved = self.__load()
+        self.__index["answers"] = {**saved["answers"], **self.__index["answers"]}
+        try:
+            write_atomic(self.__index_path, json.dumps(self.__index))
+        except OSError:
+            pass
+        self.__dirty = False
+
+
+def install_shim(shim_dir: str, fixups: Dict[str, dict], libdir: str) -> str:
+    """
+    Write the pkg-config shim and the fixups it applies
+
+    Parameters
+    ----------
+    shim_dir: str
+        Directory of the shim, its bin dir is put first in PATH by the
+        builds
+    fixups: Dict[str, dict]
+        Fixups per module, see fix_pc
+    libdir: str
+        pkgconfig dirs of the release prefixes, separated by os.pathsep
+
+    Returns
+    -------
+    str
+        Path of the shim
+    """
+    os.makedirs(os.path.join(shim_dir, "bin"), exist_ok=True)
+    # Rewritten only when changed, the mtime invalidates the answers
+    for path, content in (
+        (os.path.join(shim_dir, "fixups.json"), json.dumps(fixups, indent=2, sort_keys=True)),
+        (
+            os.path.join(shim_dir, "bin", "pkg-config"),
+            "#!/bin/sh\n# pkg-config shim written by ffmpeg-builder (pkg_config.py)\n"
+            + " ".join(
+                map(
+                    shlex.quote,
+                    [
+                        "exec",
+                        sys.executable,
+                        "-S",
+                        os.path.abspath(__file__),
+                        "--shim-dir",
+                        shim_dir,
+                        "--shim-libdir",
+                        libdir,
+                        "--",
+                    ],
+                )
+            )
+            + ' "$@"\n',
+        ),
+    ):
+        try:
+            with open(path, encoding="utf-8") as file:
+                unchanged = file.read() == content
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            write_atomic(path, content)
+    shim = os.path.join(shim_dir, "bin", "pkg-config")
+    os.chmod(shim, 0o755)
+    return shim
+
+
+def main(argv: List[str]) -> int:
+    """
+    Run a query like pkg-config
+
+    Parameters
+    ----------
+    argv: List[str]
+        --shim-dir and --shim-libdir when run by the shim, then "--" and
+        the pkg-config arguments
+
+    Returns
+    -------
+    int
+        Exit code
+    """
+    shim_options: Dict[str, str] = {}
+    if "--" in argv:
+        separator = argv.index("--")
+        shim_options = dict(zip(argv[:separator:2], argv[1:separator:2]))
+        argv = argv[separator + 1 :]
+    shim_dir = shim_options.get("--shim-dir")
+    libdir = shim_options.get("--shim-libdir", "")
+    pkg_config = system_pkg_config(
+        os.path.join(shim_dir, "bin", "pkg-config") if shim_dir else ""
+    )
+    if pkg_config is None:
+        print("pkg-config: not installed", file=sys.stderr)
+        return 1
+    env = {name: os.environ.get(name, "") for name in QUERY_ENV}
+    if shim_dir is None or env != shim_env(libdir):
+        os.execv(pkg_config, [pkg_config, *argv])
+    memoized = PkgConfig(pkg_config, libdir.split(os.pathsep), shim_dir)
+    answer = memoized.query(argv, env)
+    memoized.save()
+    sys.stdout.write(answer[0])
+    sys.stderr.write(answer[1])
+    return answer[2]
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,211 @@
+"""
+Build directories on a RAM-backed file system (e.g. /dev/shm), shared by
+the parallel builds within a size budget
+"""
+from shutil import rmtree
+from typing import Dict, Optional
+import hashlib
+import json
+import logging
+import os
+import os.path
+from file_utils import file_lock
+from resources import available_memory_mb
+
+logger = logging.getLogger(__name__)
+
+# Source tree plus build products compared to the compressed archive
+EXPANSION = 8
+# Margin added to the tree size measured in previous builds
+MARGIN = 0.2
+# Share of the available memory used when no budget is set
+DEFAULT_SHARE = 0.25
+
+
+def tree_size(path: str) -> int:
+    """
+    Return space used by the files under path
+
+    Parameters
+    ----------
+    path: str
+        Directory
+
+    Returns
+    -------
+    int
+        Bytes
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += getattr(stat, "st_blocks", 0) * 512 or stat.st_size
+    return total
+
+
+def free_space(path: str) -> int:
+    """
+    Return space left on the file system of path
+
+    Parameters
+    ----------
+    path: str
+        Any path on the file system
+
+    Returns
+    -------
+    int
+        Bytes
+    """
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+class RamDisk:
+    """
+    Hand out a directory per library while its expected size fits next to
+    the other libraries building there
+
+    The reservations are kept in a ledger file under a lock, as every build
+    runs in its own process.
+    """
+
+    def __init__(self, base_dir: str, target_dir: str, budget: int = 0):
+        key = hashlib.sha256(target_dir.encode("utf-8")).hexdigest()[:12]
+        self.__root = os.path.join(base_dir, f"ffmpeg-builder-{key}")
+        # Trees left by a failed or interrupted run
+        rmtree(self.__root, ignore_errors=True)
+        os.makedirs(self.__root)
+        self.__ledger = os.path.join(self.__root, ".ledger.json")
+        self.__write({})
+        if not budget:
+            budget = free_space(self.__root)
+            available = available_memory_mb()
+            if available is not None:
+                budget = min(budget, int(available * DEFAULT_SHARE * 1024**2))
+        self.__budget = budget
+
+    @property
+    def root(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Directory holding the library trees
+        """
+        return self.__root
+
+    @property
+    def budget(self) -> int:
+        """
+        Returns
+        -------
+        int
+            Bytes shared by the library trees
+        """
+        return self.__budget
+
+    @staticmethod
+    def estimate(archive_size: int, measured_mb: Optional[float] = None) -> int:
+        """
+        Predict the size of a library tree
+
+        Parameters
+        ----------
+        archive_size: int
+            Size of the source archive
+        measured_mb: Optional[float]
+            Largest tree of the previous builds in MiB
+
+        Returns
+        -------
+        int
+            Bytes
+        """
+        if measured_mb is not None:
+            return int(measured_mb * 1024**2 * (1 + MARGIN))
+        return archive_size * EXPANSION
+
+    def __read(self) -> Dict[str, int]:
+        """
+        Return reserved bytes per library
+        """
+        with open(self.__ledger, encoding="utf-8") as file:
+            return json.load(file)
+
+    def __write(self, reservations: Dict[str, int]) -> None:
+        """
+        Replace the reservations
+        """
+        with open(self.__ledger, "w", encoding="utf-8") as file:
+            json.dump(reservations, file)
+
+    def reserve(self, lib_name: str, size: int) -> Optional[str]:
+        """
+        Reserve room for a library tree
+
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+        size: int
+            Expected size of the tree
+
+        Returns
+        -------
+        Optional[str]
+            Directory of the library, None if it doesn't fit
+        """
+        with file_lock(os.path.join(self.__root, ".ledger.lock")):
+            reservations = self.__read()
+            reserved = sum(reservations.values())
+            if reserved + size > self.__budget or size > free_space(self.__root):
+                logger.info(
+                    "%s needs %d bytes, %d of %d reserved",
+                    lib_name,
+                    size,
+                    reserved,
+                    self.__budget,
+                )
+                return None
+            reservations[lib_name] = size
+            self.__write(reservations)
+        work_dir = os.path.join(self.__root, lib_name)
+        os.makedirs(work_dir, exist_ok=True)
+        return work_dir
+
+    def release(self, lib_name: str) -> int:
+        """
+        Remove a library tree and its reservation
+
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+
+        Returns
+        -------
+        int
+            Size the tree reached in bytes
+        """
+        work_dir = os.path.join(self.__root, lib_name)
+        size = tree_size(work_dir)
+        rmtree(work_dir, ignore_errors=True)
+        with file_lock(os.path.join(self.__root, ".ledger.lock")):
+            reservations = self.__read()
+            reservations.pop(lib_name, None)
+            self.__write(reservations)
+        return size
+
+    def close(self) -> None:
+        """
+        Remove the RAM dir unless a failed build left its tree there
+        """
+        with file_lock(os.path.join(self.__root, ".ledger.lock")):
+            if self.__read():
+                return
+        rmtree(self.__root, ignore_errors=True)
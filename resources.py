@@ -0,0 +1,193 @@
+"""
+Memory accounting of the builds running at the same time
+"""
+from typing import Dict, Iterable, List, Optional
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Estimate of a library with no declared or measured memory use
+DEFAULT_MEMORY_MB = 1024
+# Part of the available memory kept free for the rest of the system
+HEADROOM = 0.1
+
+
+def available_memory_mb() -> Optional[float]:
+    """
+    Return memory available without swapping (Linux MemAvailable)
+
+    Returns
+    -------
+    Optional[float]
+        None if unknown
+    """
+    try:
+        with open("/proc/meminfo", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def memory_pressure() -> Optional[float]:
+    """
+    Return share of the last 10 seconds some tasks were stalled on memory,
+    from Linux pressure stall information
+
+    Returns
+    -------
+    Optional[float]
+        Percentage, None if PSI is unavailable
+    """
+    try:
+        with open("/proc/pressure/memory", encoding="utf-8") as file:
+            for line in file:
+                fields = line.split()
+                if fields and fields[0] == "some":
+                    return float(fields[1].split("=")[1])
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+def tree_rss_mb(pids: Iterable[int]) -> Dict[int, float]:
+    """
+    Return resident memory of every process tree
+
+    Parameters
+    ----------
+    pids: Iterable[int]
+        Root process of every tree
+
+    Returns
+    -------
+    Dict[int, float]
+        MiB per root process, empty if /proc is unavailable
+    """
+    parents: Dict[int, int] = {}
+    rss: Dict[int, int] = {}
+    try:
+        entries = [_ for _ in os.listdir("/proc") if _.isdigit()]
+    except OSError:
+        return {}
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as file:
+                # The command name may contain spaces, fields follow its ")"
+                fields = file.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        parents[int(entry)] = int(fields[1])
+        rss[int(entry)] = int(fields[21])
+    page_mb = os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    roots = set(pids)
+    result = {root: 0.0 for root in roots}
+    for pid, pages in rss.items():
+        ancestor = pid
+        while ancestor > 1 and ancestor not in roots:
+            ancestor = parents.get(ancestor, 0)
+        if ancestor in roots:
+            result[ancestor] += pages * page_mb
+    return result
+
+
+class MemoryGovernor:
+    """
+    Start a build only if the memory it is expected to use fits next to the
+    builds that are running, and not while the system is stalling on memory
+
+    The running builds are counted with their expected peak until they
+    finish, as most of them reach it late, when linking. Memory reserved for
+    something else, like build dirs in RAM, is left out of the default
+    budget.
+    """
+
+    def __init__(
+        self,
+        estimates: Dict[str, float],
+        budget_mb: Optional[float] = None,
+        pressure_limit: float = 10.0,
+        reserved_mb: float = 0,
+    ):
+        self.__estimates = estimates
+        if budget_mb is None:
+            available = available_memory_mb()
+            budget_mb = (
+                available * (1 - HEADROOM) - reserved_mb
+                if available is not None
+                else None
+            )
+        self.__budget_mb = budget_mb
+        self.__pressure_limit = pressure_limit
+        self.peaks: Dict[str, float] = {}
+
+    @property
+    def budget_mb(self) -> Optional[float]:
+        """
+        Returns
+        -------
+        Optional[float]
+            Memory shared by the builds, None if unlimited
+        """
+        return self.__budget_mb
+
+    def estimate(self, lib_name: str) -> float:
+        """
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+
+        Returns
+        -------
+        float
+            Expected peak memory of the build in MiB
+        """
+        return self.__estimates.get(lib_name, DEFAULT_MEMORY_MB)
+
+    def can_start(self, lib_name: str, running: List[str]) -> bool:
+        """
+        Check if the library may start next to the running builds
+
+        A build always starts when nothing else runs, even if it is expected
+        to exceed the budget.
+
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+        running: List[str]
+            Libraries being built
+
+        Returns
+        -------
+        bool
+        """
+        if not running:
+            return True
+        pressure = memory_pressure()
+        if pressure is not None and pressure >= self.__pressure_limit:
+            logger.info("Memory pressure %.1f%%, not starting %s", pressure, lib_name)
+            return False
+        if self.__budget_mb is None:
+            return True
+        committed = sum(
+            max(self.estimate(_), self.peaks.get(_, 0)) for _ in running
+        )
+        return committed + self.estimate(lib_name) <= self.__budget_mb
+
+    def sample(self, running: Dict[int, str]) -> None:
+        """
+        Update the measured peak memory of the running builds
+
+        Parameters
+        ----------
+        running: Dict[int, str]
+            Library name per build process id
+        """
+        for pid, rss_mb in tree_rss_mb(running).items():
+            lib_name = running[pid]
+            self.peaks[lib_name] = max(self.peaks.get(lib_name, 0), rss_mb)
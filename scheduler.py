@@ -0,0 +1,409 @@
+"""
+Resolve the library dependency graph and schedule the builds
+"""
+from typing import Callable, Collection, Dict, List, Optional
+import logging
+import multiprocessing
+import multiprocessing.connection
+import sys
+from fingerprint import fingerprint
+from library_manager import LibraryManager
+from options import Options
+from resources import MemoryGovernor
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two memory samples of the running builds
+SAMPLE_INTERVAL = 1.0
+
+
+class DependencyError(Exception):
+    """
+    Raised when the dependency graph can't be resolved
+    """
+
+
+class BuildGraph:
+    """
+    Dependency graph of the libraries that need to be built
+    """
+
+    def __init__(
+        self,
+        library_mgr: LibraryManager,
+        options: Options,
+        excluded: Collection[str] = (),
+    ):
+        self.__library_mgr = library_mgr
+        self.__options = options
+        # Built by another build, left out of the graph
+        self.__excluded = excluded
+        self.nodes: Dict[str, List[str]] = {}
+        self.fingerprints: Dict[str, str] = {}
+        self.__visiting: List[str] = []
+
+    def __get_library(self, lib_name: str, parent: str = None):
+        """
+        Return library with its dependencies resolved
+
+        Raises
+        ------
+        DependencyError
+            Raised if the library is unknown
+        """
+        library_obj = self.__library_mgr.get_library(lib_name)
+        if library_obj is None:
+            required_by = f" (required by {parent})" if parent else ""
+            raise DependencyError(f"Unknown library {lib_name}{required_by}")
+        library_obj.pre_dependency()
+        return library_obj
+
+    def fingerprint(self, lib_name: str, parent: str = None) -> str:
+        """
+        Return fingerprint of the library inputs, including the fingerprints
+        of its dependencies
+
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+        parent: str (default None)
+            Library that requires this one
+
+        Returns
+        -------
+        str
+
+        Raises
+        ------
+        DependencyError
+            Raised if the library is unknown or depends on itself
+        """
+        if lib_name in self.fingerprints:
+            return self.fingerprints[lib_name]
+        if lib_name in self.__visiting:
+            cycle = self.__visiting[self.__visiting.index(lib_name):] + [lib_name]
+            raise DependencyError(f"Dependency cycle: {' -> '.join(cycle)}")
+        library_obj = self.__get_library(lib_name, parent)
+        self.__visiting.append(lib_name)
+        try:
+            dependency_fingerprints = {
+                dependency: self.fingerprint(dependency, lib_name)
+                for dependency in library_obj.dependencies
+            }
+        finally:
+            self.__visiting.pop()
+        self.fingerprints[lib_name] = fingerprint(
+            library_obj, self.__options, dependency_fingerprints
+        )
+        return self.fingerprints[lib_name]
+
+    def __add(self, lib_name: str, parent: str = None) -> None:
+        """
+        Add library and its missing dependencies to the graph
+
+        Parameters
+        ----------
+        lib_name: str
+            Library name
+        parent: str (default None)
+            Library that requires this one
+
+        Raises
+        ------
+        DependencyError
+            Raised if the library is unknown
+        """
+        if lib_name in self.nodes:
+            return
+        library_obj = self.__get_library(lib_name, parent)
+        if library_obj.is_already_build():
+            print(f"Inputs of {lib_name} changed, rebuilding")
+        self.nodes[lib_name] = []
+        for dependency in library_obj.dependencies:
+            if dependency in self.__excluded:
+                continue
+            dependency_obj = self.__get_library(dependency, lib_name)
+            if dependency_obj.is_already_build(self.fingerprint(dependency)):
+                continue
+            self.__add(dependency, lib_name)
+            self.nodes[lib_name].append(dependency)
+
+    def resolve(self) -> "BuildGraph":
+        """
+        Build the graph from the targets, a library is built again if it was
+        built from different inputs, which includes the inputs of its
+        dependencies
+
+        Returns
+        -------
+        BuildGraph
+        """
+        for lib_name in self.__options.targets:
+            if lib_name in self.__excluded:
+                continue
+            library_obj = self.__get_library(lib_name)
+            if library_obj.is_needed(self.fingerprint(lib_name)):
+                self.__add(lib_name)
+
+        # Build tools must be available before anything else is configured
+        tools = [
+            lib_name
+            for lib_name in self.nodes
+            if self.__library_mgr.get_library(lib_name).is_build_tool
+        ]
+        for lib_name, dependencies in self.nodes.items():
+            if lib_name in tools:
+                continue
+            dependencies.extend(tool for tool in tools if tool not in dependencies)
+        self.topological_order()
+        return self
+
+    def dependents(self) -> Dict[str, List[str]]:
+        """
+        Return libraries depending on every library
+
+        Returns
+        -------
+        Dict[str, List[str]]
+        """
+        result: Dict[str, List[str]] = {lib_name: [] for lib_name in self.nodes}
+        for lib_name, dependencies in self.nodes.items():
+            for dependency in dependencies:
+                result[dependency].append(lib_name)
+        return result
+
+    def priorities(self, durations: Dict[str, float]) -> Dict[str, float]:
+        """
+        Return length of the longest chain of builds starting at every
+        library, building the libraries with the longest chain first
+        shortens the whole build
+
+        Parameters
+        ----------
+        durations: Dict[str, float]
+            Predicted duration of every library
+
+        Returns
+        -------
+        Dict[str, float]
+        """
+        dependents = self.dependents()
+        result: Dict[str, float] = {}
+        for lib_name in reversed(self.topological_order()):
+            result[lib_name] = durations.get(lib_name, 0) + max(
+                (result[dependent] for dependent in dependents[lib_name]), default=0
+            )
+        return result
+
+    def critical_path(self, durations: Dict[str, float]) -> List[str]:
+        """
+        Return the longest chain of dependent builds
+
+        Parameters
+        ----------
+        durations: Dict[str, float]
+            Predicted duration of every library
+
+        Returns
+        -------
+        List[str]
+            Libraries in build order
+        """
+        priorities = self.priorities(durations)
+        dependents = self.dependents()
+        path: List[str] = []
+        candidates = [
+            lib_name for lib_name, dependencies in self.nodes.items() if not dependencies
+        ]
+        while candidates:
+            lib_name = max(candidates, key=lambda _: priorities[_])
+            path.append(lib_name)
+            candidates = dependents[lib_name]
+        return path
+
+    def topological_order(self) -> List[str]:
+        """
+        Return the libraries sorted so every dependency comes first
+
+        Returns
+        -------
+        List[str]
+
+        Raises
+        ------
+        DependencyError
+            Raised if the graph has a cycle
+        """
+        order: List[str] = []
+        state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+        def visit(lib_name: str, path: List[str]) -> None:
+            if state.get(lib_name) == 2:
+                return
+            if state.get(lib_name) == 1:
+                cycle = path[path.index(lib_name):] + [lib_name]
+                raise DependencyError(f"Dependency cycle: {' -> '.join(cycle)}")
+            state[lib_name] = 1
+            for dependency in self.nodes[lib_name]:
+                visit(dependency, path + [lib_name])
+            state[lib_name] = 2
+            order.append(lib_name)
+
+        for lib_name in self.nodes:
+            visit(lib_name, [])
+        return order
+
+
+class Scheduler:
+    """
+    Run the build of every library once its dependencies are built
+
+    Every build runs in its own forked process, even one at a time, so its
+    resource usage is measured apart from the other builds.
+    """
+
+    def __init__(
+        self,
+        graph: BuildGraph,
+        build_func: Callable[[str], None],
+        max_parallel: int = 1,
+        priorities: Optional[Dict[str, float]] = None,
+        governor: Optional[MemoryGovernor] = None,
+    ):
+        self.__graph = graph
+        self.__build_func = build_func
+        self.__max_parallel = max(1, max_parallel)
+        self.__priorities = priorities or {}
+        self.__governor = governor
+
+    def __order(self) -> List[str]:
+        """
+        Return topological order, the libraries with the highest priority
+        first among those that are ready at the same time
+        """
+        order = self.__graph.topological_order()
+        pending = {lib_name: set(self.__graph.nodes[lib_name]) for lib_name in order}
+        result: List[str] = []
+        while pending:
+            lib_name = self.__ready(order, pending)[0]
+            del pending[lib_name]
+            for dependencies in pending.values():
+                dependencies.discard(lib_name)
+            result.append(lib_name)
+        return result
+
+    def __ready(self, order: List[str], pending: Dict[str, set]) -> List[str]:
+        """
+        Return libraries whose dependencies are built, highest priority first
+        """
+        ready = [_ for _ in order if _ in pending and not pending[_]]
+        return sorted(ready, key=lambda _: -self.__priorities.get(_, 0))
+
+    def simulate(self, durations: Dict[str, float]) -> Dict[str, tuple]:
+        """
+        Predict when every library starts and finishes
+
+        Parameters
+        ----------
+        durations: Dict[str, float]
+            Predicted duration of every library
+
+        Returns
+        -------
+        Dict[str, tuple]
+            Start and finish time in seconds, in start order
+        """
+        order = self.__order()
+        pending = {lib_name: set(self.__graph.nodes[lib_name]) for lib_name in order}
+        running: List[tuple] = []  # (finish time, library)
+        result: Dict[str, tuple] = {}
+        now = 0.0
+        while pending or running:
+            ready = self.__ready(order, pending)
+            while ready and len(running) < self.__max_parallel:
+                lib_name = ready.pop(0)
+                del pending[lib_name]
+                finish = now + durations.get(lib_name, 0)
+                running.append((finish, lib_name))
+                result[lib_name] = (now, finish)
+            running.sort()
+            now, lib_name = running.pop(0)
+            for dependencies in pending.values():
+                dependencies.discard(lib_name)
+        return result
+
+    @staticmethod
+    def __fork_context():
+        """
+        Return fork multiprocessing context or None if unsupported
+        """
+        if "fork" not in multiprocessing.get_all_start_methods():
+            return None
+        return multiprocessing.get_context("fork")
+
+    def __run_serial(self) -> None:
+        """
+        Build the libraries one by one in this process
+        """
+        for lib_name in self.__order():
+            self.__build_func(lib_name)
+
+    def run(self) -> None:
+        """
+        Build every library in the graph
+
+        Returns
+        -------
+        None
+        """
+        context = self.__fork_context()
+        if context is None:
+            self.__run_serial()
+            return
+
+        order = self.__order()
+        pending = {
+            lib_name: set(self.__graph.nodes[lib_name]) for lib_name in order
+        }
+        running: Dict[int, tuple] = {}
+        failed: List[str] = []
+        try:
+            while pending or running:
+                ready = self.__ready(order, pending)
+                while ready and not failed and len(running) < self.__max_parallel:
+                    if self.__governor is not None and not self.__governor.can_start(
+                        ready[0], [lib_name for lib_name, _ in running.values()]
+                    ):
+                        # Strict priority order, so large builds don't starve
+                        break
+                    lib_name = ready.pop(0)
+                    del pending[lib_name]
+                    process = context.Process(
+                        target=self.__build_func, args=(lib_name,), name=lib_name
+                    )
+                    process.start()
+                    logger.debug("Started %s (pid %s)", lib_name, process.pid)
+                    running[process.sentinel] = (lib_name, process)
+                if not running:
+                    break
+                timeout = SAMPLE_INTERVAL if self.__governor is not None else None
+                for sentinel in multiprocessing.connection.wait(list(running), timeout):
+                    lib_name, process = running.pop(sentinel)
+                    process.join()
+                    if process.exitcode != 0:
+                        print(f"Failed to build {lib_name}")
+                        failed.append(lib_name)
+                        continue
+                    for dependencies in pending.values():
+                        dependencies.discard(lib_name)
+                if self.__governor is not None:
+                    self.__governor.sample(
+                        {process.pid: lib_name for lib_name, process in running.values()}
+                    )
+        finally:
+            for _, process in running.values():
+                process.terminate()
+                process.join()
+        if failed or pending:
+            sys.exit(1)
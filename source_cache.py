@@ -0,0 +1,319 @@
+"""
+Content-addressed cache of source archives shared by every build
+"""
+from typing import Optional, Set
+import glob
+import hashlib
+import os
+import os.path
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows without MSYS2 python
+    fcntl = None
+
+CHUNK_SIZE = 1024 * 1024
+# Linux ioctl that clones file extents (btrfs, xfs)
+FICLONE = 0x40049409
+# Partial downloads older than the run are left by an earlier one
+RUN_START = time.time()
+# Partial downloads of this process
+_WRITING: Set[str] = set()
+_WRITING_LOCK = threading.Lock()
+
+
+def file_sha256(path: str) -> str:
+    """
+    Return sha256 hex digest of the file
+
+    Parameters
+    ----------
+    path: str
+        File path
+
+    Returns
+    -------
+    str
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_file(src: str, dest: str) -> None:
+    """
+    Place src at dest as a hardlink, a reflink or a copy, in that order
+
+    Parameters
+    ----------
+    src: str
+        Source file
+    dest: str
+        Destination file, replaced atomically
+    """
+    tmp_dest = f"{dest}.tmp{os.getpid()}"
+    if os.path.exists(tmp_dest):
+        os.remove(tmp_dest)
+    try:
+        os.link(src, tmp_dest)
+    except OSError:
+        with open(src, "rb") as src_file, open(tmp_dest, "wb") as dest_file:
+            try:
+                if fcntl is None:
+                    raise OSError
+                fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+            except OSError:
+                shutil.copyfileobj(src_file, dest_file, CHUNK_SIZE)
+    os.replace(tmp_dest, dest)
+
+
+class ChecksumError(Exception):
+    """
+    Raised when downloaded content doesn't match the expected checksum
+    """
+
+
+class HashingWriter:
+    """
+    Write file into a temporary location, hashing it while the content
+    streams in
+    """
+
+    def __init__(self, tmp_dir: str, expected_sha256: Optional[str] = None):
+        self.__expected = expected_sha256.lower() if expected_sha256 else None
+        self.__digest = hashlib.sha256()
+        fd, self.__tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+        self.__file = os.fdopen(fd, "wb")
+        # Held until the file is closed, even a killed process releases it
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        with _WRITING_LOCK:
+            _WRITING.add(self.__tmp_path)
+
+    def write(self, chunk: bytes) -> None:
+        """
+        Append chunk
+
+        Parameters
+        ----------
+        chunk: bytes
+            Downloaded content
+        """
+        self.__digest.update(chunk)
+        self.__file.write(chunk)
+
+    def finish(self) -> tuple:
+        """
+        Close the file and verify its checksum
+
+        Returns
+        -------
+        tuple
+            Temporary file path and its sha256
+
+        Raises
+        ------
+        ChecksumError
+            Raised if the content doesn't match the expected checksum
+        """
+        self.__close()
+        sha256 = self.__digest.hexdigest()
+        if self.__expected is not None and sha256 != self.__expected:
+            os.remove(self.__tmp_path)
+            raise ChecksumError(
+                f"sha256 mismatch: expected {self.__expected}, got {sha256}"
+            )
+        return self.__tmp_path, sha256
+
+    def abort(self) -> None:
+        """
+        Drop partially written file
+        """
+        self.__close()
+        if os.path.exists(self.__tmp_path):
+            os.remove(self.__tmp_path)
+
+    def __close(self) -> None:
+        self.__file.close()
+        with _WRITING_LOCK:
+            _WRITING.discard(self.__tmp_path)
+
+
+def remove_partial_downloads() -> None:
+    """
+    Remove the files of the downloads in progress in this process, for a
+    process being stopped
+    """
+    with _WRITING_LOCK:
+        for path in _WRITING:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        _WRITING.clear()
+
+
+def is_stale(path: str) -> bool:
+    """
+    Check if a partial download was left by an earlier run: written before
+    this run started and not locked by a writer
+
+    Parameters
+    ----------
+    path: str
+        .part file
+
+    Returns
+    -------
+    bool
+    """
+    try:
+        if os.stat(path).st_mtime >= RUN_START:
+            return False
+        if fcntl is None:
+            return True
+        with open(path, "rb") as file:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+class SourceCache:
+    """
+    Source archives stored by sha256, urls without a declared checksum are
+    mapped to the checksum of their last download
+    """
+
+    def __init__(self, cache_dir: str, read_only: bool = False):
+        """
+        Parameters
+        ----------
+        cache_dir: str
+            Cache directory
+        read_only: bool (default False)
+            Only look up archives, nothing is created
+        """
+        self.__root = os.path.join(cache_dir, "sources")
+        if read_only:
+            return
+        for sub_dir in ("sha256", "urls", "tmp"):
+            os.makedirs(os.path.join(self.__root, sub_dir), exist_ok=True)
+        # Left by killed runs
+        for path in glob.glob(os.path.join(self.tmp_dir, "*.part")):
+            if is_stale(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @property
+    def tmp_dir(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Directory of the downloads in progress
+        """
+        return os.path.join(self.__root, "tmp")
+
+    def path(self, sha256: str) -> str:
+        """
+        Parameters
+        ----------
+        sha256: str
+            Content checksum
+
+        Returns
+        -------
+        str
+            Path of the cached file
+        """
+        return os.path.join(self.__root, "sha256", sha256.lower())
+
+    def __url_index(self, url: str) -> str:
+        """
+        Return path of the file holding the checksum of the url
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.__root, "urls", key)
+
+    def lookup(self, url: str, sha256: Optional[str] = None) -> Optional[str]:
+        """
+        Find cached file
+
+        Parameters
+        ----------
+        url: str
+            Download url
+        sha256: Optional[str]
+            Expected checksum
+
+        Returns
+        -------
+        Optional[str]
+            Cached file path or None if not cached
+        """
+        if sha256 is None:
+            try:
+                with open(self.__url_index(url), encoding="utf-8") as file:
+                    sha256 = file.read().strip()
+            except FileNotFoundError:
+                return None
+        path = self.path(sha256)
+        return path if os.path.isfile(path) else None
+
+    def store(self, url: str, tmp_path: str, sha256: str) -> str:
+        """
+        Move verified download into the cache and map the url to it
+
+        Parameters
+        ----------
+        url: str
+            Download url
+        tmp_path: str
+            Downloaded file, must be inside tmp_dir
+        sha256: str
+            Content checksum
+
+        Returns
+        -------
+        str
+            Path of the cached file
+        """
+        path = self.path(sha256)
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, path)
+        index_path = self.__url_index(url)
+        tmp_index_path = f"{index_path}.tmp{os.getpid()}"
+        with open(tmp_index_path, "w", encoding="utf-8") as file:
+            file.write(sha256)
+        os.replace(tmp_index_path, index_path)
+        return path
+
+    @staticmethod
+    def is_same(cached_path: str, path: str) -> bool:
+        """
+        Check if path is a hardlink of the cached file
+
+        Parameters
+        ----------
+        cached_path: str
+            Cached file path
+        path: str
+            File path
+
+        Returns
+        -------
+        bool
+        """
+        try:
+            return os.path.samefile(cached_path, path)
+        except OSError:
+            return False
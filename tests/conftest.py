@@ -0,0 +1,7 @@
+"""
+Make the top-level modules of the builder importable from the tests
+"""
+import os.path
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
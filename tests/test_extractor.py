@@ -0,0 +1,126 @@
+"""
+Archives are unpacked from the downloaded chunks, zip archives on close,
+and members escaping the destination are refused
+"""
+import io
+import os
+import tarfile
+import zipfile
+import pytest
+import extractor
+from extractor import StreamingExtractor
+
+CHUNK_SIZE = 512
+FILES = {
+    "lib-1.0/configure": b"#!/bin/sh\n" * 100,
+    "lib-1.0/src/lib.c": os.urandom(10000),
+}
+
+
+def make_tar(mode, members=None):
+    """
+    Return tarball of the members, FILES by default
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as tar:
+        for name, content in (members or FILES).items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def stream(archive, dest_dir, archive_path):
+    """
+    Write the archive in small chunks and finish the extraction
+    """
+    sink = StreamingExtractor(str(dest_dir), "lib-1.0")
+    for start in range(0, len(archive), CHUNK_SIZE):
+        sink.write(archive[start : start + CHUNK_SIZE])
+    return sink, sink.close(str(archive_path))
+
+
+def extracted(dest_dir):
+    """
+    Return content of every file under the directory
+    """
+    result = {}
+    for root, _, names in os.walk(dest_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as file:
+                result[os.path.relpath(path, dest_dir).replace(os.sep, "/")] = file.read()
+    return result
+
+
+@pytest.mark.parametrize(
+    "mode, xz_version",
+    [("w:gz", None), ("w:xz", (5, 0)), ("w:xz", None)],
+    ids=["gz", "xz-lzma", "xz"],
+)
+def test_tar_streamed(tmp_path, monkeypatch, mode, xz_version):
+    """
+    Tarballs are unpacked from the chunks, the archive file is never read
+    """
+    if xz_version is not None:
+        # Older xz, decompressed by the lzma module
+        monkeypatch.setattr(extractor, "command_version", lambda cmd: xz_version)
+
+    sink, success = stream(make_tar(mode), tmp_path, tmp_path / "missing.tar")
+
+    assert success
+    assert extracted(tmp_path) == FILES
+    assert sink.files == len(FILES)
+    assert sink.size == sum(map(len, FILES.values()))
+
+
+def test_zip_extracted_on_close(tmp_path):
+    """
+    Zip archives are unpacked from the complete file on close
+    """
+    archive_path = tmp_path / "lib-1.0.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        for name, content in FILES.items():
+            archive.writestr(name, content)
+    dest_dir = tmp_path / "src"
+    dest_dir.mkdir()
+
+    sink = StreamingExtractor(str(dest_dir), "lib-1.0")
+    sink.write(archive_path.read_bytes())
+    assert extracted(dest_dir) == {}
+    assert sink.close(str(archive_path))
+
+    assert extracted(dest_dir) == FILES
+    assert sink.files == len(FILES)
+
+
+def test_earlier_extraction_replaced(tmp_path):
+    """
+    The tree of an earlier extraction is replaced, not merged
+    """
+    stale = tmp_path / "lib-1.0" / "stale.c"
+    stale.parent.mkdir()
+    stale.write_bytes(b"")
+
+    _, success = stream(make_tar("w:gz"), tmp_path, tmp_path / "missing.tar")
+
+    assert success
+    assert extracted(tmp_path) == FILES
+
+
+@pytest.mark.skipif(not hasattr(tarfile, "tar_filter"), reason="no tar filter")
+@pytest.mark.parametrize("name", ["../escaped", "lib-1.0/../../escaped"])
+def test_path_traversal_refused(tmp_path, name):
+    """
+    A member outside the destination fails the extraction and leaves no
+    partial tree
+    """
+    dest_dir = tmp_path / "src"
+    dest_dir.mkdir()
+    archive = make_tar("w:gz", {**FILES, name: b"escaped"})
+
+    _, success = stream(archive, dest_dir, tmp_path / "missing.tar")
+
+    assert not success
+    assert os.listdir(dest_dir) == []
+    assert not (tmp_path / "escaped").exists()
@@ -0,0 +1,111 @@
+"""
+Patch engine: atomic multi-edit rewrites, strict matching and records
+"""
+import json
+import os
+import pytest
+import file_utils
+from file_utils import Patch, PatchError
+
+CONTENT = """# build
+CFLAGS = -O2
+TESTS = yes
+# tests start
+run tests
+# tests end
+INSTALL = yes
+"""
+
+
+@pytest.fixture(name="source")
+def fixture_source(tmp_path) -> str:
+    """
+    File to patch, patch records kept in tmp_path
+    """
+    path = tmp_path / "Makefile"
+    path.write_text(CONTENT)
+    file_utils.activate_patch_records(str(tmp_path / "patches.json"))
+    yield str(path)
+    file_utils.activate_patch_records(None)
+
+
+def patch(path: str) -> Patch:
+    """
+    Return patch with edits of every kind
+    """
+    return (
+        Patch(path)
+        .replace("-O2", "-O3")
+        .replace("yes", "no", count=2)
+        .delete_lines("# tests start", "# tests end")
+    )
+
+
+def read(path: str) -> str:
+    """
+    Return file content
+    """
+    with open(path, encoding="utf-8") as file:
+        return file.read()
+
+
+def test_edits_applied_at_once(source):
+    """
+    Every edit lands in one atomic write, no temporary file is left
+    """
+    inode = os.stat(source).st_ino
+    patch(source).apply()
+    assert read(source) == "# build\nCFLAGS = -O3\nTESTS = no\nINSTALL = no\n"
+    assert os.stat(source).st_ino != inode
+    assert sorted(os.listdir(os.path.dirname(source))) == [
+        "Makefile",
+        "patches.json",
+        "patches.json.lock",
+    ]
+
+
+@pytest.mark.parametrize(
+    "edit",
+    [
+        lambda _: _.replace("yes", "no"),
+        lambda _: _.replace("missing", "text", count=None),
+        lambda _: _.delete_lines("# tests end", "# tests start"),
+    ],
+)
+def test_mismatch_leaves_file_untouched(source, edit):
+    """
+    An edit not matching as expected raises before anything is written,
+    even the edits queued before it
+    """
+    with pytest.raises(PatchError):
+        edit(Patch(source).replace("-O2", "-O3")).apply()
+    assert read(source) == CONTENT
+    assert not os.path.exists(os.path.join(os.path.dirname(source), "patches.json"))
+
+
+def test_records_replayed(source):
+    """
+    Applying a recorded patch again to its result is a no-op, a file back
+    to its original content is patched again
+    """
+    digest = patch(source).apply()
+    patched = read(source)
+    with open(file_utils._PATCH_RECORDS, encoding="utf-8") as file:  # pylint: disable=protected-access
+        records = json.load(file)
+    assert records[os.path.abspath(source)]["sha256"] == digest
+    # The edits don't match the patched text anymore, the record says why
+    assert patch(source).apply() == digest
+    assert read(source) == patched
+    with open(source, "w", encoding="utf-8") as file:
+        file.write(CONTENT)
+    assert patch(source).apply() == digest
+    assert read(source) == patched
+
+
+def test_other_patch_not_replayed(source):
+    """
+    A different patch on a patched file has to match the current text
+    """
+    patch(source).apply()
+    with pytest.raises(PatchError):
+        Patch(source).replace("-O2", "-Os").apply()
@@ -0,0 +1,115 @@
+"""
+A library is built again when its inputs or those of a dependency change,
+together with every library depending on it
+"""
+import dataclasses
+import json
+import pytest
+from fingerprint import KEY_OPTIONS
+from library_manager import LibraryManager
+from options import Options
+from scheduler import BuildGraph
+
+LIBRARIES = {
+    "zlib": {"configure_params": ["--static"]},
+    "png": {"configure_params": [], "dependencies": ["zlib"]},
+    "app": {"configure_params": [], "dependencies": ["png"]},
+    "other": {"configure_params": []},
+}
+
+
+@pytest.fixture(name="options")
+def fixture_options(tmp_path, monkeypatch):
+    """
+    Options building every library, from a libraries.json in a temporary
+    directory
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(LibraryManager, "data", {})
+    (tmp_path / "target").mkdir()
+    write_libraries(LIBRARIES)
+    return Options(targets=list(LIBRARIES), cache_dir=str(tmp_path / "cache"))
+
+
+def write_libraries(libraries):
+    """
+    Write libraries.json of the working directory
+    """
+    with open("libraries.json", "w", encoding="utf-8") as file:
+        json.dump(libraries, file)
+
+
+def build(options):
+    """
+    Mark the libraries needing a build as built
+
+    Returns
+    -------
+    set
+        Libraries built
+    """
+    LibraryManager.data.clear()
+    LibraryManager.init(options)
+    graph = BuildGraph(LibraryManager, options).resolve()
+    for lib_name in graph.nodes:
+        LibraryManager.get_library(lib_name).mark_as_built(graph.fingerprints[lib_name])
+    return set(graph.nodes)
+
+
+def test_unchanged_not_rebuilt(options):
+    """
+    Nothing is built again from the same inputs
+    """
+    assert build(options) == set(LIBRARIES)
+    assert build(options) == set()
+
+
+@pytest.mark.parametrize(
+    "lib_name, rebuilt",
+    [
+        ("zlib", {"zlib", "png", "app"}),
+        ("png", {"png", "app"}),
+        ("app", {"app"}),
+    ],
+)
+def test_entry_change_rebuilds_dependents(options, lib_name, rebuilt):
+    """
+    Changing a libraries.json entry changes the fingerprint of the library
+    and of everything depending on it
+    """
+    build(options)
+    libraries = json.loads(json.dumps(LIBRARIES))
+    libraries[lib_name]["configure_params"].append("--enable-changed")
+    write_libraries(libraries)
+
+    assert build(options) == rebuilt
+    assert build(options) == set()
+
+
+def test_dependency_rebuilt_from_other_inputs(options):
+    """
+    A dependency built again from other inputs by another build makes its
+    dependents built again
+    """
+    build(options)
+    libraries = json.loads(json.dumps(LIBRARIES))
+    libraries["zlib"]["configure_params"].append("--enable-changed")
+    write_libraries(libraries)
+    LibraryManager.data.clear()
+    LibraryManager.init(options)
+    graph = BuildGraph(LibraryManager, options)
+    LibraryManager.get_library("zlib").mark_as_built(graph.fingerprint("zlib"))
+
+    assert build(options) == {"png", "app"}
+
+
+@pytest.mark.parametrize("name", KEY_OPTIONS)
+def test_key_option_rebuilds_everything(options, name):
+    """
+    Options changing the installed files rebuild every library
+    """
+    build(options)
+    value = getattr(options, name)
+    changed = not value if isinstance(value, bool) else f"{value}-changed"
+
+    assert build(dataclasses.replace(options, **{name: changed})) == set(LIBRARIES)
@@ -0,0 +1,164 @@
+"""
+Resumed downloads and circuit breaker of the HTTP client against a local
+server dropping connections
+"""
+import http.server
+import os
+import threading
+import pytest
+from http_client import CircuitBreaker, DownloadError, HostUnavailable, HttpClient
+
+CONTENT = os.urandom(3 * 1024 * 1024 + 123)
+ETAG = '"content-v1"'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Serve CONTENT, the server attributes decide how requests fail
+    """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Answer a download or resume request
+        """
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.status:
+            self.send_error(server.status)
+            return
+        start = 0
+        if "Range" in self.headers and self.headers.get("If-Range") == server.etag:
+            start = int(self.headers["Range"][len("bytes=") : -1])
+        body = CONTENT[start:]
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", server.etag)
+        self.end_headers()
+        if server.cuts:
+            # Announces the whole body, sends part of it and hangs up
+            server.cuts -= 1
+            self.wfile.write(body[: len(body) // 3])
+            self.wfile.flush()
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture(name="server")
+def fixture_server():
+    """
+    Local server, answers whole until told otherwise
+    """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests = []
+    server.status = 0
+    server.cuts = 0
+    server.etag = ETAG
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def url(server) -> str:
+    """
+    Return download url of the server
+    """
+    return f"http://127.0.0.1:{server.server_address[1]}/source.tar.gz"
+
+
+def download(client: HttpClient, server) -> bytes:
+    """
+    Download CONTENT, dropping the chunks when the client starts over
+    """
+    chunks = []
+    client.download(url(server), chunks.append, chunks.clear)
+    return b"".join(chunks)
+
+
+def test_resumes_cut_download(server):
+    """
+    A body cut mid-stream continues with a Range request validated by the
+    ETag, and the result is byte-identical
+    """
+    server.cuts = 2
+    assert download(HttpClient(backoff=0), server) == CONTENT
+    assert len(server.requests) == 3
+    assert "Range" not in server.requests[0]
+    for headers in server.requests[1:]:
+        assert headers["Range"].startswith("bytes=")
+        assert headers["Range"] != "bytes=0-"
+        assert headers["If-Range"] == ETAG
+
+
+def test_restarts_when_content_changed(server):
+    """
+    The server ignores the Range when the ETag changed, the partial chunks
+    are dropped and the download starts over
+    """
+    server.cuts = 1
+
+    def change(chunk, chunks):
+        chunks.append(chunk)
+        server.etag = '"content-v2"'
+
+    chunks = []
+    HttpClient(backoff=0).download(
+        url(server), lambda _: change(_, chunks), chunks.clear
+    )
+    assert b"".join(chunks) == CONTENT
+    assert server.requests[1]["If-Range"] == ETAG
+
+
+def test_circuit_breaker_opens(server):
+    """
+    Repeated failures stop the client from contacting the host
+    """
+    server.status = 503
+    breaker = CircuitBreaker(threshold=3, cooldown=3600)
+    client = HttpClient(retries=10, backoff=0, breaker=breaker)
+    with pytest.raises(HostUnavailable):
+        download(client, server)
+    assert len(server.requests) == 3
+    with pytest.raises(HostUnavailable):
+        download(client, server)
+    assert len(server.requests) == 3
+    assert not breaker.allow(f"127.0.0.1:{server.server_address[1]}")
+
+
+def test_gives_up_after_retries(server):
+    """
+    Failures under the breaker threshold end in a DownloadError
+    """
+    server.status = 503
+    client = HttpClient(retries=2, backoff=0, breaker=CircuitBreaker(threshold=10))
+    with pytest.raises(DownloadError) as error:
+        download(client, server)
+    assert not isinstance(error.value, HostUnavailable)
+    assert len(server.requests) == 3
+
+
+def test_write_failure_is_local(server):
+    """
+    A sink failing (full disk) ends the download without retrying and
+    without counting against the host
+    """
+    breaker = CircuitBreaker(threshold=1, cooldown=3600)
+    client = HttpClient(retries=10, backoff=0, breaker=breaker)
+
+    def full_disk(_):
+        raise OSError(28, "No space left on device")
+
+    with pytest.raises(DownloadError) as error:
+        client.download(url(server), full_disk, lambda: None)
+    assert not isinstance(error.value, HostUnavailable)
+    assert len(server.requests) == 1
+    assert breaker.allow(f"127.0.0.1:{server.server_address[1]}")
+    assert download(client, server) == CONTENT
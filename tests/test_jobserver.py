@@ -0,0 +1,136 @@
+"""
+Jobs of make and ninja sharing a jobserver never exceed its slots
+"""
+import os.path
+import shutil
+import sys
+import threading
+import pytest
+import build_utils
+import jobserver
+from jobserver import Jobserver
+
+SLOTS = 2
+JOBS = 8
+# Counts the running jobs in a file and records the highest count
+JOB = """
+import fcntl, sys, time
+def update(delta):
+    with open(sys.argv[1], "a+") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        file.seek(0)
+        running, highest = map(int, (file.read() or "0 0").split())
+        running += delta
+        file.seek(0)
+        file.truncate()
+        file.write(f"{running} {max(running, highest)}")
+update(1)
+time.sleep(0.3)
+update(-1)
+"""
+
+pytestmark = pytest.mark.skipif(
+    not Jobserver.is_supported(), reason="no named pipes"
+)
+
+
+@pytest.fixture(name="server")
+def fixture_server():
+    """
+    Active jobserver with SLOTS slots
+    """
+    server = Jobserver(SLOTS)
+    jobserver.activate(server)
+    yield server
+    jobserver.activate(None)
+    server.close()
+
+
+def highest(counter: str) -> int:
+    """
+    Return highest number of jobs that ran at once
+    """
+    with open(counter, encoding="utf-8") as file:
+        return int(file.read().split()[1])
+
+
+def write_project(project_dir, counter: str) -> None:
+    """
+    Write Makefile and build.ninja running JOBS independent jobs
+    """
+    project_dir.mkdir()
+    (project_dir / "job.py").write_text(JOB)
+    command = f"{sys.executable} job.py {counter}"
+    targets = " ".join(f"t{_}" for _ in range(JOBS))
+    rules = "".join(f"t{_}:\n\t{command}\n" for _ in range(JOBS))
+    (project_dir / "Makefile").write_text(
+        f".PHONY: all {targets}\nall: {targets}\n{rules}"
+    )
+    builds = "".join(f"build t{_}: job\n" for _ in range(JOBS))
+    (project_dir / "build.ninja").write_text(
+        f"rule job\n  command = {command}\n{builds}"
+    )
+
+
+@pytest.mark.skipif(shutil.which("make") is None, reason="no make")
+def test_make(server, tmp_path, monkeypatch):
+    """
+    Make joins the jobserver
+    """
+    counter = str(tmp_path / "counter")
+    write_project(tmp_path / "project", counter)
+    monkeypatch.chdir(tmp_path / "project")
+    build_utils.make(server.slots, silent=True)
+    assert highest(counter) == SLOTS
+
+
+@pytest.mark.skipif(shutil.which("ninja") is None, reason="no ninja")
+def test_ninja(server, tmp_path, monkeypatch):
+    """
+    Ninja joins the jobserver or takes its share of the slots
+    """
+    counter = str(tmp_path / "counter")
+    write_project(tmp_path / "project", counter)
+    monkeypatch.chdir(tmp_path / "project")
+    build_utils.ninja(server.slots, silent=True)
+    assert highest(counter) <= SLOTS
+
+
+@pytest.mark.skipif(shutil.which("make") is None, reason="no make")
+def test_parallel_builds(server, tmp_path, monkeypatch):
+    """
+    Builds running at the same time share the slots
+    """
+    counter = str(tmp_path / "counter")
+    for name in ("first", "second"):
+        write_project(tmp_path / name, counter)
+    # run_fg runs in the working directory, make changes to the project
+    monkeypatch.chdir(tmp_path)
+    threads = [
+        threading.Thread(
+            target=build_utils.make,
+            args=(server.slots, "-C", os.path.join(tmp_path, name)),
+            kwargs={"silent": True},
+        )
+        for name in ("first", "second")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert highest(counter) == SLOTS
+
+
+@pytest.mark.parametrize(
+    "version, expected",
+    [
+        ((4, 4), " -j2 --jobserver-auth=fifo:"),
+        ((4, 3), " -j2 --jobserver-auth="),
+        ((3, 81), " -j --jobserver-fds="),
+    ],
+)
+def test_makeflags(server, version, expected):
+    """
+    The jobserver is passed as the make version understands it
+    """
+    assert server.makeflags(version).startswith(expected)
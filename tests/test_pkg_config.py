@@ -0,0 +1,148 @@
+"""
+Memoized answers of the pkg-config shim and its fixups
+"""
+import json
+import os
+import os.path
+import shutil
+import subprocess
+import pytest
+from pkg_config import PkgConfig, fix_pc, install_shim, shim_env
+
+X265_PC = """prefix={prefix}
+exec_prefix=${{prefix}}
+libdir=${{exec_prefix}}/lib
+includedir=${{prefix}}/include
+
+Name: x265
+Description: H.265/HEVC video encoder
+Version: 3.5
+Libs: -L${{libdir}} -lx265
+Libs.private: -lgcc_s -lm -lrt -ldl -lpthread
+Cflags: -I${{includedir}}
+"""
+OPUS_PC = """prefix={prefix}
+libdir=${{prefix}}/lib
+includedir=${{prefix}}/include
+
+Name: Opus
+Description: Opus IETF audio codec
+Version: 1.4
+Requires.private: x265
+Libs: -L${{libdir}} -lopus
+Cflags: -I${{includedir}}/opus
+"""
+FIXUPS = {"x265": {"libs": ["-lstdc++"], "drop": ["-lgcc_s"]}}
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("pkg-config") is None, reason="no system pkg-config"
+)
+
+
+@pytest.fixture(name="prefix")
+def fixture_prefix(tmp_path) -> str:
+    """
+    Release prefix with .pc files and the shim installed in tmp_path/shim
+    """
+    prefix = tmp_path / "release"
+    libdir = prefix / "lib" / "pkgconfig"
+    libdir.mkdir(parents=True)
+    (libdir / "x265.pc").write_text(X265_PC.format(prefix=prefix))
+    (libdir / "opus.pc").write_text(OPUS_PC.format(prefix=prefix))
+    install_shim(str(tmp_path / "shim"), FIXUPS, str(libdir))
+    return str(prefix)
+
+
+def run(shim_dir: str, libdir: str, *args, **env):
+    """
+    Return stdout and exit code of the shim
+    """
+    process = subprocess.run(
+        [os.path.join(shim_dir, "bin", "pkg-config"), *args],
+        env={**os.environ, **shim_env(libdir), **env},
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=False,
+    )
+    return process.stdout.split(), process.returncode
+
+
+def answers(shim_dir: str) -> dict:
+    """
+    Return memoized answers of the index
+    """
+    with open(os.path.join(shim_dir, "index.json"), encoding="utf-8") as file:
+        return json.load(file)["answers"]
+
+
+def test_fixups_applied(prefix, tmp_path):
+    """
+    Fixups reach the flags of the modules requiring the fixed one, the
+    installed .pc file is left alone
+    """
+    shim_dir = str(tmp_path / "shim")
+    libdir = os.path.join(prefix, "lib", "pkgconfig")
+    flags, code = run(shim_dir, libdir, "--static", "--libs", "opus")
+    assert code == 0
+    assert "-lgcc_s" not in flags
+    assert flags.index("-lopus") < flags.index("-lx265") < flags.index("-lstdc++")
+    with open(os.path.join(libdir, "x265.pc"), encoding="utf-8") as file:
+        assert "-lgcc_s" in file.read()
+
+
+def test_memoized_until_changed(prefix, tmp_path):
+    """
+    Answers are kept per command line until a .pc file changes
+    """
+    shim_dir = str(tmp_path / "shim")
+    libdir = os.path.join(prefix, "lib", "pkgconfig")
+    assert run(shim_dir, libdir, "--modversion", "x265") == (["3.5"], 0)
+    assert run(shim_dir, libdir, "--exists", "missing")[1] != 0
+    assert len(answers(shim_dir)) == 2
+    with open(os.path.join(libdir, "x265.pc"), "a", encoding="utf-8") as file:
+        file.write("URL: https://x265.org\n")
+    with open(os.path.join(libdir, "x265.pc"), encoding="utf-8") as file:
+        text = file.read()
+    with open(os.path.join(libdir, "x265.pc"), "w", encoding="utf-8") as file:
+        file.write(text.replace("Version: 3.5", "Version: 3.6"))
+    assert run(shim_dir, libdir, "--modversion", "x265") == (["3.6"], 0)
+    assert len(answers(shim_dir)) == 1
+
+
+def test_other_environment_not_memoized(prefix, tmp_path):
+    """
+    Queries with other search paths go to the system pkg-config as is
+    """
+    shim_dir = str(tmp_path / "shim")
+    libdir = os.path.join(prefix, "lib", "pkgconfig")
+    flags, _ = run(shim_dir, libdir, "--static", "--libs", "x265", PKG_CONFIG_PATH=libdir)
+    assert "-lgcc_s" in flags
+    assert not os.path.exists(os.path.join(shim_dir, "index.json"))
+
+
+def test_saved_answers_merge(prefix, tmp_path):
+    """
+    Queries answered by parallel builds all end up in the index
+    """
+    shim_dir = str(tmp_path / "shim")
+    libdir = os.path.join(prefix, "lib", "pkgconfig")
+    env = shim_env(libdir)
+    first = PkgConfig(shutil.which("pkg-config"), [libdir], shim_dir)
+    second = PkgConfig(shutil.which("pkg-config"), [libdir], shim_dir)
+    first.query(["--cflags", "opus"], env)
+    second.query(["--libs", "x265"], env)
+    first.save()
+    second.save()
+    assert len(answers(shim_dir)) == 2
+
+
+def test_fix_pc():
+    """
+    Missing fields are added, dropped flags removed from every field
+    """
+    text = fix_pc(
+        "Libs: -lx -lgcc_s\nLibs.private: -lgcc_s\nCflags: -I${pcfiledir}/inc\n",
+        {"libs_private": ["-lm"], "drop": ["-lgcc_s"], "cflags": ["-DX"]},
+        "/pc",
+    )
+    assert text == "Libs: -lx\nLibs.private: -lm\nCflags: -I/pc/inc -DX\n"
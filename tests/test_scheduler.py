@@ -0,0 +1,154 @@
+"""
+Scheduler builds every library after its dependencies, in parallel when
+they are independent, and stops the dependents of a failed build
+"""
+import json
+import os.path
+import sys
+import time
+from types import SimpleNamespace
+import pytest
+import scheduler
+from scheduler import BuildGraph, Scheduler
+
+# Seconds every fake build takes
+DURATION = 0.3
+
+
+class FakeLibrary:
+    """
+    Library never built before
+    """
+
+    def __init__(self, name, dependencies):
+        self.name = name
+        self.dependencies = dependencies
+        self.is_build_tool = False
+
+    def pre_dependency(self):
+        """
+        No dependency hook
+        """
+
+    def is_already_build(self, fingerprint=None):  # pylint: disable=unused-argument
+        """
+        Never built
+        """
+        return False
+
+    def is_needed(self, fingerprint):  # pylint: disable=unused-argument
+        """
+        Every target is needed
+        """
+        return True
+
+
+class FakeManager:
+    """
+    Libraries of a graph given as dependencies per library
+    """
+
+    def __init__(self, nodes):
+        self.__libraries = {
+            name: FakeLibrary(name, dependencies) for name, dependencies in nodes.items()
+        }
+
+    def get_library(self, name):
+        """
+        Return library or None if unknown
+        """
+        return self.__libraries.get(name)
+
+
+@pytest.fixture(name="make_graph")
+def fixture_make_graph(monkeypatch):
+    """
+    Return function resolving the graph of some targets
+    """
+    monkeypatch.setattr(
+        scheduler,
+        "fingerprint",
+        lambda library_obj, options, dependencies: library_obj.name
+        + json.dumps(dependencies, sort_keys=True),
+    )
+
+    def make_graph(nodes, targets):
+        options = SimpleNamespace(targets=targets)
+        return BuildGraph(FakeManager(nodes), options).resolve()
+
+    return make_graph
+
+
+@pytest.fixture(name="build")
+def fixture_build(tmp_path):
+    """
+    Return build function recording when every library started and
+    finished, the libraries named in its failing attribute fail
+    """
+
+    def build(lib_name):
+        started = time.monotonic()
+        time.sleep(DURATION)
+        if lib_name in build.failing:
+            sys.exit(1)
+        with open(tmp_path / lib_name, "w", encoding="utf-8") as file:
+            json.dump([started, time.monotonic()], file)
+
+    build.failing = set()
+    return build
+
+
+def built(tmp_path, lib_name):
+    """
+    Return start and finish time of a successful build, None if not built
+    """
+    path = tmp_path / lib_name
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def test_dependencies_built_first(make_graph, build, tmp_path):
+    """
+    Every library starts after its dependencies finished
+    """
+    nodes = {"app": ["codec", "zlib"], "codec": ["zlib"], "zlib": []}
+    Scheduler(make_graph(nodes, ["app"]), build, max_parallel=3).run()
+
+    for lib_name, dependencies in nodes.items():
+        for dependency in dependencies:
+            assert built(tmp_path, dependency)[1] <= built(tmp_path, lib_name)[0]
+
+
+def test_independent_libraries_concurrent(make_graph, build, tmp_path):
+    """
+    Libraries not depending on each other are built at the same time
+    """
+    nodes = {"app": ["left", "right"], "left": [], "right": []}
+    Scheduler(make_graph(nodes, ["app"]), build, max_parallel=2).run()
+
+    left = built(tmp_path, "left")
+    right = built(tmp_path, "right")
+    assert left[0] < right[1] and right[0] < left[1]
+
+
+def test_failure_stops_dependents(make_graph, build, tmp_path):
+    """
+    A failed build exits with an error, its dependents are never started
+    while the libraries not depending on it are still built
+    """
+    nodes = {
+        "app": ["codec", "other"],
+        "codec": ["zlib"],
+        "zlib": [],
+        "other": [],
+    }
+    build.failing = {"zlib"}
+    with pytest.raises(SystemExit) as exit_info:
+        Scheduler(make_graph(nodes, ["app"]), build, max_parallel=2).run()
+
+    assert exit_info.value.code == 1
+    assert built(tmp_path, "other") is not None
+    assert built(tmp_path, "codec") is None
+    assert built(tmp_path, "app") is None
@@ -0,0 +1,264 @@
+"""
+Timing and resource usage of every build phase, exported as a Chrome trace
+"""
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+import json
+import os
+import platform
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows without MSYS2 python
+    resource = None
+
+# Summary columns and the phases they add up
+SUMMARY_COLUMNS = (
+    ("Download", ("download",)),
+    ("Extract", ("extract",)),
+    ("Configure", ("configure",)),
+    ("Compile", ("compile", "custom_configure")),
+    ("Install", ("install",)),
+    ("Train", ("train",)),
+    ("Hooks", ("pre_configure", "post_configure", "post_install")),
+)
+
+_ACTIVE: Optional["Tracer"] = None
+# Phases entered by the current thread, innermost last
+_PHASES = threading.local()
+
+
+def usage() -> Dict[str, float]:
+    """
+    Return CPU time of this process and its finished children, and the peak
+    RSS of the largest of them
+
+    Returns
+    -------
+    Dict[str, float]
+        Empty if the resource module is unavailable
+    """
+    if resource is None:
+        return {}
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # Kilobytes on Linux, bytes on macOS
+    rss_unit = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    return {
+        "cpu_user": self_usage.ru_utime + children_usage.ru_utime,
+        "cpu_sys": self_usage.ru_stime + children_usage.ru_stime,
+        "peak_rss_mb": max(self_usage.ru_maxrss, children_usage.ru_maxrss)
+        / rss_unit,
+    }
+
+
+class Tracer:
+    """
+    Collect phase events from the builder and its build processes
+
+    Every process appends its events to the same file, one JSON line per
+    event written with a single O_APPEND write.
+    """
+
+    def __init__(self, events_path: str):
+        self.__events_path = events_path
+        self.__pid = os.getpid()
+        self.track = "builder"
+        with open(events_path, "w", encoding="utf-8"):
+            pass
+
+    @contextmanager
+    def phase(self, name: str, **args) -> Iterator[dict]:
+        """
+        Record duration and resource usage of the block
+
+        Parameters
+        ----------
+        name: str
+            Phase name
+        **args
+            Extra data shown in the trace
+
+        Yields
+        ------
+        dict
+            Extra data, the block may add to it
+        """
+        start_usage = usage()
+        start = time.time()
+        try:
+            yield args
+        finally:
+            end = time.time()
+            end_usage = usage()
+            for key in ("cpu_user", "cpu_sys"):
+                if key in end_usage:
+                    args[key] = round(end_usage[key] - start_usage[key], 3)
+            if "peak_rss_mb" in end_usage:
+                args["peak_rss_mb"] = round(end_usage["peak_rss_mb"], 1)
+            self.__write(
+                {
+                    "name": name,
+                    "cat": self.track,
+                    "ph": "X",
+                    "ts": int(start * 1e6),
+                    "dur": int((end - start) * 1e6),
+                    "pid": self.__pid,
+                    "tid": threading.get_native_id(),
+                    "args": args,
+                }
+            )
+
+    def __write(self, event: dict) -> None:
+        """
+        Append event to the events file
+        """
+        line = (json.dumps(event) + "\n").encode("utf-8")
+        fd = os.open(self.__events_path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def events(self) -> List[dict]:
+        """
+        Return recorded events
+
+        Returns
+        -------
+        List[dict]
+        """
+        with open(self.__events_path, encoding="utf-8") as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    def export(self, path: str) -> None:
+        """
+        Write trace loadable in chrome://tracing or Perfetto
+
+        Parameters
+        ----------
+        path: str
+            Trace file
+        """
+        events = self.events()
+        threads = {}
+        for event in events:
+            threads[event["tid"]] = event["cat"]
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self.__pid,
+                "tid": tid,
+                "args": {"name": track},
+            }
+            for tid, track in threads.items()
+        ]
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": metadata + events}, file)
+
+    def summary(self) -> List[str]:
+        """
+        Return table of the time spent per library and phase, slowest first
+
+        Returns
+        -------
+        List[str]
+        """
+        durations: Dict[str, Dict[str, float]] = {}
+        build_args: Dict[str, dict] = {}
+        for event in self.events():
+            if event["cat"] in ("builder", "prefetch"):
+                continue
+            phases = durations.setdefault(event["cat"], {})
+            phases[event["name"]] = phases.get(event["name"], 0) + event["dur"] / 1e6
+            if event["name"] == "build":
+                build_args[event["cat"]] = event["args"]
+        header = ["Library", "Total"] + [title for title, _ in SUMMARY_COLUMNS] + [
+            "CPU",
+            "Peak RSS",
+        ]
+        rows = []
+        for lib_name, phases in sorted(
+            durations.items(), key=lambda item: -item[1].get("build", 0)
+        ):
+            args = build_args.get(lib_name, {})
+            cpu = args.get("cpu_user", 0) + args.get("cpu_sys", 0)
+            rows.append(
+                [lib_name, f"{phases.get('build', 0):.1f}s"]
+                + [
+                    f"{sum(phases.get(_, 0) for _ in column_phases):.1f}s"
+                    for _, column_phases in SUMMARY_COLUMNS
+                ]
+                + [f"{cpu:.1f}s", f"{args.get('peak_rss_mb', 0):.0f}M"]
+            )
+        widths = [max(len(str(_)) for _ in column) for column in zip(header, *rows)]
+        return [
+            "  ".join(cell.ljust(width) for cell, width in zip(line, widths))
+            for line in [header] + rows
+        ]
+
+
+def activate(tracer: Optional[Tracer]) -> None:
+    """
+    Set tracer used by the build phases
+
+    Parameters
+    ----------
+    tracer: Optional[Tracer]
+        Tracer or None to disable it
+    """
+    global _ACTIVE  # pylint: disable=global-statement
+    _ACTIVE = tracer
+
+
+def active() -> Optional[Tracer]:
+    """
+    Returns
+    -------
+    Optional[Tracer]
+        Tracer used by the build phases
+    """
+    return _ACTIVE
+
+
+@contextmanager
+def phase(name: str, **args) -> Iterator[dict]:
+    """
+    Record the block with the active tracer, if any
+
+    Parameters
+    ----------
+    name: str
+        Phase name
+    **args
+        Extra data shown in the trace
+
+    Yields
+    ------
+    dict
+        Extra data, the block may add to it
+    """
+    stack = _PHASES.__dict__.setdefault("stack", [])
+    stack.append(name)
+    try:
+        if _ACTIVE is None:
+            yield args
+            return
+        with _ACTIVE.phase(name, **args) as phase_args:
+            yield phase_args
+    finally:
+        stack.pop()
+
+
+def current_phase() -> Optional[str]:
+    """
+    Returns
+    -------
+    Optional[str]
+        Innermost phase of the current thread, None outside of phases
+    """
+    stack = _PHASES.__dict__.get("stack")
+    return stack[-1] if stack else None
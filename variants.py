@@ -0,0 +1,205 @@
+"""
+Builds of ffmpeg for several -march targets sharing the libraries whose code
+doesn't depend on it, and the launcher running the best one for the CPU
+"""
+from typing import Dict, List, Set, Tuple
+import os
+import os.path
+import shlex
+import sys
+import plumbum
+from file_utils import write_atomic
+
+# Predefined macro of an instruction set extension and its name in the
+# flags (x86) or Features (arm) of /proc/cpuinfo
+CPU_FLAGS = {
+    "__SSE3__": "pni",
+    "__SSSE3__": "ssse3",
+    "__SSE4_1__": "sse4_1",
+    "__SSE4_2__": "sse4_2",
+    "__POPCNT__": "popcnt",
+    "__LAHF_SAHF__": "lahf_lm",
+    "__GCC_HAVE_SYNC_COMPARE_AND_SWAP_16": "cx16",
+    "__AVX__": "avx",
+    "__AVX2__": "avx2",
+    "__BMI__": "bmi1",
+    "__BMI2__": "bmi2",
+    "__F16C__": "f16c",
+    "__FMA__": "fma",
+    "__LZCNT__": "abm",
+    "__MOVBE__": "movbe",
+    "__XSAVE__": "xsave",
+    "__AES__": "aes",
+    "__PCLMUL__": "pclmulqdq",
+    "__SHA__": "sha_ni",
+    "__ADX__": "adx",
+    "__AVXVNNI__": "avx_vnni",
+    "__GFNI__": "gfni",
+    "__VAES__": "vaes",
+    "__VPCLMULQDQ__": "vpclmulqdq",
+    "__AVX512F__": "avx512f",
+    "__AVX512BW__": "avx512bw",
+    "__AVX512CD__": "avx512cd",
+    "__AVX512DQ__": "avx512dq",
+    "__AVX512VL__": "avx512vl",
+    "__AVX512IFMA__": "avx512ifma",
+    "__AVX512VBMI__": "avx512vbmi",
+    "__AVX512VBMI2__": "avx512_vbmi2",
+    "__AVX512VNNI__": "avx512_vnni",
+    "__AVX512BITALG__": "avx512_bitalg",
+    "__AVX512VPOPCNTDQ__": "avx512_vpopcntdq",
+    "__AVX512BF16__": "avx512_bf16",
+    "__ARM_FEATURE_ATOMICS": "atomics",
+    "__ARM_FEATURE_CRC32": "crc32",
+    "__ARM_FEATURE_DOTPROD": "asimddp",
+    "__ARM_FEATURE_FP16_VECTOR_ARITHMETIC": "asimdhp",
+    "__ARM_FEATURE_MATMUL_INT8": "i8mm",
+    "__ARM_FEATURE_SVE": "sve",
+    "__ARM_FEATURE_SVE2": "sve2",
+}
+# Forces a variant in the launcher
+VARIANT_ENV = "FFMPEG_VARIANT"
+
+
+def variant_dir(root: str, march: str) -> str:
+    """
+    Return directory of a variant under the release or target directory
+
+    Parameters
+    ----------
+    root: str
+        Directory of the shared libraries
+    march: str
+        -march of the variant
+
+    Returns
+    -------
+    str
+    """
+    return os.path.join(root, "variants", march)
+
+
+def cpu_flags(compiler: str, march: str) -> List[str]:
+    """
+    Return /proc/cpuinfo flags a CPU needs to run code compiled for march,
+    exit if the compiler doesn't know it
+
+    Parameters
+    ----------
+    compiler: str
+        C compiler
+    march: str
+        -march value
+
+    Returns
+    -------
+    List[str]
+        Only the extensions listed in CPU_FLAGS
+    """
+    try:
+        macros = plumbum.local[compiler](
+            f"-march={march}", "-dM", "-E", "-x", "c", os.devnull
+        )
+    except (plumbum.commands.CommandNotFound, plumbum.commands.ProcessExecutionError):
+        print(f"{compiler} can't compile for -march={march}")
+        sys.exit(1)
+    defined = {line.split()[1] for line in macros.splitlines() if line.count(" ") >= 2}
+    return sorted({flag for macro, flag in CPU_FLAGS.items() if macro in defined})
+
+
+def march_libraries(library_mgr, targets: List[str]) -> Set[str]:
+    """
+    Return libraries of the build compiled once per variant, the ones marked
+    in libraries.json and the ones depending on them
+
+    Parameters
+    ----------
+    library_mgr: LibraryManager
+        Libraries
+    targets: List[str]
+        Targets of the build
+
+    Returns
+    -------
+    Set[str]
+    """
+    result: Dict[str, bool] = {}
+
+    def visit(lib_name: str) -> bool:
+        if lib_name not in result:
+            library_obj = library_mgr.get_library(lib_name)
+            if library_obj is None:
+                # Reported when the graph is resolved
+                return False
+            result[lib_name] = False
+            library_obj.pre_dependency()
+            dependent = [visit(_) for _ in library_obj.dependencies]
+            result[lib_name] = not library_obj.is_build_tool and (
+                library_obj.march or any(dependent)
+            )
+        return result[lib_name]
+
+    for lib_name in targets:
+        visit(lib_name)
+    return {lib_name for lib_name, dependent in result.items() if dependent}
+
+
+def write_launcher(
+    release_dir: str, program: str, variants: List[Tuple[str, List[str]]]
+) -> None:
+    """
+    Write shell script in place of a program of the variants, running the
+    program of the first variant the CPU supports
+
+    The flags come from /proc/cpuinfo, without it the variant needing the
+    fewest extensions runs. FFMPEG_VARIANT forces a variant.
+
+    Parameters
+    ----------
+    release_dir: str
+        Release directory of the shared libraries
+    program: str
+        Path of the program relative to the prefixes, e.g. bin/ffmpeg
+    variants: List[Tuple[str, List[str]]]
+        -march and CPU flags of every variant
+    """
+    path = os.path.join(release_dir, program)
+    name = os.path.basename(program)
+    # Relative to the launcher, the release dir can be moved
+    variants_dir = os.path.relpath(
+        os.path.join(release_dir, "variants"), os.path.dirname(path)
+    )
+    # Most demanding first, the first one the CPU runs wins
+    variants = sorted(variants, key=lambda _: -len(_[1]))
+    names = " ".join(march for march, _ in variants)
+    lines = [
+        "#!/bin/sh",
+        f"# Runs {name} built for the best -march the CPU supports: {names}",
+        'flags=" $(grep -m1 -E "^(flags|Features)" /proc/cpuinfo 2>/dev/null'
+        ' | cut -d: -f2) "',
+        "has() {",
+        "    for flag in \"$@\"; do",
+        '        case "$flags" in *" $flag "*) ;; *) return 1 ;; esac',
+        "    done",
+        "}",
+        f'variant="${{{VARIANT_ENV}-}}"',
+        'if [ -z "$variant" ]; then',
+        '    if [ "$flags" = "  " ]; then',
+        f"        variant={shlex.quote(variants[-1][0])}",
+    ]
+    for march, flags in variants:
+        lines += [
+            f"    elif has {' '.join(flags)}; then",
+            f"        variant={shlex.quote(march)}",
+        ]
+    lines += [
+        "    else",
+        f'        echo "{name}: the CPU runs none of the builds ({names}),'
+        f' set {VARIANT_ENV} to force one" >&2',
+        "        exit 1",
+        "    fi",
+        "fi",
+        f'exec "$(dirname "$0")/{variants_dir}/$variant/{program}" "$@"',
+    ]
+    write_atomic(path, "\n".join(lines) + "\n")
+    os.chmod(path, 0o755)